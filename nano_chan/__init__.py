@@ -1 +1,6 @@
-from .src.nano_chan import NanoChan
+def __getattr__(name:str):
+    # NanoChan loads audio and llama_cpp modules, submodules such as the HTTP LLM client don't need them
+    if name == "NanoChan":
+        from .src.nano_chan import NanoChan
+        return NanoChan
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
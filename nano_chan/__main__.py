@@ -1,4 +1,14 @@
+import logging
+import os
+
 from nano_chan import NanoChan
 if __name__ == "__main__":
+    # LOG_LEVEL=DEBUG uv run -m nano_chan shows per-module statistics
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)-8s [%(name)s] %(message)s"))
+    logger = logging.getLogger("nano_chan.src")
+    logger.addHandler(handler)
+    logger.setLevel(os.getenv("LOG_LEVEL", "WARNING").upper())
+
     nano_chan = NanoChan()
-    nano_chan.start()
\ No newline at end of file
+    nano_chan.start()
@@ -1,19 +1,18 @@
 import asyncio
-import importlib
-import importlib.metadata
-import importlib.util
 import json
 import os
-import platform
 import re
 import time
-from collections.abc import AsyncGenerator
+from collections.abc import AsyncGenerator, Iterator
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import onnxruntime as rt
 from numpy.typing import NDArray
 
+from ..ort_utils import create_session, profiler, tuned_session_options
 from .config import MAX_PHONEME_LENGTH, SAMPLE_RATE, EspeakConfig, KoKoroConfig
+from .engine import KokoroEngine
 from .log import log
 from .tokenizer import Tokenizer
 from .trim import trim as trim_audio
@@ -26,6 +25,13 @@ class Kokoro:
         voices_path: str,
         espeak_config: EspeakConfig | None = None,
         vocab_config: dict | str | None = None,
+        mmap_weights: bool = False,
+        sess_options: rt.SessionOptions | None = None,
+        providers: list[str] | None = None,
+        phonemize_workers: int = 0,
+        lexicon_dir: str | None = None,
+        warmup_lengths: list[int] | None = None,
+        batch_workers: int = 3,
     ):
         # Show useful information for bug reports
         # log.debug(
@@ -35,24 +41,32 @@ class Kokoro:
         self.config.validate()
 
         # See list of providers https://github.com/microsoft/onnxruntime/issues/22101#issuecomment-2357667377
-        providers = ["CUDAExecutionProvider"]
-
-        # Check if kokoro-onnx installed with kokoro-onnx[gpu] feature (Windows/Linux)
-        gpu_enabled = importlib.util.find_spec("onnxruntime-gpu")
-        if gpu_enabled:
-            providers: list[str] = rt.get_available_providers()
-
         # Check if ONNX_PROVIDER environment variable was set
         env_provider = os.getenv("ONNX_PROVIDER")
-        if env_provider:
+        if env_provider and providers is None:
             providers = [env_provider]
 
+        # Use options saved by the autotune command, CUDA if available otherwise
+        sess_options, providers = tuned_session_options(
+            f"kokoro:{os.path.basename(model_path)}", sess_options, providers
+        )
+
         log.debug(f"Providers: {providers}")
-        self.sess = rt.InferenceSession(model_path, providers=providers)
+        # mmap_weights shares read-only weight pages between processes (CPU provider only)
+        self.sess = create_session(
+            model_path, sess_options, providers=providers, mmap_weights=mmap_weights
+        )
+        self.engine = KokoroEngine(self.sess)
+        self.batch_workers = batch_workers
+        self._batch_pool: ThreadPoolExecutor | None = None
         self.voices: np.ndarray = np.load(voices_path)
 
         vocab = self._load_vocab(vocab_config)
-        self.tokenizer = Tokenizer(espeak_config, vocab=vocab)
+        self.tokenizer = Tokenizer(
+            espeak_config, vocab=vocab, workers=phonemize_workers, lexicon_dir=lexicon_dir
+        )
+        if warmup_lengths:
+            self.warmup(warmup_lengths)
 
     @classmethod
     def from_session(
@@ -64,6 +78,9 @@ class Kokoro:
     ):
         instance = cls.__new__(cls)
         instance.sess = session
+        instance.engine = KokoroEngine(session)
+        instance.batch_workers = 3
+        instance._batch_pool = None
         instance.config = KoKoroConfig(session._model_path, voices_path, espeak_config)
         instance.config.validate()
         instance.voices = np.load(voices_path)
@@ -105,23 +122,7 @@ class Kokoro:
             f"Context length is {MAX_PHONEME_LENGTH}, but leave room for the pad token 0 at the start & end"
         )
 
-        voice = voice[len(tokens)]
-        tokens = [[0, *tokens, 0]]
-        if "input_ids" in [i.name for i in self.sess.get_inputs()]:
-            # Newer export versions
-            inputs = {
-                "input_ids": tokens,
-                "style": np.array(voice, dtype=np.float32),
-                "speed": np.array([speed], dtype=np.int32),
-            }
-        else:
-            inputs = {
-                "tokens": tokens,
-                "style": voice,
-                "speed": np.ones(1, dtype=np.float32) * speed,
-            }
-
-        audio = self.sess.run(None, inputs)[0]
+        audio = self.engine.run(tokens, voice[len(tokens)], speed)
         audio_duration = len(audio) / SAMPLE_RATE
         create_duration = time.time() - start_t
         rtf = create_duration / audio_duration
@@ -130,6 +131,64 @@ class Kokoro:
         )
         return audio, SAMPLE_RATE
 
+    def _create_audio_padded(
+        self, batches: list[str], voice: NDArray[np.float32], speed: float
+    ) -> list[NDArray[np.float32]]:
+        if not batches:
+            return []
+        tokens = [self.tokenizer.tokenize(p[:MAX_PHONEME_LENGTH]) for p in batches]
+        styles = np.concatenate([voice[len(t)] for t in tokens])
+        audio, durations = self.engine.run_padded(tokens, styles, speed)
+        # the longest item isn't padded, its frames span the whole output
+        longest = max(range(len(tokens)), key=lambda i: len(tokens[i]))
+        samples_per_frame = audio.shape[1] / durations[longest].sum()
+        return [
+            audio[i, : round(durations[i, : len(t) + 2].sum() * samples_per_frame)]
+            for i, t in enumerate(tokens)
+        ]
+
+    def _create_audio_batch(
+        self, batches: list[str], voice: NDArray[np.float32], speed: float
+    ) -> Iterator[NDArray[np.float32]]:
+        """
+        Synthesize several phoneme batches at once, in one padded run if the model allows it,
+        otherwise in concurrent runs of the one session on batch_workers threads (runs of an
+        ORT session are thread-safe, a second session would load the weights again).
+        Audio is yielded in order, each batch as soon as it and the ones before it are done.
+        """
+        if len(batches) == 1:
+            yield self._create_audio(batches[0], voice, speed)[0]
+            return
+        if self.engine.batched:
+            with profiler.tag("Kokoro padded batch"):
+                yield from self._create_audio_padded(batches, voice, speed)
+            return
+
+        def create(i: int) -> NDArray[np.float32]:
+            with profiler.tag("Kokoro batch", i):
+                return self._create_audio(batches[i], voice, speed)[0]
+
+        if self._batch_pool is None:
+            # long-lived threads keep their engine buffers and IO binding
+            self._batch_pool = ThreadPoolExecutor(self.batch_workers, thread_name_prefix="kokoro")
+        futures = [self._batch_pool.submit(create, i) for i in range(len(batches))]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel() # stopped early, batches not started yet are dropped
+
+    def warmup(self, lengths: list[int], voice: str | None = None):
+        """
+        Synthesize each token length once at startup, e.g. [16, 64, 160, 509].
+        """
+        voice = self.get_voice_style(voice or self.get_voices()[0])
+        tokens = np.array(self.tokenizer.tokenize("həlˈoʊ ðˈɛɹ, "), dtype=np.int64)
+        start_t = time.time()
+        self.engine.warmup(tokens, voice, lengths)
+        log.debug(f"Warmed up {lengths} tokens in {time.time() - start_t:.2f}s")
+
     def get_voice_style(self, name: str) -> NDArray[np.float32]:
         return self.voices[name]
 
@@ -167,7 +226,24 @@ class Kokoro:
 
         return batched_phoenemes
 
-    def create(
+    def _split_first(self, batches: list[str], max_length: int) -> list[str]:
+        """
+        Split a short head off the first batch so that its audio is ready early.
+        Prefer a punctuation mark, otherwise the last space within max_length.
+        """
+        first = batches[0]
+        if len(first) <= max_length:
+            return batches
+        head = first[:max_length]
+        cut = max(head.rfind(p) for p in ".,!?;:") + 1
+        if cut < max_length // 3:
+            # a very short head sounds unnatural, split at a word instead
+            cut = head.rfind(" ")
+        if cut <= 0:
+            return batches
+        return [first[:cut].strip(), first[cut:].strip(), *batches[1:]]
+
+    def create_chunks(
         self,
         text: str,
         voice: str | NDArray[np.float32],
@@ -175,9 +251,12 @@ class Kokoro:
         lang: str = "en-us",
         is_phonemes: bool = False,
         trim: bool = True,
-    ) -> tuple[NDArray[np.float32], int]:
+        first_max_length: int | None = None,
+    ) -> Iterator[tuple[NDArray[np.float32], int]]:
         """
-        Create audio from text using the specified voice and speed.
+        Create audio batch by batch, yielding each chunk as soon as it is synthesized.
+        Stop iterating to cancel, the remaining batches are not synthesized.
+        first_max_length (phonemes) splits a short first chunk to start playback early.
         """
         assert speed >= 0.5 and speed <= 2.0, "Speed should be between 0.5 and 2.0"
 
@@ -185,25 +264,80 @@ class Kokoro:
             assert voice in self.voices, f"Voice {voice} not found in available voices"
             voice = self.get_voice_style(voice)
 
-        start_t = time.time()
         if is_phonemes:
             phonemes = text
         else:
             phonemes = self.tokenizer.phonemize(text, lang)
         # Create batches of phonemes by splitting spaces to MAX_PHONEME_LENGTH
         batched_phoenemes = self._split_phonemes(phonemes)
+        if first_max_length and batched_phoenemes:
+            batched_phoenemes = self._split_first(batched_phoenemes, first_max_length)
 
-        audio = []
         log.debug(
             f"Creating audio for {len(batched_phoenemes)} batches for {len(phonemes)} phonemes"
         )
-        for phonemes in batched_phoenemes:
-            audio_part, _ = self._create_audio(phonemes, voice, speed)
+        for i, phonemes in enumerate(batched_phoenemes):
+            with profiler.tag("Kokoro batch", i):
+                audio_part, _ = self._create_audio(phonemes, voice, speed)
             if trim:
                 # Trim leading and trailing silence for a more natural sound concatenation
                 # (initial ~2s, subsequent ~0.02s)
                 audio_part, _ = trim_audio(audio_part)
-            audio.append(audio_part)
+            yield audio_part, SAMPLE_RATE
+
+    def create_batch(
+        self,
+        texts: list[str],
+        voice: str | NDArray[np.float32],
+        speed: float = 1.0,
+        lang: str = "en-us",
+        is_phonemes: bool = False,
+        trim: bool = True,
+    ) -> Iterator[NDArray[np.float32]]:
+        """
+        Create audio of several texts at once, e.g. sentences queued behind the one playing.
+        Yields the audio of each text at SAMPLE_RATE in order, as soon as it is done.
+        Stop iterating to cancel, batches not started yet are not synthesized.
+        """
+        assert speed >= 0.5 and speed <= 2.0, "Speed should be between 0.5 and 2.0"
+
+        if isinstance(voice, str):
+            assert voice in self.voices, f"Voice {voice} not found in available voices"
+            voice = self.get_voice_style(voice)
+
+        batches = [
+            self._split_phonemes(text if is_phonemes else self.tokenizer.phonemize(text, lang))
+            for text in texts
+        ]
+        audio = self._create_audio_batch([p for b in batches for p in b], voice, speed)
+        try:
+            for b in batches:
+                parts = [next(audio) for _ in b]
+                if trim:
+                    parts = [trim_audio(part)[0] for part in parts]
+                yield np.concatenate(parts) if parts else np.zeros(0, np.float32)
+        finally:
+            audio.close()
+
+    def create(
+        self,
+        text: str,
+        voice: str | NDArray[np.float32],
+        speed: float = 1.0,
+        lang: str = "en-us",
+        is_phonemes: bool = False,
+        trim: bool = True,
+    ) -> tuple[NDArray[np.float32], int]:
+        """
+        Create audio from text using the specified voice and speed.
+        """
+        start_t = time.time()
+        audio = [
+            audio_part
+            for audio_part, _ in self.create_chunks(
+                text, voice, speed, lang, is_phonemes=is_phonemes, trim=trim
+            )
+        ]
         audio = np.concatenate(audio)
         log.debug(f"Created audio in {time.time() - start_t:.2f}s")
         return audio, SAMPLE_RATE
@@ -0,0 +1,99 @@
+import threading
+
+import numpy as np
+import onnxruntime as rt
+from numpy.typing import NDArray
+
+from ..ort_utils import ProfiledSession
+from .config import MAX_PHONEME_LENGTH
+
+# numpy types of ONNX input types
+DTYPES = {"tensor(float)": np.float32, "tensor(int32)": np.int32, "tensor(int64)": np.int64}
+
+
+class KokoroEngine:
+    """
+    Runs a Kokoro session through IO binding with preallocated input buffers.
+
+    The model signature is read once: names of the token, style and speed inputs, the
+    dtype of speed (int32 in some exports) and whether the token input has a batch axis.
+    Each thread running the session (see Kokoro.create_batch) has its own buffers and
+    binding. A binding belongs to one InferenceSession, so it is made again when
+    ProfiledSession recreates its session to switch profiling.
+    """
+
+    def __init__(self, sess: rt.InferenceSession | ProfiledSession, style_dim: int = 256):
+        self.sess = sess
+        self.style_dim = style_dim
+        tokens, style, speed = sess.get_inputs()
+        self.tokens_name, self.style_name, self.speed_name = tokens.name, style.name, speed.name
+        self.speed_dtype = DTYPES[speed.type]
+        outputs = sess.get_outputs()
+        self.output_names = [o.name for o in outputs]
+        # padded token sequences of a batch can be split by the per-token durations output
+        self.batched = (
+            not isinstance(tokens.shape[0], int)
+            and len(outputs) > 1
+            and len(outputs[0].shape) == 2
+        )
+        self._local = threading.local()
+
+    def _inner(self) -> rt.InferenceSession:
+        return self.sess.session if isinstance(self.sess, ProfiledSession) else self.sess
+
+    def _state(self) -> threading.local:
+        state = self._local
+        inner = self._inner()
+        if getattr(state, "session", None) is not inner:
+            if not hasattr(state, "tokens"):
+                # pad token 0 at the start, tokens and the pad token at the end are written per run
+                state.tokens = np.zeros((1, MAX_PHONEME_LENGTH + 2), dtype=np.int64)
+                state.style = np.zeros((1, self.style_dim), dtype=np.float32)
+                state.speed = np.ones(1, dtype=self.speed_dtype)
+            state.binding = inner.io_binding()
+            state.session = inner
+        return state
+
+    def run(self, tokens: NDArray[np.int64], style: NDArray[np.float32], speed: float) -> NDArray[np.float32]:
+        """Audio of tokens without the pad tokens, style is voice[len(tokens)]."""
+        state = self._state()
+        n = len(tokens) + 2
+        state.tokens[0, 1 : n - 1] = tokens
+        state.tokens[0, n - 1] = 0
+        state.style[:] = style
+        state.speed[0] = speed
+        binding = state.binding
+        binding.bind_cpu_input(self.tokens_name, state.tokens[:, :n])
+        binding.bind_cpu_input(self.style_name, state.style)
+        binding.bind_cpu_input(self.speed_name, state.speed)
+        # audio length varies, ORT allocates the output of each run
+        binding.bind_output(self.output_names[0])
+        self.sess.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0]
+
+    def run_padded(
+        self, tokens: list[list[int]], styles: NDArray[np.float32], speed: float
+    ) -> tuple[NDArray[np.float32], NDArray[np.int64]]:
+        """Audio and durations of a batch of token sequences padded to the longest one."""
+        if not tokens:
+            return np.zeros((0, 0), dtype=np.float32), np.zeros((0, 0), dtype=np.int64)
+        ids = np.zeros((len(tokens), max(map(len, tokens)) + 2), dtype=np.int64)
+        for i, t in enumerate(tokens):
+            ids[i, 1 : len(t) + 1] = t
+        inputs = {
+            self.tokens_name: ids,
+            self.style_name: styles.astype(np.float32, copy=False),
+            self.speed_name: np.full(len(tokens), speed, dtype=self.speed_dtype),
+        }
+        audio, durations = self.sess.run(self.output_names[:2], inputs)
+        return audio, durations
+
+    def warmup(self, tokens: NDArray[np.int64], style: NDArray[np.float32], lengths: list[int]) -> None:
+        """
+        Run token lengths expected in use once, so that the first sentence of each size
+        doesn't pay for kernel selection and growth of the memory arena.
+        tokens are repeated to each length, at most the longest style of the voice.
+        """
+        for n in lengths:
+            n = min(n, MAX_PHONEME_LENGTH, len(style) - 1)
+            self.run(np.resize(tokens, n), style[n], 1.0)
@@ -0,0 +1,239 @@
+"""
+Word phoneme lexicon in front of espeak.
+
+espeak phonemizes the clauses between punctuation marks independently, so a clause whose
+words all have a context-free pronunciation can be assembled from a lexicon with output
+identical to espeak. Within a clause espeak does depend on context: it demotes the stress
+of a word before another stressed word, merges function words ("on the" -> "ɔnðə") and
+picks heteronyms by their neighbours. A word is therefore only stored with phonemes after
+it was phonemized the same way in every carrier phrase below, otherwise it is stored as
+context-dependent and clauses containing it go to espeak.
+
+The lexicon is a sorted file of "word\\tphonemes" entries with an offset table, memory
+mapped and searched by bisection, plus an LRU of words looked up or learned since it was written.
+"""
+
+import mmap
+import os
+import re
+import struct
+from array import array
+from collections import OrderedDict
+from itertools import accumulate
+from threading import Lock
+
+MAGIC = b"KLX1"
+
+# the word's phonemes must be the same at the start, middle and end of a clause,
+# next to stressed and unstressed words
+CARRIERS = [("{w}", 0), ("{w} now", 0), ("{w} it", 0), ("now {w}", 1), ("it {w}", 1), ("the {w} is", 1)]
+
+# pronounced by their part of speech, never served from the lexicon
+HETERONYMS = {
+    "bass", "bow", "close", "conduct", "content", "contract", "convert", "desert", "does", "dove",
+    "estimate", "excuse", "graduate", "house", "increase", "invalid", "lead", "live", "minute",
+    "moderate", "object", "perfect", "permit", "polish", "present", "produce", "progress", "project",
+    "read", "record", "refuse", "row", "separate", "sow", "subject", "tear", "use", "wind", "wound",
+}
+
+# a token is a word with an optional apostrophe and a trailing punctuation mark,
+# texts with other tokens (numbers, symbols, quotes, acronyms) go to espeak as they are
+TOKEN = re.compile(r"([A-Za-z]+(?:'[A-Za-z]+)?)([.,!?;:]?)")
+
+
+def split_clauses(text: str) -> list[list[tuple[str, str]]] | None:
+    """
+    Split text into clauses of (word, punctuation) at punctuation marks,
+    None if the text has tokens the lexicon doesn't handle.
+    """
+    clauses: list[list[tuple[str, str]]] = []
+    clause: list[tuple[str, str]] = []
+    for token in text.split(" "):
+        match = TOKEN.fullmatch(token)
+        if match is None:
+            return None
+        word, punct = match.groups()
+        if len(word) > 1 and not word[1:].islower():
+            return None  # acronyms are spelled
+        clause.append((word, punct))
+        if punct:
+            clauses.append(clause)
+            clause = []
+    if clause:
+        clauses.append(clause)
+    return clauses
+
+
+def normalize_word(word: str) -> str:
+    """Lowercase a capitalized word, "I" keeps its case."""
+    return word if len(word) == 1 else word.lower()
+
+
+class PhonemeLexicon:
+    def __init__(self, path: str | None = None, max_new: int = 10000):
+        """
+        path: lexicon file, created on save if missing
+        max_new: words learned since the file was written, least recently used are dropped
+        """
+        self.path = path
+        self.max_new = max_new
+        self._lock = Lock()
+        self._new: OrderedDict[str, str] = OrderedDict()
+        self._hits: dict[str, str | None] = {}  # words looked up in the file
+        self._pending: set[str] = set()  # words being checked by espeak
+        self._mm: mmap.mmap | None = None
+        self._offsets: memoryview | list[int] = [0]
+        self._data = 0
+        self.served = 0  # clauses assembled from the lexicon
+        self.clauses = 0
+        if path and os.path.exists(path):
+            self._open(path)
+
+    def _open(self, path: str):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:4] != MAGIC:
+            raise ValueError(f"{path} is not a phoneme lexicon")
+        (count,) = struct.unpack_from("<I", self._mm, 4)
+        self._data = 8 + 4 * (count + 1)
+        self._offsets = memoryview(self._mm)[8 : self._data].cast("I")
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1 + len(self._new)
+
+    def _release(self):
+        """Drop views of the file so that it can be closed."""
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._offsets = [0]
+        self._hits.clear()
+
+    def _entry(self, i: int) -> tuple[bytes, bytes]:
+        start, end = self._offsets[i], self._offsets[i + 1]
+        key, _, value = self._mm[self._data + start : self._data + end].partition(b"\t")
+        return key, value
+
+    def _lookup(self, word: str) -> str | None:
+        key = word.encode("utf-8")
+        lo, hi = 0, len(self._offsets) - 1
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, value = self._entry(mid)
+            if k == key:
+                return value.decode("utf-8")
+            if k < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return None
+
+    def get(self, word: str) -> str | None:
+        """Phonemes of a word, "" if context-dependent, None if unknown."""
+        with self._lock:
+            if word in self._new:
+                self._new.move_to_end(word)
+                return self._new[word]
+            if word not in self._hits:
+                if len(self._hits) >= self.max_new:
+                    self._hits.clear()
+                self._hits[word] = self._lookup(word)
+            return self._hits[word]
+
+    def learn(self, word: str, phonemes: str):
+        """Add a word, phonemes "" marks it context-dependent."""
+        with self._lock:
+            self._pending.discard(word)
+            self._new[word] = phonemes
+            self._new.move_to_end(word)
+            while len(self._new) > self.max_new:
+                self._new.popitem(last=False)
+
+    def assemble(self, clause: list[tuple[str, str]]) -> str | None:
+        """Phonemes of a clause as espeak outputs them, None if a word needs espeak."""
+        words = []
+        for word, _ in clause:
+            phonemes = self.get(normalize_word(word))
+            if not phonemes:
+                return None
+            words.append(phonemes)
+        return " ".join(words) + clause[-1][1]
+
+    def unknown(self, clauses: list[list[tuple[str, str]]]) -> list[str]:
+        """Words to check with espeak, each returned once until learned."""
+        words = []
+        for clause in clauses:
+            for word, _ in clause:
+                key = normalize_word(word)
+                if key.lower() in HETERONYMS:
+                    if self.get(key) is None:
+                        self.learn(key, "")
+                    continue
+                with self._lock:
+                    if key in self._pending:
+                        continue
+                if self.get(key) is None:
+                    with self._lock:
+                        self._pending.add(key)
+                    words.append(word)
+        return words
+
+    def save(self, path: str | None = None):
+        """Write entries of the file and learned words to a new file, then map it."""
+        path = path or self.path
+        if path is None or not self._new:
+            return
+        with self._lock:
+            entries = {}
+            for i in range(len(self._offsets) - 1):
+                key, value = self._entry(i)
+                entries[key] = value
+            for word, phonemes in self._new.items():
+                entries[word.encode("utf-8")] = phonemes.encode("utf-8")
+            write_lexicon(path, entries)
+            self._new.clear()
+            self._release()
+            if self._mm is not None:
+                self._mm.close()
+            self._open(path)
+
+    def format_stats(self) -> str:
+        if not self.clauses:
+            return f"{len(self)} words"
+        return f"{self.served}/{self.clauses} clauses from {len(self)} words"
+
+
+def write_lexicon(path: str, entries: dict[bytes, bytes]):
+    """Sorted entries with an offset table, replaced atomically."""
+    blobs = [key + b"\t" + entries[key] for key in sorted(entries)]
+    offsets = array("I", accumulate((len(b) for b in blobs), initial=0))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(blobs)))
+        f.write(offsets.tobytes())
+        f.write(b"".join(blobs))
+    os.replace(tmp, path)
+
+
+def carrier_lines(words: list[str]) -> list[str]:
+    return [c.format(w=w) for w in words for c, _ in CARRIERS]
+
+
+def word_forms(words: list[str], outputs: list[str]) -> dict[str, str]:
+    """
+    Phonemes of each word from espeak outputs of carrier_lines,
+    "" if they differ between carriers (context-dependent).
+    """
+    forms = {}
+    for i, word in enumerate(words):
+        seen = set()
+        for (carrier, position), output in zip(
+            CARRIERS, outputs[i * len(CARRIERS) : (i + 1) * len(CARRIERS)]
+        ):
+            phonemes = output.split()
+            if len(phonemes) != len(carrier.split()):
+                seen.add("")  # merged with a neighbour
+                break
+            seen.add(phonemes[position])
+        forms[normalize_word(word)] = seen.pop() if len(seen) == 1 else ""
+    return forms
@@ -1,19 +1,72 @@
 import ctypes
+import multiprocessing
 import os
 import platform
 import sys
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 
 import espeakng_loader
-import phonemizer
+from phonemizer.backend import EspeakBackend
 from phonemizer.backend.espeak.wrapper import EspeakWrapper
 
 from .config import DEFAULT_VOCAB, MAX_PHONEME_LENGTH, EspeakConfig
+from .lexicon import PhonemeLexicon, carrier_lines, split_clauses, word_forms
 from .log import log
 
+# espeak is not thread-safe, backends are only used by the thread or worker process owning them
+_backends: dict[str, EspeakBackend] = {}
+_espeak_thread: ThreadPoolExecutor | None = None
+
+
+def _espeak_phonemize(lines: list[str], lang: str) -> list[str]:
+    """
+    Phonemize with a long-lived backend per language, initialized on first use.
+    """
+    backend = _backends.get(lang)
+    if backend is None:
+        backend = _backends[lang] = EspeakBackend(
+            lang, preserve_punctuation=True, with_stress=True
+        )
+    return backend.phonemize(lines)
+
+
+def _init_worker(lib_path: str, data_path: str):
+    EspeakWrapper.set_data_path(data_path)
+    EspeakWrapper.set_library(lib_path)
+
+
+class _VocabFilter(dict):
+    """
+    Translation table keeping characters of the vocab, others are deleted.
+    """
+
+    def __init__(self, vocab: dict):
+        super().__init__({ord(c): c for c in vocab})
+
+    def __missing__(self, key: int) -> None:
+        self[key] = None
+        return None
+
 
 class Tokenizer:
-    def __init__(self, espeak_config: EspeakConfig | None = None, vocab: dict = None):
+    def __init__(
+        self,
+        espeak_config: EspeakConfig | None = None,
+        vocab: dict = None,
+        workers: int = 0,
+        lexicon_dir: str | None = None,
+    ):
+        """
+        workers: processes running espeak, 0 runs it on one thread of this process.
+        lexicon_dir: directory of word phoneme lexicons per language (e.g. en-us.lex),
+            clauses of known words skip espeak and new words are learned.
+        """
         self.vocab = vocab or DEFAULT_VOCAB
+        self._vocab_filter = _VocabFilter(self.vocab)
+        self.workers = workers
+        self._executor: Executor | None = None
+        self.lexicon_dir = lexicon_dir
+        self.lexicons: dict[str, PhonemeLexicon] = {}
 
         if not espeak_config:
             espeak_config = EspeakConfig()
@@ -52,6 +105,7 @@ class Tokenizer:
 
         EspeakWrapper.set_data_path(espeak_config.data_path)
         EspeakWrapper.set_library(espeak_config.lib_path)
+        self.espeak_config = espeak_config
 
     @staticmethod
     def normalize_text(text) -> str:
@@ -64,15 +118,85 @@ class Tokenizer:
             )
         return [i for i in map(self.vocab.get, phonemes) if i is not None]
 
-    def phonemize(self, text, lang="en-us", norm=True) -> str:
+    def _get_executor(self) -> Executor:
+        global _espeak_thread
+        if self._executor is None:
+            if self.workers > 0:
+                # spawn, the parent runs threads of ONNX Runtime and llama.cpp
+                self._executor = ProcessPoolExecutor(
+                    self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(self.espeak_config.lib_path, self.espeak_config.data_path),
+                )
+            else:
+                if _espeak_thread is None:
+                    _espeak_thread = ThreadPoolExecutor(1, thread_name_prefix="espeak")
+                self._executor = _espeak_thread
+        return self._executor
+
+    def _lexicon(self, lang: str) -> PhonemeLexicon | None:
+        if self.lexicon_dir is None:
+            return None
+        if lang not in self.lexicons:
+            self.lexicons[lang] = PhonemeLexicon(os.path.join(self.lexicon_dir, f"{lang}.lex"))
+        return self.lexicons[lang]
+
+    def phonemize_async(self, text, lang="en-us", norm=True) -> Future[str]:
         """
-        lang can be 'en-us' or 'en-gb'
+        Start phonemizing text, e.g. the next sentence while the current one is synthesized.
         """
         if norm:
             text = Tokenizer.normalize_text(text)
+        lexicon = self._lexicon(lang)
+        clauses = split_clauses(text) if lexicon is not None else None
+        result: Future[str] = Future()
+        if clauses is not None:
+            # espeak phonemizes clauses independently, so known clauses join to its output
+            parts = [lexicon.assemble(clause) for clause in clauses]
+            lexicon.clauses += len(clauses)
+            if all(parts):
+                lexicon.served += len(clauses)
+                result.set_result(" ".join(parts).translate(self._vocab_filter).strip())
+                return result
+            # a call costs about the same for a clause as for the sentence, it is sent whole
+            self._learn(lexicon, lexicon.unknown(clauses), lang)
 
-        phonemes = phonemizer.phonemize(
-            text, lang, preserve_punctuation=True, with_stress=True
-        )
-        phonemes = "".join(filter(lambda p: p in self.vocab, phonemes))
-        return phonemes.strip()
+        future = self._get_executor().submit(_espeak_phonemize, [text], lang)
+
+        def done(f: Future):
+            if f.exception() is not None:
+                result.set_exception(f.exception())
+            else:
+                result.set_result(f.result()[0].translate(self._vocab_filter).strip())
+
+        future.add_done_callback(done)
+        return result
+
+    def _learn(self, lexicon: PhonemeLexicon, words: list[str], lang: str):
+        """Check new words in carrier phrases with espeak in background."""
+        if not words:
+            return
+        future = self._get_executor().submit(_espeak_phonemize, carrier_lines(words), lang)
+
+        def learn(f: Future):
+            if f.exception() is not None:
+                log.warning(f"Failed to learn phonemes of {words}: {f.exception()}")
+                return
+            for word, phonemes in word_forms(words, f.result()).items():
+                lexicon.learn(word, phonemes)
+
+        future.add_done_callback(learn)
+
+    def phonemize(self, text, lang="en-us", norm=True) -> str:
+        """
+        lang can be 'en-us' or 'en-gb'
+        """
+        return self.phonemize_async(text, lang, norm).result()
+
+    def close(self):
+        for lexicon in self.lexicons.values():
+            lexicon.save()
+        if self._executor is not None and self._executor is not _espeak_thread:
+            self._executor.shutdown()
+        self._executor = None
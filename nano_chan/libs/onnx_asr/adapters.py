@@ -11,7 +11,7 @@ import numpy.typing as npt
 
 from .asr import Asr, TimestampedResult
 from .preprocessors import Resampler
-from .utils import SampleRates, read_wav_files
+from .utils import PcmArray, SampleRates, read_wav_files
 from .vad import SegmentResult, TimestampedSegmentResult, Vad
 
 R = TypeVar("R")
@@ -40,7 +40,7 @@ class AsrAdapter(ABC, Generic[R]):
     @overload
     def recognize(
         self,
-        waveform: str | npt.NDArray[np.float32],
+        waveform: str | PcmArray,
         *,
         sample_rate: SampleRates = 16_000,
         language: str | None = None,
@@ -49,7 +49,7 @@ class AsrAdapter(ABC, Generic[R]):
     @overload
     def recognize(
         self,
-        waveform: list[str | npt.NDArray[np.float32]],
+        waveform: list[str | PcmArray],
         *,
         sample_rate: SampleRates = 16_000,
         language: str | None = None,
@@ -57,7 +57,7 @@ class AsrAdapter(ABC, Generic[R]):
 
     def recognize(
         self,
-        waveform: str | npt.NDArray[np.float32] | list[str | npt.NDArray[np.float32]],
+        waveform: str | PcmArray | list[str | PcmArray],
         *,
         sample_rate: SampleRates = 16_000,
         language: str | None = None,
@@ -66,7 +66,8 @@ class AsrAdapter(ABC, Generic[R]):
 
         Args:
             waveform: Path to wav file (only PCM_U8, PCM_16, PCM_24 and PCM_32 formats are supported)
-                      or Numpy array with PCM waveform.
+                      or Numpy array with PCM waveform (float32 in [-1, 1] or uint8 / int16 / int32 PCM,
+                      integer PCM is scaled by the full range of its type without intermediate copies).
                       A list of file paths or numpy arrays for batch recognition are also supported.
             sample_rate: Sample rate for Numpy arrays in waveform.
             language: Speech language (only for Whisper models).
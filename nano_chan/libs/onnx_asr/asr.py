@@ -11,6 +11,7 @@ from typing import Generic, TypedDict, TypeVar
 import numpy as np
 import numpy.typing as npt
 
+from ..ort_utils import profiler
 from .preprocessors import Preprocessor
 from .utils import OnnxSessionOptions
 
@@ -95,7 +96,10 @@ class _AsrWithDecoding(Asr):
     def recognize_batch(
         self, waveforms: npt.NDArray[np.float32], waveforms_len: npt.NDArray[np.int64], language: str | None
     ) -> Iterator[TimestampedResult]:
-        encoder_out, encoder_out_lens = self._encode(*self._preprocessor(waveforms, waveforms_len))
+        with profiler.tag("preprocessor"):
+            features, features_lens = self._preprocessor(waveforms, waveforms_len)
+        with profiler.tag("encoder"):
+            encoder_out, encoder_out_lens = self._encode(features, features_lens)
         return (
             self._decode_tokens(tokens, (self.window_size * self._subsampling_factor * np.array(timestamps)).tolist())
             for tokens, timestamps in self._decoding(encoder_out, encoder_out_lens)
@@ -141,7 +145,8 @@ class _AsrWithTransducerDecoding(_AsrWithDecoding, Generic[S]):
             t = 0
             emitted_tokens = 0
             while t < encodings_len:
-                probs, step, state = self._decode(tokens, prev_state, encodings[t])
+                with profiler.tag("transducer decode step", t):
+                    probs, step, state = self._decode(tokens, prev_state, encodings[t])
                 assert probs.shape[-1] <= self._vocab_size
 
                 token = probs.argmax()
@@ -7,6 +7,7 @@ from typing import Any, Literal, get_args
 
 import onnxruntime as rt
 
+from ..ort_utils.tuning import tuned_session_options
 from .utils import OnnxSessionOptions
 
 from .adapters import TextResultsAsrAdapter
@@ -148,6 +149,7 @@ def load_model(
     providers: Sequence[str | tuple[str, dict[Any, Any]]] | None = None,
     provider_options: Sequence[dict[Any, Any]] | None = None,
     cpu_preprocessing: bool = True,
+    mmap_weights: bool = False,
 ) -> TextResultsAsrAdapter:
     """Load ASR model.
 
@@ -166,12 +168,15 @@ def load_model(
         sess_options: Optional SessionOptions for onnxruntime.
         providers: Optional providers for onnxruntime.
         provider_options: Optional provider_options for onnxruntime.
+                   Options saved by the autotune command are used when sess_options or providers are not given.
         cpu_preprocessing: Run preprocessors in CPU.
+        mmap_weights: Load weights from memory mapped files shared between processes (CPU provider only).
 
     Returns:
         ASR model class.
 
     """
+    sess_options, providers = tuned_session_options(f"{model}:{quantization or 'fp32'}", sess_options, providers)
     repo_id: str | None = None
     if "/" in model and path is None and not model.startswith("alphacep/"):
         repo_id = model
@@ -229,9 +234,10 @@ def load_model(
 
     onnx_options: OnnxSessionOptions = {
         "sess_options": sess_options,
-        "providers": ["CUDAExecutionProvider"],#providers or rt.get_available_providers(),
+        "providers": providers,
         "provider_options": provider_options,
         "cpu_preprocessing": cpu_preprocessing,
+        "mmap_weights": mmap_weights,
     }
 
     return TextResultsAsrAdapter(
@@ -248,6 +254,7 @@ def load_vad(
     sess_options: rt.SessionOptions | None = None,
     providers: Sequence[str | tuple[str, dict[Any, Any]]] | None = None,
     provider_options: Sequence[dict[Any, Any]] | None = None,
+    mmap_weights: bool = False,
 ) -> Vad:
     """Load VAD model.
 
@@ -258,11 +265,14 @@ def load_vad(
         sess_options: Optional SessionOptions for onnxruntime.
         providers: Optional providers for onnxruntime.
         provider_options: Optional provider_options for onnxruntime.
+                   Options saved by the autotune command are used when sess_options or providers are not given.
+        mmap_weights: Load weights from memory mapped files shared between processes (CPU provider only).
 
     Returns:
         VAD model class.
 
     """
+    sess_options, providers = tuned_session_options(f"{model}:{quantization or 'fp32'}", sess_options, providers)
     model_type: type[SileroVad | PyAnnoteVad]
     match model:
         case "silero":
@@ -276,8 +286,9 @@ def load_vad(
 
     onnx_options: OnnxSessionOptions = {
         "sess_options": sess_options,
-        "providers": providers or rt.get_available_providers(),
+        "providers": providers,
         "provider_options": provider_options,
+        "mmap_weights": mmap_weights,
     }
 
     return model_type(_find_files(path, repo_id, model_type._get_model_files(quantization)), onnx_options)
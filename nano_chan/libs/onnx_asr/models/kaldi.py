@@ -4,8 +4,8 @@ from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
-import onnxruntime as rt
 
+from ...ort_utils import create_session
 from ..asr import _AsrWithTransducerDecoding
 from ..utils import OnnxSessionOptions, is_float32_array, is_int64_array
 
@@ -26,9 +26,9 @@ class KaldiTransducer(_AsrWithTransducerDecoding[_STATE_TYPE]):
 
         """
         super().__init__(model_files, onnx_options)
-        self._encoder = rt.InferenceSession(model_files["encoder"], **onnx_options)
-        self._decoder = rt.InferenceSession(model_files["decoder"], **onnx_options)
-        self._joiner = rt.InferenceSession(model_files["joiner"], **onnx_options)
+        self._encoder = create_session(model_files["encoder"], **onnx_options)
+        self._decoder = create_session(model_files["decoder"], **onnx_options)
+        self._joiner = create_session(model_files["joiner"], **onnx_options)
 
     @staticmethod
     def _get_model_files(quantization: str | None = None) -> dict[str, str]:
@@ -4,8 +4,8 @@ from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
-import onnxruntime as rt
 
+from ...ort_utils import create_session
 from ..asr import _AsrWithCtcDecoding, _AsrWithDecoding, _AsrWithTransducerDecoding
 from ..utils import OnnxSessionOptions, is_float32_array, is_int64_array
 
@@ -36,7 +36,7 @@ class NemoConformerCtc(_AsrWithCtcDecoding, _NemoConformer):
 
         """
         super().__init__(model_files, onnx_options)
-        self._model = rt.InferenceSession(model_files["model"], **onnx_options)
+        self._model = create_session(model_files["model"], **onnx_options)
 
     @staticmethod
     def _get_model_files(quantization: str | None = None) -> dict[str, str]:
@@ -66,8 +66,8 @@ class NemoConformerRnnt(_AsrWithTransducerDecoding[_STATE_TYPE], _NemoConformer)
 
         """
         super().__init__(model_files, onnx_options)
-        self._encoder = rt.InferenceSession(model_files["encoder"], **onnx_options)
-        self._decoder_joint = rt.InferenceSession(model_files["decoder_joint"], **onnx_options)
+        self._encoder = create_session(model_files["encoder"], **onnx_options)
+        self._decoder_joint = create_session(model_files["decoder_joint"], **onnx_options)
 
     @staticmethod
     def _get_model_files(quantization: str | None = None) -> dict[str, str]:
@@ -4,8 +4,8 @@ from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
-import onnxruntime as rt
 
+from ...ort_utils import create_session
 from ..utils import OnnxSessionOptions, is_float32_array
 from ..vad import Vad
 
@@ -21,7 +21,7 @@ class PyAnnoteVad(Vad):
             onnx_options: Options for onnxruntime InferenceSession.
 
         """
-        self._model = rt.InferenceSession(model_files["model"], **onnx_options)
+        self._model = create_session(model_files["model"], **onnx_options)
 
     @staticmethod
     def _get_model_files(quantization: str | None = None) -> dict[str, str]:
@@ -6,8 +6,8 @@ from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
-import onnxruntime as rt
 
+from ...ort_utils import create_session, profiler
 from ..utils import OnnxSessionOptions, is_float32_array
 from ..vad import Vad
 
@@ -27,7 +27,7 @@ class SileroVad(Vad):
             onnx_options: Options for onnxruntime InferenceSession.
 
         """
-        self._model = rt.InferenceSession(model_files["model"], **onnx_options)
+        self._model = create_session(model_files["model"], **onnx_options)
 
     @staticmethod
     def _get_model_files(quantization: str | None = None) -> dict[str, str]:
@@ -43,7 +43,8 @@ class SileroVad(Vad):
 
         def process(frame: npt.NDArray[np.float32]) -> npt.NDArray[np.float32]:
             nonlocal state
-            output, new_state = self._model.run(["output", "stateN"], {"input": frame, "state": state, "sr": [self.SAMPLE_RATE]})
+            with profiler.tag("VAD frame"):
+                output, new_state = self._model.run(["output", "stateN"], {"input": frame, "state": state, "sr": [self.SAMPLE_RATE]})
             assert is_float32_array(output) and is_float32_array(new_state)
             state = new_state
             return output[:, 0]
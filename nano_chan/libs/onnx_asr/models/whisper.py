@@ -8,9 +8,9 @@ from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
-import onnxruntime as rt
 from onnxruntime import OrtValue
 
+from ...ort_utils import create_session
 from ..asr import Asr, TimestampedResult
 from ..utils import OnnxSessionOptions, get_onnx_device, is_float32_array, is_int32_array
 
@@ -103,7 +103,7 @@ class WhisperOrt(_Whisper):
 
         """
         super().__init__(model_files, onnx_options)
-        self._model = rt.InferenceSession(model_files["model"], **onnx_options)
+        self._model = create_session(model_files["model"], **onnx_options)
 
     @staticmethod
     def _get_model_files(quantization: str | None = None) -> dict[str, str]:
@@ -144,8 +144,8 @@ class WhisperHf(_Whisper):
 
         """
         super().__init__(model_files, onnx_options)
-        self._encoder = rt.InferenceSession(model_files["encoder"], **onnx_options)
-        self._decoder = rt.InferenceSession(model_files["decoder"], **onnx_options)
+        self._encoder = create_session(model_files["encoder"], **onnx_options)
+        self._decoder = create_session(model_files["decoder"], **onnx_options)
         self._device_type, self._device_id = get_onnx_device(self._encoder)
 
     @staticmethod
@@ -5,8 +5,8 @@ from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
-import onnxruntime as rt
 
+from ...ort_utils import create_session
 from ..utils import OnnxSessionOptions, is_float32_array, is_int64_array
 
 
@@ -23,8 +23,9 @@ class Preprocessor:
         """
         filename = str(Path(name).with_suffix(".onnx"))
         if onnx_options.get("cpu_preprocessing", False):
-            onnx_options = {"sess_options": onnx_options.get("sess_options")}
-        self._preprocessor = rt.InferenceSession(files(__package__).joinpath(filename).read_bytes(), **onnx_options)
+            onnx_options = {"sess_options": onnx_options.get("sess_options"), "mmap_weights": onnx_options.get("mmap_weights", False)}
+        model = files(__package__).joinpath(filename)
+        self._preprocessor = create_session(model if isinstance(model, Path) else model.read_bytes(), **onnx_options)
 
     def __call__(
         self, waveforms: npt.NDArray[np.float32], waveforms_lens: npt.NDArray[np.int64]
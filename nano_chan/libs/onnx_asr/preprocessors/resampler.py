@@ -46,11 +46,12 @@
 """Waveform resampler implementations."""
 
 from importlib.resources import files
+from pathlib import Path
 
 import numpy as np
 import numpy.typing as npt
-import onnxruntime as rt
 
+from ...ort_utils import create_session, profiler
 from ..utils import OnnxSessionOptions, SampleRates, is_float32_array, is_int64_array
 
 
@@ -65,8 +66,9 @@ class Resampler:
 
         """
         if onnx_options.get("cpu_preprocessing", False):
-            onnx_options = {"sess_options": onnx_options.get("sess_options")}
-        self._preprocessor = rt.InferenceSession(files(__package__).joinpath("resample.onnx").read_bytes(), **onnx_options)
+            onnx_options = {"sess_options": onnx_options.get("sess_options"), "mmap_weights": onnx_options.get("mmap_weights", False)}
+        model = files(__package__).joinpath("resample.onnx")
+        self._preprocessor = create_session(model if isinstance(model, Path) else model.read_bytes(), **onnx_options)
 
     def __call__(
         self, waveforms: npt.NDArray[np.float32], waveforms_lens: npt.NDArray[np.int64], sample_rate: SampleRates
@@ -75,9 +77,10 @@ class Resampler:
         if sample_rate == 16_000:
             return waveforms, waveforms_lens
 
-        resampled, resampled_lens = self._preprocessor.run(
-            ["resampled", "resampled_lens"],
-            {"waveforms": waveforms, "waveforms_lens": waveforms_lens, "sample_rate": [sample_rate]},
-        )
+        with profiler.tag("resampler"):
+            resampled, resampled_lens = self._preprocessor.run(
+                ["resampled", "resampled_lens"],
+                {"waveforms": waveforms, "waveforms_lens": waveforms_lens, "sample_rate": [sample_rate]},
+            )
         assert is_float32_array(resampled) and is_int64_array(resampled_lens)
         return resampled, resampled_lens
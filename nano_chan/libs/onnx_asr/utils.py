@@ -62,6 +62,7 @@ class OnnxSessionOptions(TypedDict, total=False):
     providers: Sequence[str | tuple[str, dict[Any, Any]]] | None
     provider_options: Sequence[dict[Any, Any]] | None
     cpu_preprocessing: bool
+    mmap_weights: bool
 
 
 def get_onnx_device(session: rt.InferenceSession) -> tuple[str, int]:
@@ -78,34 +79,59 @@ def get_onnx_device(session: rt.InferenceSession) -> tuple[str, int]:
     return device_type, int(session.get_provider_options()[provider].get("device_id", 0))
 
 
-def read_wav(filename: str) -> tuple[npt.NDArray[np.float32], int]:
-    """Read PCM wav file to Numpy array."""
+PcmArray = npt.NDArray[np.float32] | npt.NDArray[np.uint8] | npt.NDArray[np.int16] | npt.NDArray[np.int32]
+
+
+def is_pcm_array(x: object) -> TypeGuard[PcmArray]:
+    """Numpy array is float32 or integer PCM."""
+    return isinstance(x, np.ndarray) and x.dtype in (np.float32, np.uint8, np.int16, np.int32)
+
+
+def pcm_scale(dtype: npt.DTypeLike) -> tuple[float, float]:
+    """Scale and offset to convert PCM of dtype to float32 in [-1, 1).
+
+    Integer PCM uses the full range of its type (uint8 is offset by 128),
+    floating PCM (e.g. float64 from soundfile.read) is already normalized.
+    """
+    dtype = np.dtype(dtype)
+    if dtype.kind == "f":
+        return 1.0, 0.0
+    if dtype.kind not in "iu":
+        raise TypeError(f"Unsupported PCM dtype {dtype}.")
+    return 1.0 / 2 ** (8 * dtype.itemsize - 1), (1.0 if dtype.kind == "u" else 0.0)
+
+
+def read_wav_pcm(filename: str) -> tuple[PcmArray, int]:
+    """Read PCM wav file to Numpy array without conversion (24 bit samples are stored in the upper bytes of int32)."""
     with wave.open(filename, mode="rb") as f:
         data = f.readframes(f.getnframes())
-        zero_value = 0
         if f.getsampwidth() == 1:
             buffer = np.frombuffer(data, dtype="u1")
-            zero_value = 1
         elif f.getsampwidth() == 3:
             buffer = np.zeros((len(data) // 3, 4), dtype="V1")
             buffer[:, -3:] = np.frombuffer(data, dtype="V1").reshape(-1, f.getsampwidth())
             buffer = buffer.view(dtype="<i4")
         else:
             buffer = np.frombuffer(data, dtype=f"<i{f.getsampwidth()}")
+        return buffer.reshape(f.getnframes(), f.getnchannels()), f.getframerate()
+
 
-        max_value = 2 ** (8 * buffer.itemsize - 1)
-        return buffer.reshape(f.getnframes(), f.getnchannels()).astype(np.float32) / max_value - zero_value, f.getframerate()
+def read_wav(filename: str) -> tuple[npt.NDArray[np.float32], int]:
+    """Read PCM wav file to Numpy array."""
+    buffer, sample_rate = read_wav_pcm(filename)
+    scale, offset = pcm_scale(buffer.dtype)
+    return buffer.astype(np.float32) * np.float32(scale) - np.float32(offset), sample_rate
 
 
 def read_wav_files(
-    waveforms: list[npt.NDArray[np.float32] | str], numpy_sample_rate: SampleRates
+    waveforms: list[PcmArray | str], numpy_sample_rate: SampleRates
 ) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.int64], SampleRates]:
     """Convert list of waveform or filenames to Numpy array with common length."""
     results = []
     sample_rates = []
     for x in waveforms:
         if isinstance(x, str):
-            waveform, sample_rate = read_wav(x)
+            waveform, sample_rate = read_wav_pcm(x)
             if waveform.shape[1] != 1:
                 raise SupportedOnlyMonoAudioError()
             results.append(waveform[:, 0])
@@ -124,12 +150,26 @@ def read_wav_files(
     raise WrongSampleRateError()
 
 
-def pad_list(arrays: list[npt.NDArray[np.float32]]) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.int64]]:
-    """Pad list of Numpy arrays to common length."""
+def pad_list(arrays: list[PcmArray]) -> tuple[npt.NDArray[np.float32], npt.NDArray[np.int64]]:
+    """Pad list of Numpy arrays to common length.
+
+    Integer PCM is scaled to float32 in a single pass into the padded buffer,
+    a single float32 waveform is returned without copy.
+    """
     lens = np.array([array.shape[0] for array in arrays], dtype=np.int64)
 
+    if len(arrays) == 1 and arrays[0].dtype == np.float32:
+        return np.ascontiguousarray(arrays[0])[None], lens
+
     result = np.zeros((len(arrays), lens.max()), dtype=np.float32)
     for i, x in enumerate(arrays):
-        result[i, : x.shape[0]] = x[: min(x.shape[0], result.shape[1])]
+        out = result[i, : x.shape[0]]
+        scale, offset = pcm_scale(x.dtype)
+        if scale == 1.0:
+            out[:] = x
+        else:
+            np.multiply(x, np.float32(scale), out=out, dtype=np.float32, casting="unsafe")
+            if offset:
+                out -= np.float32(offset)
 
     return result, lens
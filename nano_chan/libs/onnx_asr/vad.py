@@ -4,6 +4,8 @@ from abc import ABC, abstractmethod
 from collections.abc import Iterator
 from dataclasses import dataclass
 from itertools import islice
+from queue import Full, Queue
+from threading import Event, Thread
 
 import numpy as np
 import numpy.typing as npt
@@ -26,6 +28,62 @@ class TimestampedSegmentResult(TimestampedResult, SegmentResult):
     """Timestamped segment recognition result."""
 
 
+_END = object()
+
+
+def _pipelined(
+    segments: Iterator[Iterator[tuple[int, int]]], count: int, depth: int
+) -> Iterator[Iterator[tuple[int, int]]]:
+    """Run segmentation in a producer thread, at most `depth` segments ahead of the consumer."""
+    queue: Queue[object] = Queue(maxsize=depth)
+    stop = Event()
+
+    def put(item: object) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce() -> None:
+        try:
+            for waveform_segments in segments:
+                for segment in waveform_segments:
+                    if not put(segment):
+                        return
+                if not put(_END):
+                    return
+        except Exception as e:
+            put(e)
+
+    def get() -> object:
+        item = queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    exhausted = True
+
+    def waveform_segments() -> Iterator[tuple[int, int]]:
+        nonlocal exhausted
+        while (item := get()) is not _END:
+            yield item  # type: ignore[misc]
+        exhausted = True
+
+    Thread(target=produce, daemon=True).start()
+    try:
+        for _ in range(count):
+            # skip segments of a waveform left unconsumed to keep order
+            while not exhausted and get() is not _END:
+                pass
+            exhausted = False
+            yield waveform_segments()
+    finally:
+        stop.set()
+
+
 class Vad(ABC):
     """Base VAD class."""
 
@@ -45,9 +103,18 @@ class Vad(ABC):
         waveforms_len: npt.NDArray[np.int64],
         language: str | None,
         batch_size: float = 8,
+        pipeline_depth: float = 0,
         **kwargs: float,
     ) -> Iterator[Iterator[TimestampedSegmentResult]]:
-        """Segment and recognize waveforms batch."""
+        """Segment and recognize waveforms batch.
+
+        With `pipeline_depth` > 0 VAD runs in a background thread and buffers
+        up to `max(pipeline_depth, batch_size)` segments, so that a full ASR batch
+        can be ready while ASR recognizes the previous one.
+
+        VAD and ASR overlap only for a single waveform: for several waveforms,
+        Silero encodes every frame of the batch before the first segment is yielded.
+        """
 
         def recognize(
             waveform: npt.NDArray[np.float32], segment: Iterator[tuple[int, int]]
@@ -64,4 +131,7 @@ class Vad(ABC):
                     )
                 )
 
-        return map(recognize, waveforms, self.segment_batch(waveforms, waveforms_len, **kwargs))
+        segments = self.segment_batch(waveforms, waveforms_len, **kwargs)
+        if pipeline_depth > 0:
+            segments = _pipelined(segments, len(waveforms), max(int(pipeline_depth), int(batch_size)))
+        return map(recognize, waveforms, segments)
@@ -0,0 +1,7 @@
+"""Helpers shared by the ONNX Runtime sessions of onnx_asr and kokoro_onnx."""
+
+from .profiling import ProfiledSession, profiler
+from .session import create_session, export_mmap_model
+from .tuning import tuned_session_options
+
+__all__ = ["ProfiledSession", "create_session", "export_mmap_model", "profiler", "tuned_session_options"]
@@ -0,0 +1,237 @@
+"""Per-operator profiling of ONNX Runtime sessions switchable at runtime."""
+
+import json
+import logging
+import threading
+import time
+import weakref
+from bisect import bisect_right
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any
+
+import onnxruntime as rt
+
+log = logging.getLogger(__name__)
+
+_NULL_CONTEXT = nullcontext()
+
+
+class ProfiledSession:
+    """InferenceSession wrapper which can start ORT profiling after creation.
+
+    ORT enables profiling only when a session is created, so the session is
+    recreated with profiling on when the profiler is enabled. Every run is
+    tagged with the stage of the caller (see `Profiler.tag`).
+    """
+
+    def __init__(self, name: str, model: str | bytes, sess_options: rt.SessionOptions | None, **kwargs: Any):
+        """Create session.
+
+        Args:
+            name: Session name used in reports.
+            model: Path to ONNX model or model bytes.
+            sess_options: Optional SessionOptions for onnxruntime.
+            kwargs: Other arguments for InferenceSession.
+
+        """
+        self.name = name
+        self._model = model
+        self._sess_options = sess_options
+        self._kwargs = kwargs
+        self._lock = threading.Lock()
+        self._profiling = False
+        self._run_tags: list[tuple[str, int]] = []
+        self._session = rt.InferenceSession(model, sess_options, **kwargs)
+        profiler._register(self)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._session, name)
+
+    @property
+    def session(self) -> rt.InferenceSession:
+        """Current InferenceSession, replaced when profiling starts (e.g. for a new IO binding)."""
+        return self._session
+
+    def run(self, output_names: Any, input_feed: Any, run_options: Any = None) -> Any:
+        """Run session (see InferenceSession.run)."""
+        if self._profiling:
+            self._run_tags.append(profiler._next_tag(self.name))
+        return self._session.run(output_names, input_feed, run_options)
+
+    def run_with_iobinding(self, iobinding: Any, run_options: Any = None) -> None:
+        """Run session with IO binding (see InferenceSession.run_with_iobinding)."""
+        if self._profiling:
+            self._run_tags.append(profiler._next_tag(self.name))
+        self._session.run_with_iobinding(iobinding, run_options)
+
+    def start_profiling(self, output_dir: Path) -> None:
+        """Recreate session with profiling enabled."""
+        with self._lock:
+            if self._profiling:
+                return
+            sess_options = self._sess_options or rt.SessionOptions()
+            sess_options.enable_profiling = True
+            sess_options.profile_file_prefix = str(output_dir / self.name)
+            try:
+                session = rt.InferenceSession(self._model, sess_options, **self._kwargs)
+            finally:
+                sess_options.enable_profiling = False
+            self._run_tags = []
+            self._session = session
+            self._profiling = True
+
+    def end_profiling(self) -> tuple[str, int, list[tuple[str, int]]] | None:
+        """Stop profiling, return trace file, its start time in ns and tags of runs."""
+        with self._lock:
+            if not self._profiling:
+                return None
+            self._profiling = False
+            return self._session.end_profiling(), self._session.get_profiling_start_time_ns(), self._run_tags
+
+
+class Profiler:
+    """Collect ORT profiles of every session created by `create_session`.
+
+    Usage:
+        profiler.set_enabled(True)
+        with profiler.tag("Kokoro batch", 2):
+            session.run(...)
+        report = profiler.set_enabled(False)  # writes summary and Chrome trace
+    """
+
+    def __init__(self) -> None:
+        """Create profiler (disabled)."""
+        self.enabled = False
+        self.output_dir = Path("profiles")
+        self._sessions: weakref.WeakSet[ProfiledSession] = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._counters: defaultdict[str, int] = defaultdict(int)
+
+    def _register(self, session: ProfiledSession) -> None:
+        with self._lock:
+            self._sessions.add(session)
+            if self.enabled:
+                session.start_profiling(self.output_dir)
+
+    @contextmanager
+    def _tag(self, stage: str, step: int | None) -> Iterator[None]:
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append((stage, step))
+        try:
+            yield
+        finally:
+            stack.pop()
+
+    def tag(self, stage: str, step: int | None = None) -> Any:
+        """Context manager tagging session runs of this thread with stage and step.
+
+        Runs without explicit step are numbered per stage.
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._tag(stage, step)
+
+    def _next_tag(self, default_stage: str) -> tuple[str, int]:
+        stack = self._local.__dict__.get("stack")
+        stage, step = stack[-1] if stack else (default_stage, None)
+        if step is None:
+            step = self._counters[stage]
+            self._counters[stage] += 1
+        return stage, step
+
+    def set_enabled(self, enabled: bool, output_dir: str | Path | None = None) -> Path | None:
+        """Switch profiling of all sessions.
+
+        Args:
+            enabled: Enable or disable profiling.
+            output_dir: Directory for traces and reports.
+
+        Returns:
+            Path to summary report when profiling is disabled.
+
+        """
+        with self._lock:
+            if output_dir is not None:
+                self.output_dir = Path(output_dir)
+            if enabled == self.enabled:
+                return None
+            self.enabled = enabled
+            sessions = list(self._sessions)
+            if enabled:
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                self._counters.clear()
+                for session in sessions:
+                    session.start_profiling(self.output_dir)
+                log.info(f"ORT profiling enabled for {len(sessions)} sessions")
+                return None
+            traces = [(s.name, *trace) for s in sessions if (trace := s.end_profiling()) is not None]
+        return self._write_report(traces)
+
+    def _write_report(self, traces: list[tuple[str, str, int, list[tuple[str, int]]]]) -> Path:
+        by_op: defaultdict[str, list[float]] = defaultdict(lambda: [0, 0.0])
+        by_node: defaultdict[tuple[str, str, str], list[float]] = defaultdict(lambda: [0, 0.0])
+        by_stage: defaultdict[tuple[str, str], list[float]] = defaultdict(lambda: [0, 0.0])
+        chrome: list[dict[str, Any]] = []
+        origin = min((start for _, _, start, _ in traces), default=0)
+
+        for pid, (name, filename, start_ns, tags) in enumerate(traces):
+            with open(filename, encoding="utf-8") as f:
+                events = json.load(f)
+            runs = sorted((e for e in events if e.get("name") == "model_run"), key=lambda e: e["ts"])
+            for run, (stage, step) in zip(runs, tags):
+                run["args"]["stage"], run["args"]["step"] = stage, step
+                run["name"] = f"{stage} {step}"
+                by_stage[(name, stage)][0] += 1
+                by_stage[(name, stage)][1] += run["dur"]
+            starts = [run["ts"] for run in runs]
+
+            for e in events:
+                if e.get("cat") == "Node" and "op_name" in e.get("args", {}):
+                    op = e["args"]["op_name"]
+                    i = bisect_right(starts, e["ts"]) - 1
+                    stage = runs[i]["args"].get("stage", name) if i >= 0 else name
+                    e["args"]["stage"] = stage
+                    by_op[op][0] += 1
+                    by_op[op][1] += e["dur"]
+                    by_node[(name, e["name"].removesuffix("_kernel_time"), op)][0] += 1
+                    by_node[(name, e["name"].removesuffix("_kernel_time"), op)][1] += e["dur"]
+                e["pid"] = pid
+                e["ts"] += (start_ns - origin) / 1000
+                chrome.append(e)
+            chrome.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}})
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        trace_path = self.output_dir / f"ort_profile_{stamp}.trace.json"
+        report_path = self.output_dir / f"ort_profile_{stamp}.md"
+        trace_path.write_text(json.dumps(chrome), encoding="utf-8")
+        report_path.write_text(_format_report(by_stage, by_op, by_node, trace_path), encoding="utf-8")
+        log.info(f"ORT profile written to {report_path}")
+        return report_path
+
+
+def _format_report(
+    by_stage: dict[tuple[str, str], list[float]],
+    by_op: dict[str, list[float]],
+    by_node: dict[tuple[str, str, str], list[float]],
+    trace_path: Path,
+    top: int = 30,
+) -> str:
+    total_ops = sum(t for _, t in by_op.values()) or 1
+    lines = [f"# ORT profile\n\nChrome trace: `{trace_path.name}` (open in chrome://tracing or ui.perfetto.dev)\n"]
+    lines += ["## Stages\n", "| session | stage | runs | total [ms] | mean [ms] |", "|---|---|---|---|---|"]
+    for (session, stage), (count, dur) in sorted(by_stage.items(), key=lambda x: -x[1][1]):
+        lines.append(f"| {session} | {stage} | {count} | {dur / 1000:.1f} | {dur / 1000 / count:.2f} |")
+    lines += ["\n## Operators\n", "| op | calls | total [ms] | share |", "|---|---|---|---|"]
+    for op, (count, dur) in sorted(by_op.items(), key=lambda x: -x[1][1])[:top]:
+        lines.append(f"| {op} | {count} | {dur / 1000:.1f} | {dur / total_ops * 100:.1f}% |")
+    lines += ["\n## Nodes\n", "| session | node | op | calls | total [ms] | share |", "|---|---|---|---|---|---|"]
+    for (session, node, op), (count, dur) in sorted(by_node.items(), key=lambda x: -x[1][1])[:top]:
+        lines.append(f"| {session} | {node} | {op} | {count} | {dur / 1000:.1f} | {dur / total_ops * 100:.1f}% |")
+    return "\n".join(lines) + "\n"
+
+
+profiler = Profiler()
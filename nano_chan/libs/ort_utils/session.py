@@ -0,0 +1,103 @@
+"""ONNX Runtime session factory."""
+
+import hashlib
+import logging
+import os
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any
+
+import onnxruntime as rt
+
+from .profiling import ProfiledSession
+
+log = logging.getLogger(__name__)
+
+MMAP_ALIGNMENT = 64 * 1024
+MMAP_SIZE_THRESHOLD = 1024
+MMAP_CACHE_DIR = Path("weights/mmap")
+
+
+def _mmap_model_path(path: Path) -> Path:
+    # models of the package and of different directories may share a name
+    key = hashlib.sha1(str(path.resolve()).encode()).hexdigest()[:8]
+    return MMAP_CACHE_DIR / f"{path.name.removesuffix('.onnx')}-{key}.mmap.onnx"
+
+
+def export_mmap_model(src: str | Path, dst: str | Path | None = None) -> Path:
+    """Store initializers of an ONNX model as page aligned external data.
+
+    ONNX Runtime memory-maps aligned external data instead of copying it,
+    so read-only weight pages are shared by every process using the same file.
+    Requires the `onnx` package (`mmap` extra), the model is exported only once.
+
+    Args:
+        src: Path to ONNX model (embedded or external data).
+        dst: Path to exported model, `<name>-<hash of src path>.mmap.onnx` in `MMAP_CACHE_DIR` by default.
+
+    Returns:
+        Path to exported model (weights in `<dst>.data`).
+
+    """
+    import onnx
+    from onnx.external_data_helper import set_external_data
+
+    src = Path(src)
+    dst = Path(dst) if dst else _mmap_model_path(src)
+    data = dst.with_name(dst.name + ".data")
+    if dst.exists() and data.exists() and dst.stat().st_mtime >= src.stat().st_mtime:
+        return dst
+
+    log.info(f"Exporting {src} for memory mapped weights to {dst}")
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    model = onnx.load(src)
+    tmp = data.with_name(data.name + ".tmp")
+    with tmp.open("wb") as f:
+        for tensor in model.graph.initializer:
+            if len(tensor.raw_data) < MMAP_SIZE_THRESHOLD:
+                continue
+            f.write(b"\0" * (-f.tell() % MMAP_ALIGNMENT))
+            offset = f.tell()
+            f.write(tensor.raw_data)
+            set_external_data(tensor, data.name, offset, len(tensor.raw_data))
+            tensor.ClearField("raw_data")
+            tensor.data_location = onnx.TensorProto.EXTERNAL
+    os.replace(tmp, data)
+    onnx.save(model, dst)
+    return dst
+
+
+def create_session(
+    model: str | Path | bytes,
+    sess_options: rt.SessionOptions | None = None,
+    providers: Sequence[str | tuple[str, dict[Any, Any]]] | None = None,
+    provider_options: Sequence[dict[Any, Any]] | None = None,
+    *,
+    mmap_weights: bool = False,
+    name: str | None = None,
+    **kwargs: Any,
+) -> ProfiledSession:
+    """Create onnxruntime InferenceSession (profiling can be switched on later, see `profiler`).
+
+    Args:
+        model: Path to ONNX model or model bytes.
+        sess_options: Optional SessionOptions for onnxruntime.
+        providers: Optional providers for onnxruntime.
+        provider_options: Optional provider_options for onnxruntime.
+        mmap_weights: Load weights from a memory mapped file shared between processes
+                      (CPU provider only, prepacking of weights is disabled).
+        name: Session name for profiling reports, model file name by default.
+        kwargs: Other arguments for InferenceSession.
+
+    """
+    if name is None:
+        name = "model" if isinstance(model, bytes) else Path(model).name.removesuffix(".onnx")
+    if mmap_weights and not isinstance(model, bytes):
+        model = export_mmap_model(model)
+        if sess_options is None:
+            sess_options = rt.SessionOptions()
+        # prepacked weights are private copies of the mapped ones
+        sess_options.add_session_config_entry("session.disable_prepacking", "1")
+    if isinstance(model, Path):
+        model = str(model)
+    return ProfiledSession(name, model, sess_options, providers=providers, provider_options=provider_options, **kwargs)
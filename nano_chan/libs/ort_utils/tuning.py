@@ -0,0 +1,113 @@
+"""Saved provider and thread configurations of ONNX Runtime sessions per model and host."""
+
+import json
+import logging
+import os
+import platform
+from collections.abc import Sequence
+from pathlib import Path
+from typing import Any, TypedDict
+
+import onnxruntime as rt
+
+log = logging.getLogger(__name__)
+
+EXECUTION_MODES = {
+    "sequential": rt.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": rt.ExecutionMode.ORT_PARALLEL,
+}
+OPTIMIZATION_LEVELS = {
+    "basic": rt.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": rt.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": rt.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+class SessionConfig(TypedDict, total=False):
+    """Tuned configuration of a model."""
+
+    providers: list[str]
+    intra_op_num_threads: int
+    execution_mode: str
+    graph_optimization_level: str
+    latency_ms: float
+
+
+def tuning_file() -> Path:
+    """Path to saved configurations, `ORT_TUNING_FILE` or weights/ort_tuning.json."""
+    return Path(os.getenv("ORT_TUNING_FILE", "weights/ort_tuning.json"))
+
+
+def host_id() -> str:
+    """Identify host by name, architecture and number of CPUs."""
+    return f"{platform.node()}-{platform.machine()}-{os.cpu_count()}"
+
+
+def default_providers() -> list[str]:
+    """CUDA if available, otherwise every available provider."""
+    if "CUDAExecutionProvider" in rt.get_available_providers():
+        return ["CUDAExecutionProvider"]
+    return rt.get_available_providers()
+
+
+def make_session_options(config: SessionConfig) -> rt.SessionOptions:
+    """Create SessionOptions from configuration."""
+    sess_options = rt.SessionOptions()
+    if "intra_op_num_threads" in config:
+        sess_options.intra_op_num_threads = config["intra_op_num_threads"]
+    if "execution_mode" in config:
+        sess_options.execution_mode = EXECUTION_MODES[config["execution_mode"]]
+    if "graph_optimization_level" in config:
+        sess_options.graph_optimization_level = OPTIMIZATION_LEVELS[config["graph_optimization_level"]]
+    return sess_options
+
+
+def load_config(model_key: str) -> SessionConfig | None:
+    """Saved configuration of model on this host."""
+    path = tuning_file()
+    if not path.exists():
+        return None
+    with path.open(encoding="utf-8") as f:
+        config: SessionConfig | None = json.load(f).get(host_id(), {}).get(model_key)
+    if config is not None:
+        # CUDA may be gone since tuning (e.g. CPU-only onnxruntime installed)
+        config["providers"] = [p for p in config.get("providers", []) if p in rt.get_available_providers()]
+    return config
+
+
+def save_config(model_key: str, config: SessionConfig) -> None:
+    """Save configuration of model on this host."""
+    path = tuning_file()
+    data: dict[str, dict[str, Any]] = {}
+    if path.exists():
+        with path.open(encoding="utf-8") as f:
+            data = json.load(f)
+    data.setdefault(host_id(), {})[model_key] = dict(config)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+
+def tuned_session_options(
+    model_key: str,
+    sess_options: rt.SessionOptions | None = None,
+    providers: Sequence[str | tuple[str, dict[Any, Any]]] | None = None,
+) -> tuple[rt.SessionOptions | None, Sequence[str | tuple[str, dict[Any, Any]]]]:
+    """Apply saved configuration unless options are given explicitly.
+
+    Args:
+        model_key: Model name used by the autotune command.
+        sess_options: Explicit SessionOptions (disables tuned options).
+        providers: Explicit providers (disables tuned providers).
+
+    Returns:
+        SessionOptions and providers to create sessions with.
+
+    """
+    config = load_config(model_key) if sess_options is None or providers is None else None
+    if config:
+        log.debug(f"Tuned ORT config for {model_key}: {config}")
+        if sess_options is None:
+            sess_options = make_session_options(config)
+        if providers is None and config["providers"]:
+            providers = config["providers"]
+    return sess_options, providers or default_providers()
@@ -0,0 +1,112 @@
+import logging
+from threading import Lock
+from time import perf_counter
+
+import numpy as np
+
+from nano_chan.libs import onnx_asr
+
+log = logging.getLogger(__name__)
+
+
+class _RoutedModel:
+    '''ASR model with its measured latency profile (latency = overhead + rtf * duration)'''
+    def __init__(self, name:str, model, alpha:float):
+        self.name = name
+        self.model = model
+        self.alpha = alpha
+        self.overhead = 0.0 # sec per call
+        self.rtf = 0.0      # sec per sec of audio
+        self.calls = 0
+
+    def predict(self, duration:float)->float:
+        return self.overhead + self.rtf * duration
+
+    def update(self, duration:float, latency:float)->None:
+        '''update RTF by exponential moving average, overhead is kept from calibration'''
+        rtf = max(latency - self.overhead, 0.0) / max(duration, 1e-3)
+        self.rtf = (1 - self.alpha) * self.rtf + self.alpha * rtf
+        self.calls += 1
+
+
+class AsrRouter:
+    '''
+    Hold several ASR models and route each clip to the most accurate one
+    which is expected to finish within the latency budget.
+
+    Models must be listed from the most accurate to the fastest.
+    The budget of a clip is max(min_budget_sec, budget_rtf * duration),
+    so short utterances are answered quickly and long turns keep accuracy.
+    Clips waiting in the queue are added to the predicted latency.
+
+    Args:
+        models (list[dict]): kwargs for onnx_asr.load_model, e.g. {"model_name":..., "quantization":...}
+        sample_rate (int): sample rate of input clips
+        min_budget_sec (float): latency budget for short clips
+        budget_rtf (float): latency budget per second of audio for long clips
+        rtf_alpha (float): smoothing factor of measured RTF
+    '''
+    def __init__(self, models:list[dict],
+                 sample_rate:int=48000,
+                 min_budget_sec:float=0.3,
+                 budget_rtf:float=0.1,
+                 rtf_alpha:float=0.2):
+        self.sample_rate = sample_rate
+        self.min_budget_sec = min_budget_sec
+        self.budget_rtf = budget_rtf
+        self.lock = Lock()
+        self.models:list[_RoutedModel] = []
+        for spec in models:
+            spec = dict(spec)
+            model_name = spec.pop("model_name")
+            name = f"{model_name}:{spec.get('quantization') or 'fp32'}"
+            model = onnx_asr.load_model(model_name, **spec)
+            self.models.append(_RoutedModel(name, model, rtf_alpha))
+        if len(self.models) > 1:
+            self._calibrate()
+
+    def _calibrate(self, durations:tuple[float, float]=(1.0, 4.0))->None:
+        '''measure overhead and RTF of each model with silent clips'''
+        short, long = durations
+        for m in self.models:
+            latency = []
+            for duration in durations:
+                audio = np.zeros(int(duration * self.sample_rate), dtype=np.int16)
+                m.model.recognize(audio, sample_rate=self.sample_rate) # warm up
+                start = perf_counter()
+                m.model.recognize(audio, sample_rate=self.sample_rate)
+                latency.append(perf_counter() - start)
+            m.rtf = max(latency[1] - latency[0], 0.0) / (long - short)
+            m.overhead = max(latency[0] - m.rtf * short, 0.0)
+            log.info(f"ASR {m.name}: overhead {m.overhead*1000:.0f}ms, RTF {m.rtf:.3f}")
+
+    def budget(self, duration:float)->float:
+        return max(self.min_budget_sec, self.budget_rtf * duration)
+
+    def select(self, duration:float, queue_depth:int=0)->_RoutedModel:
+        '''choose the model for a clip, fall back to the fastest one'''
+        budget = self.budget(duration)
+        for m in self.models:
+            # queued clips are assumed to be as long as the current one
+            if m.predict(duration) * (1 + queue_depth) <= budget:
+                return m
+        return min(self.models, key=lambda m: m.predict(duration))
+
+    def recognize(self, audio:np.ndarray, queue_depth:int=0)->str:
+        '''
+        Args:
+            audio(np.ndarray): mono audio clip
+            queue_depth(int): number of clips waiting after this one
+        '''
+        duration = len(audio) / self.sample_rate
+        m = self.select(duration, queue_depth) if len(self.models) > 1 else self.models[0]
+        start = perf_counter()
+        text = m.model.recognize(audio, sample_rate=self.sample_rate)
+        latency = perf_counter() - start
+        with self.lock:
+            m.update(duration, latency)
+        log.debug(
+            f"ASR route {m.name}: {duration:.2f}s clip, queue {queue_depth}, "
+            f"budget {self.budget(duration)*1000:.0f}ms, latency {latency*1000:.0f}ms (RTF {latency/max(duration,1e-3):.3f})"
+        )
+        return text
@@ -0,0 +1,199 @@
+import logging
+import re
+from collections.abc import Iterator
+from contextlib import contextmanager
+from threading import Event, Lock, Thread
+from time import perf_counter
+
+from .llm_backend import LlmBackend, LlmBackendError
+from .prompt_format import SUMMARY_HEADER
+from .scheduler import Priority, StageScheduler
+
+log = logging.getLogger(__name__)
+
+MESSAGE_OVERHEAD = 5 # tokens of chat template around each message, e.g. <|im_start|>user\n ... <|im_end|>\n
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation between User and Nano-chan below in at most {words} words. "
+    "Keep facts about the user, topics already discussed and open questions. "
+    "Write only the summary."
+)
+
+
+class _Message:
+    '''chat message with its cached token count'''
+    def __init__(self, role:str, content:str, tokens:int):
+        self.role = role
+        self.content = content
+        self.tokens = tokens
+
+    def to_dict(self)->dict:
+        return {"role": self.role, "content": self.content}
+
+
+class ContextManager:
+    '''
+    Chat history with incremental token accounting and rolling summary.
+
+    Each message is tokenized once and the total is kept up to date, so a turn
+    costs one tokenization of the new message. When the history exceeds
+    compact_ratio of the budget, the oldest turns are summarized in a background
+    thread between turns and replaced by the summary, which is appended to the
+    system prompt. Summarization stops as soon as a turn needs the LLM
+    (see `llm_turn`). If the budget is still exceeded, the oldest messages are dropped.
+
+    Args:
+        backend (LlmBackend): model to count tokens and generate summaries
+        system_prompt (str): system prompt
+        max_tokens (int): token budget of the history including system prompt
+        compact_ratio (float): start summarizing when history exceeds this ratio of max_tokens
+        keep_turns (int): latest turns never summarized
+        summary_words (int): length limit of the summary
+        summarize (bool): summarize old turns, if False they are just dropped
+        scheduler (StageScheduler): summary generation yields to other stages as low priority work
+    '''
+    def __init__(self, backend:LlmBackend,
+                 system_prompt:str,
+                 max_tokens:int,
+                 compact_ratio:float=0.6,
+                 keep_turns:int=2,
+                 summary_words:int=80,
+                 summarize:bool=True,
+                 scheduler:StageScheduler|None=None):
+        self.backend = backend
+        self.system_prompt = system_prompt
+        self.max_tokens = max_tokens
+        self.compact_tokens = int(max_tokens * compact_ratio)
+        self.keep_turns = keep_turns
+        self.summary_words = summary_words
+        self.summarize = summarize
+        self.scheduler = scheduler or StageScheduler(enabled=False)
+
+        self.lock = Lock()          # guards history
+        self.llm_lock = Lock()      # one generation at a time
+        self._cancel = Event()      # stop summary generation
+        self._generation = 0        # incremented by clear() to discard stale summaries
+        self._summary_thread:Thread|None = None
+        self.summary = ""
+        self.clear()
+
+    def _count(self, role:str, content:str)->_Message:
+        return _Message(role, content, self.backend.count_tokens(content) + MESSAGE_OVERHEAD)
+
+    def _system(self)->_Message:
+        content = self.system_prompt
+        if self.summary:
+            content += SUMMARY_HEADER + self.summary
+        return self._count("system", content)
+
+    def clear(self)->None:
+        '''reset history to system prompt, a running summary is discarded'''
+        with self.lock:
+            self._generation += 1
+            self.summary = ""
+            self._history:list[_Message] = [self._system()]
+            self.total = self._history[0].tokens
+
+    @property
+    def messages(self)->list[dict]:
+        with self.lock:
+            return [m.to_dict() for m in self._history]
+
+    def add(self, role:str, content:str)->None:
+        '''append message, drop the oldest messages if the budget is exceeded'''
+        message = self._count(role, content)
+        with self.lock:
+            self._history.append(message)
+            self.total += message.tokens
+            while self.total > self.max_tokens and len(self._history) > 2:
+                dropped = self._history.pop(1) # keep system prompt
+                self.total -= dropped.tokens
+                log.info(f"Context over budget, dropped {dropped.role} message ({dropped.tokens} tokens)")
+
+    def remove_last_turn(self)->None:
+        '''remove the latest user message and the answer to it'''
+        with self.lock:
+            while len(self._history) > 1:
+                message = self._history.pop()
+                self.total -= message.tokens
+                if message.role == "user":
+                    break
+
+    @contextmanager
+    def llm_turn(self)->Iterator[None]:
+        '''hold the LLM for a turn, stopping summary generation if running'''
+        self._cancel.set()
+        with self.llm_lock:
+            self._cancel.clear()
+            yield
+
+    @contextmanager
+    def background_llm(self)->Iterator[Event]:
+        '''hold the LLM for background work, the yielded event is set when a turn needs the LLM'''
+        with self.llm_lock:
+            yield self._cancel
+
+    def compact_async(self)->None:
+        '''summarize old turns in background if history exceeds compact_ratio of budget'''
+        if not self.summarize or self.total <= self.compact_tokens:
+            return
+        if self._summary_thread is not None and self._summary_thread.is_alive():
+            return
+        self._summary_thread = Thread(target=self._compact, daemon=True)
+        self._summary_thread.start()
+
+    def _compact(self)->None:
+        with self.lock:
+            generation = self._generation
+            # oldest messages except the latest turns, each turn is a user and an assistant message
+            old = self._history[1:max(1, len(self._history) - 2 * self.keep_turns)]
+        if not old:
+            return
+        transcript = "\n".join(
+            f"{'User' if m.role == 'user' else 'Nano-chan'}: {m.content.replace(' /no_think', '')}" for m in old
+        )
+        if self.summary:
+            transcript = f"Earlier summary: {self.summary}\n{transcript}"
+
+        start = perf_counter()
+        summary = self._generate_summary(transcript)
+        if summary is None:
+            log.debug("Context summary cancelled by a new turn")
+            return
+        with self.lock:
+            if generation != self._generation or self._history[1:1 + len(old)] != old:
+                return # cleared or trimmed meanwhile
+            before = self.total
+            self.summary = summary
+            self._history = [self._system()] + self._history[1 + len(old):]
+            self.total = sum(m.tokens for m in self._history)
+        log.info(f"Context compacted {len(old)} messages: {before} -> {self.total} tokens "
+                 f"in {perf_counter() - start:.1f}s")
+
+    def _generate_summary(self, transcript:str)->str|None:
+        '''summary text, None if cancelled or failed'''
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(words=self.summary_words)},
+            {"role": "user", "content": transcript + " /no_think"},
+        ]
+        text = ""
+        with self.background_llm() as cancel, self.scheduler.job("llm", Priority.LOW, "summary") as job:
+            if cancel.is_set():
+                return None
+            stream = self.backend.stream(
+                messages,
+                max_tokens=int(self.summary_words * 2),
+                temperature=0.3,
+                stop=["<|endoftext|>", "<|im_end|>"],
+            )
+            try:
+                for chunk in stream:
+                    if cancel.is_set():
+                        return None
+                    self.scheduler.wait_turn(job)
+                    if chunk["choices"]:
+                        text += chunk["choices"][0]["delta"].get("content") or ""
+            except LlmBackendError as e:
+                log.warning(f"Context summary failed: {e}")
+                return None
+        return re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL).strip() or None
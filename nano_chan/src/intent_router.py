@@ -0,0 +1,128 @@
+import difflib
+import logging
+import re
+from collections import Counter
+from enum import Enum
+
+log = logging.getLogger(__name__)
+
+
+class Intent(str, Enum):
+    LLM = "llm"         # everything else
+    CLEAR = "clear"     # clear conversation history
+    REPEAT = "repeat"   # replay the last answer
+    SLOWER = "slower"
+    FASTER = "faster"
+    VOICE = "voice"     # switch to the next voice
+    STOP = "stop"       # stop speaking
+    ACK = "ack"         # acknowledgement, yes / no
+
+
+PHRASES = {
+    Intent.CLEAR: ["clear", "reset", "clear history", "start over"],
+    Intent.REPEAT: ["repeat", "repeat that", "repeat it", "say that again", "say it again", "again", "pardon",
+                    "what did you say", "come again", "one more time", "sorry what"],
+    Intent.SLOWER: ["slower", "speak slower", "talk slower", "slow down", "speak slowly", "too fast"],
+    Intent.FASTER: ["faster", "speak faster", "talk faster", "speed up", "too slow"],
+    Intent.VOICE: ["change voice", "change your voice", "another voice", "different voice", "switch voice",
+                   "next voice"],
+    Intent.STOP: ["stop", "stop it", "stop talking", "be quiet", "quiet", "shut up", "that is enough", "enough"],
+    Intent.ACK: ["ok", "okay", "yes", "yeah", "yep", "no", "nope", "sure", "alright", "all right", "got it",
+                 "i see", "cool", "thanks", "thank", "thanks a lot", "great", "nice", "uh huh"],
+}
+
+ACK_REPLIES = {"thanks": "You're welcome!", "thank": "You're welcome!", "thanks a lot": "You're welcome!"}
+
+# words that don't change the intent of a short command, e.g. "could you repeat that please"
+FILLERS = {"please", "hey", "um", "uh", "oh", "well", "so", "can", "could", "would", "you", "nano", "chan",
+           "nanochan", "a", "bit", "little", "just", "maybe"}
+
+
+def normalize(text:str)->str:
+    '''lowercase words without punctuation and fillers'''
+    words = re.sub(r"[^\w\s]", " ", text.lower().replace("'s", " is")).split()
+    return " ".join(w for w in words if w not in FILLERS) or " ".join(words)
+
+
+class IntentRouter:
+    '''
+    Classify short utterances which don't need the LLM.
+
+    Utterances of at most max_words words are normalized (punctuation and fillers removed)
+    and looked up in the phrases of each intent, then fuzzy matched against them so that
+    ASR variants like "repeat it" still match. Anything else goes to the LLM.
+    When disabled, only the exact "clear" / "reset" commands are recognized.
+
+    Args:
+        enabled (bool): route utterances, switch while running to compare
+        threshold (float): similarity (0-1) to accept a fuzzy match
+        max_words (int): longer utterances always go to the LLM
+        phrases (dict): additional phrases per intent name, e.g. {"repeat": ["one more"]}
+        voices (list[str]): voices cycled by the voice intent, all voices of the model if empty
+    '''
+    def __init__(self, enabled:bool=True,
+                 threshold:float=0.85,
+                 max_words:int=5,
+                 phrases:dict[str, list[str]]|None=None,
+                 voices:list[str]|None=None):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_words = max_words
+        self.voices = voices or []
+        self.phrases:dict[str, Intent] = {}
+        for intent, texts in PHRASES.items():
+            for text in texts:
+                self.phrases[normalize(text)] = intent
+        for name, texts in (phrases or {}).items():
+            for text in texts:
+                self.phrases[normalize(text)] = Intent(name)
+
+        self.counts:Counter[Intent] = Counter() # turns per intent
+        self.handled:list[float] = []            # seconds to handle turns without the LLM
+
+    def classify(self, text:str)->Intent:
+        words = normalize(text)
+        if not self.enabled:
+            return Intent.CLEAR if words in ("clear", "reset") else Intent.LLM
+        if not words or len(text.split()) > self.max_words:
+            return Intent.LLM
+        if words in self.phrases:
+            return self.phrases[words]
+        best, score = Intent.LLM, 0.0
+        for phrase, intent in self.phrases.items():
+            ratio = difflib.SequenceMatcher(None, words, phrase).ratio()
+            if ratio > score:
+                best, score = intent, ratio
+        if score >= self.threshold:
+            log.debug(f"Intent {best.value} for {text!r} (similarity {score:.2f})")
+            return best
+        return Intent.LLM
+
+    @staticmethod
+    def ack_reply(text:str)->str:
+        return ACK_REPLIES.get(normalize(text), "Okay!")
+
+    def record(self, intent:Intent, elapsed:float|None=None)->None:
+        '''count a turn, elapsed is the time to handle it without the LLM'''
+        self.counts[intent] += 1
+        if elapsed is not None:
+            self.handled.append(elapsed)
+
+    def format_stats(self, llm_latency:list[float])->str:
+        '''
+        turns which skipped the LLM and latency saved
+        Args:
+            llm_latency(list[float]): time to first TTS text of LLM turns
+        '''
+        skipped = sum(n for intent, n in self.counts.items() if intent is not Intent.LLM)
+        total = sum(self.counts.values())
+        if not total:
+            return "no turns yet"
+        text = f"{skipped}/{total} turns skipped the LLM"
+        if self.handled and llm_latency:
+            llm = sum(llm_latency) / len(llm_latency)
+            handled = sum(self.handled) / len(self.handled)
+            text += (f", handled in {handled*1000:.0f}ms vs {llm*1000:.0f}ms to first LLM text, "
+                     f"saved {(llm - handled) * len(self.handled):.1f}s")
+        intents = ", ".join(f"{i.value} x{n}" for i, n in self.counts.most_common() if i is not Intent.LLM)
+        return text + (f" ({intents})" if intents else "")
@@ -1,61 +1,108 @@
 from threading import Thread, Event,Lock
-from typing import List,Dict
+from typing import Callable, Iterator
 from queue import Queue,Empty
-import re
+from time import perf_counter
+import logging
 
-from llama_cpp import Llama
+from .thread_budget import StageBudget
+from .scheduler import Priority, StageScheduler
+from .context_manager import ContextManager
+from .llm_backend import LlmBackend, LlmBackendError, create_backend
+from .segmenter import SentenceSegmenter, remove_emoji
+from .intent_router import Intent, IntentRouter
+
+log = logging.getLogger(__name__)
 
 class LanguageProcessor:
     def __init__(self, input_q:Queue, 
                  system_prompt:str,
                  model_path:str="weights/Qwen3-4B-Q3_K_M.gguf",# Qwen3-4B-Q3_K_M.gguf
-                 n_context:int=3200): 
+                 n_context:int=3200,
+                 use_mmap:bool=True,
+                 budget:StageBudget|None=None,
+                 scheduler:StageScheduler|None=None,
+                 context:dict|None=None,
+                 prompt_state_dir:str|None="weights/prompt_state",
+                 provisional_q:Queue|None=None,
+                 speculative_prefill:bool=False,
+                 segmenter:dict|None=None,
+                 speculative:dict|None=None,
+                 backend:dict|LlmBackend|None=None,
+                 llama:dict|None=None,
+                 router:IntentRouter|None=None,
+                 intent_handler:Callable[[Intent], str|None]|None=None): 
         '''
         Args:
             input_q(Queue) : queue contains user input text
             system_prompt(str) : prompt text as system prompt
             model_path(str) : path to gguf model file
             n_context(int) : length of context
+            use_mmap(bool) : map gguf weights shared between processes (layers offloaded to GPU are copied)
+            budget(StageBudget) : cores and threads for generation and prompt processing
+            scheduler(StageScheduler) : pauses generation while a stage of higher priority runs
+            context(dict) : kwargs for ContextManager, e.g. {"compact_ratio": 0.6, "keep_turns": 2}
+            prompt_state_dir(str) : directory to save KV cache of system prompt, None to prefill it on every start
+            provisional_q(Queue) : queue contains provisional user text while the user is talking
+            speculative_prefill(bool) : prefill prompt with provisional text before the final text arrives
+            segmenter(dict) : kwargs for SentenceSegmenter, e.g. {"first_min_letters": 12, "min_letters": 40}
+            speculative(dict) : kwargs for create_draft_model to enable speculative decoding,
+                e.g. {"type": "prompt_lookup"} or {"type": "draft", "draft_model_path": "weights/Qwen3-0.6B-Q8_0.gguf"}
+            backend(dict|LlmBackend) : kwargs for create_backend, e.g. {"type": "http", "url": "http://127.0.0.1:8080"}
+                to share a llama.cpp server between processes, or a backend such as a session of MultiSessionEngine.
+                model_path, use_mmap, prompt_state_dir, speculative and llama are for the default in-process backend
+            llama(dict) : runtime options of llama_cpp.Llama, e.g. {"n_batch": 512, "flash_attn": True,
+                "type_k": "q8_0", "type_v": "q8_0"}, over values saved by tools.llama_tune
+            router(IntentRouter) : short commands and acknowledgements answered without the LLM
+            intent_handler(Callable) : applies control intents (repeat, speed, voice, stop) and returns
+                the reply to speak, control intents go to the LLM without it
         '''
         self.input_q = input_q
         self.system_prompt = system_prompt
         self._interrupt = False
         self.lock = Lock()
-        self.messages = self._init_messages()
-        self.llm = Llama(
-            model_path=model_path,
-            n_gpu_layers=-1,
-            verbose=False,
-            n_ctx=n_context,
-        )
+        self.budget = budget or StageBudget("llm")
+        self.scheduler = scheduler or StageScheduler(enabled=False)
+        if isinstance(backend, LlmBackend):
+            self.backend = backend
+        else:
+            backend = dict(backend or {})
+            if backend.get("type", "local") == "local":
+                backend.update(model_path=model_path, n_context=n_context, use_mmap=use_mmap, budget=self.budget,
+                               prompt_state_dir=prompt_state_dir, speculative=speculative, llama=llama)
+            self.backend = create_backend(system_prompt, **backend)
+        self.draft = self.backend.draft
         self.max_tokens = int(n_context*0.7)  # 余裕を持たせる
+        self.context = ContextManager(self.backend, system_prompt, self.max_tokens,
+                                      scheduler=self.scheduler, **(context or {}))
 
         self.output_q = Queue() # queue to put generated text
         self.processing_event = Event() # set if generating 
+        self.provisional_q = provisional_q
+        self.speculative_prefill = speculative_prefill
+        self._prefilled = 0 # tokens prefilled speculatively for the next turn
+        self.ttft:dict[str, list[float]] = {"on": [], "off": []} # time to first token by speculative prefill
+        self.segmenter = SentenceSegmenter(**(segmenter or {}))
+        self.first_text:list[float] = [] # time to first TTS text
+        self._sent_first = False
+        self.decode:list[tuple[int, float]] = [] # generated tokens and decode time per turn
+        self.acceptance:list[float] = [] # draft acceptance rate per turn
+        self.router = router or IntentRouter(enabled=False)
+        self.intent_handler = intent_handler
+        self._retract = False # drop the last turn from history before the next text
+        self._turn_in_context = False
     
     def start(self)->None:
         '''start waiting input text'''
         self.is_running = True
         self.input_watch_thread = Thread(target=self._watch_queue, daemon=True)
         self.input_watch_thread.start()
+        if self.provisional_q is not None:
+            self.provisional_watch_thread = Thread(target=self._watch_provisional, daemon=True)
+            self.provisional_watch_thread.start()
         
-    def _init_messages(self):
-        '''set system prompt'''
-        return [
-            {"role": "system", 
-             "content": self.system_prompt}
-        ]
-    
-    def _count_tokens(self, messages:List[Dict]):
-        '''count tokens in context'''
-        total = 0
-        for msg in messages:
-            # システムプロンプトも含めてカウント
-            total += len(self.llm.tokenize(msg["content"].encode('utf-8')))
-        return total
-
     def _watch_queue(self):
-
+        # llama.cpp worker threads are created by this thread and inherit its affinity
+        self.budget.pin_current_thread()
         while self.is_running:
             self.processing_event.clear()
 
@@ -63,99 +110,214 @@ class LanguageProcessor:
             print("\033[33m" + f"You      : ", end="",flush=True)
                 
             text = self.input_q.get()
+            received = perf_counter()
             if self._interrupt:
                 self._interrupt=False
+            if self._retract:
+                # the user continued the previous turn, text contains it
+                self._retract = False
+                if self._turn_in_context:
+                    self.context.remove_last_turn()
 
             self.processing_event.set()
 
             if text is None:
                 self.processing_event.clear()
                 break
-            cur_ctxt_len = self._count_tokens(self.messages)
             print(text + '\033[0m\n',flush=True)
 
-            # clear history if requested
-            if text.strip().strip(".").lower() in ["clear","reset"]:
-                self.messages= self._init_messages()
-                print("Cleared conversation history")
-                # self.processing_event.clear()
+            # short commands and acknowledgements are handled without the LLM
+            intent = self.router.classify(text)
+            if intent is not Intent.LLM and self._handle_intent(intent, text):
+                self.router.record(intent, perf_counter() - received)
+                self._turn_in_context = False
                 continue
+            self.router.record(Intent.LLM)
 
-            # prepare prompt
-            # トークン数がMAX_TOKENSを超えたら古いメッセージを削除
-            while cur_ctxt_len > self.max_tokens and len(self.messages) > 1:
-                # システムプロンプト（最初の1件）は残す
-                self.messages.pop(1)
-                assert self.messages[0]["role"] == "system"
-            self.messages.append({"role": "user", "content": text+" /no_think"})
+            # prepare prompt, old messages are summarized or dropped within the budget
+            self.context.add("user", text+" /no_think")
+            self._turn_in_context = True
             
             
             # initialize
             print("\033[36m" + f"Nano-chan: ", end="",flush=True)
             assistant_response = "" # 回答全文
-            sent_response = "" # 送信済み
+            self.segmenter.reset()
+            self._sent_first = False
             think_end = False
+            first_token = None
+            speculative = "on" if self.speculative_prefill else "off"
+            prefilled, self._prefilled = self._prefilled, 0
+            n_generated = 0
+            if self.draft is not None:
+                self.draft.reset()
 
-            for chunk in self.llm.create_chat_completion(
-                messages=self.messages,
-                max_tokens=256,
-                temperature=0.7,
-                stop=["<|endoftext|>", "<|im_end|>"],
-                stream=True  # ストリーミングモードを有効にする
-                ):
-                if self._interrupt:
-                    break
-                if 'choices' in chunk and len(chunk['choices']) > 0:
-                    assistant_response_chunk = chunk['choices'][0]['delta'].get('content', '')
+            try:
+                for chunk in self._scheduled(self.backend.stream(
+                    self.context.messages,
+                    max_tokens=256,
+                    temperature=0.7,
+                    stop=["<|endoftext|>", "<|im_end|>"],
+                    )):
+                    if self._interrupt:
+                        break
+                    if not chunk.get('choices'):
+                        continue
+                    n_generated += 1
+                    assistant_response_chunk = chunk['choices'][0]['delta'].get('content') or ''
+                    if first_token is None:
+                        first_token = perf_counter() - received
+                        self.ttft[speculative].append(first_token)
+                        log.info(f"TTFT {first_token*1000:.0f}ms (speculative prefill {speculative}, "
+                                 f"{prefilled} tokens prefilled)")
                     assistant_response += assistant_response_chunk
-                    # assistant_response = assistant_response.strip()
+                    new_text = assistant_response_chunk
                     # detect end of think
                     if not think_end:
-                        if len(assistant_response)>0  and not "<think>" in assistant_response:
-                            '''in case think mode doesn't start properly'''
-                            think_end = True
                         if "</think>\n\n" in assistant_response:
                             think_end = True
                             assistant_response = ""
                             continue
-                        if len(assistant_response)>25:
-                            print(assistant_response.replace("<think>\n\n",""), end='',flush=True)
+                        if (len(assistant_response)>0 and not "<think>" in assistant_response) \
+                                or len(assistant_response)>25:
+                            '''in case think mode doesn't start properly'''
                             think_end = True
+                            new_text = assistant_response.replace("<think>\n\n","")
+                        else:
+                            continue
 
                     # after think end
-                    if think_end:
-                        print(assistant_response_chunk, end='',flush=True)
-                
-                        if len(assistant_response)>0 and \
-                            (assistant_response[-1] in ['.', '!', '?',",",'\n']\
-                              or "<|im_end|>" in assistant_response \
-                            or "<|endoftext|>" in assistant_response):
-                            section = self._remove_emoji(assistant_response).replace("*","").replace(sent_response,"").replace("<think>\n\n","")
-                            if assistant_response[-1] =="," and len(section) < 5:
-                                continue
-                            if section.strip() != "":
-                                self.output_q.put(section)
-                                sent_response += section
+                    print(new_text, end='',flush=True)
+                    for section in self.segmenter.push(new_text):
+                        self._put_section(section, received)
+            except LlmBackendError as e:
+                if not self._interrupt:
+                    log.error(f"LLM generation failed: {e}")
+                    self._interrupt = True # drop the incomplete answer like an interrupt
 
+            if first_token is not None:
+                self._record_decode(n_generated, perf_counter() - received - first_token)
             if self._interrupt:
                 print('\033[0m\n')
                 self._interrupt = False
                 self.processing_event.clear()
                 continue
             # submit remaining response
-            section = self._remove_emoji(assistant_response).replace("*","").replace(sent_response,"").replace("<think>\n\n","")
-            if len(section) > 1: # discard empty or single character responses
-                self.output_q.put(section)
+            section = self.segmenter.flush()
+            if len(section.strip()) > 1: # discard empty or single character responses
+                self._put_section(section, received)
             # アシスタントの回答も履歴に追加
-            self.messages.append({"role": "assistant", "content": self._remove_emoji(assistant_response).replace("<think>\n\n</think>\n\n","")})
+            self.context.add("assistant", remove_emoji(assistant_response).replace("<think>\n\n</think>\n\n",""))
             print('\033[0m\n')
+            # summarize old turns while the answer is played
+            self.context.compact_async()
+
+    def _handle_intent(self, intent:Intent, text:str)->bool:
+        '''answer without the LLM, False to let the LLM answer'''
+        if intent is Intent.CLEAR:
+            self.context.clear()
+            print("Cleared conversation history")
+            return True
+        if intent is Intent.ACK:
+            last = self.context.messages[-1]
+            if last["role"] == "assistant" and last["content"].rstrip().endswith("?"):
+                return False # "yes" or "no" answers a question
+            reply = self.router.ack_reply(text)
+        elif self.intent_handler is None:
+            return False
+        else:
+            reply = self.intent_handler(intent)
+        log.info(f"Intent {intent.value} handled without the LLM")
+        if reply:
+            print("\033[36m" + f"Nano-chan: {reply}" + '\033[0m\n', flush=True)
+            self.output_q.put(reply)
+        return True
+
+    def _put_section(self, section:str, received:float)->None:
+        '''send a section to TTS, record time to first TTS text of the turn'''
+        if not section.strip():
+            return
+        if not self._sent_first:
+            self._sent_first = True
+            self.first_text.append(perf_counter() - received)
+            log.info(f"Time to first TTS text {self.first_text[-1]*1000:.0f}ms: {section.strip()!r}")
+        self.output_q.put(section)
+
+    def _record_decode(self, n_generated:int, elapsed:float)->None:
+        '''log tokens/s after the first token and draft acceptance of a turn'''
+        self.decode.append((n_generated - 1, elapsed))
+        message = f"Decode {n_generated - 1} tokens in {elapsed*1000:.0f}ms"
+        if elapsed > 0:
+            message += f" ({(n_generated - 1)/elapsed:.1f} tokens/s)"
+        if self.draft is not None and self.draft.proposed:
+            self.acceptance.append(self.draft.acceptance)
+            message += (f", {self.draft.name} draft accepted {self.draft.accepted}/{self.draft.proposed} "
+                        f"({self.draft.acceptance:.0%})")
+        log.info(message)
+
+    def format_decode(self)->str:
+        '''decode speed and draft acceptance rate over turns'''
+        tokens = sum(n for n, _ in self.decode)
+        elapsed = sum(t for _, t in self.decode)
+        if not elapsed:
+            return "decode -"
+        text = f"decode {tokens/elapsed:.1f} tokens/s x{len(self.decode)}"
+        if self.draft is not None:
+            rate = f"{sum(self.acceptance)/len(self.acceptance):.0%}" if self.acceptance else "-"
+            text += f", {self.draft.name} acceptance {rate}"
+        return text
+
+    def _scheduled(self, stream:Iterator[dict])->Iterator[dict]:
+        '''yield chunks of stream, pausing between tokens while a stage of higher priority runs'''
+        with self.context.llm_turn(), self.scheduler.job("llm", Priority.NORMAL, "generation") as job:
+            while True:
+                # a sentence waiting for TTS means following tokens are beyond the next sentence
+                self.scheduler.set_priority(job, Priority.NORMAL if self.output_q.empty() else Priority.LOW)
+                self.scheduler.wait_turn(job)
+                chunk = next(stream, None)
+                if chunk is None:
+                    break
+                yield chunk
+
+    def _watch_provisional(self):
+        '''prefill prompt with the latest provisional text while waiting for the final text'''
+        while self.is_running:
+            text = self.provisional_q.get()
+            try:
+                while True: # skip stale text
+                    text = self.provisional_q.get_nowait()
+            except Empty:
+                pass
+            if text is None:
+                break
+            if not self.speculative_prefill or self.processing_event.is_set():
+                continue
+            messages = self.context.messages + [{"role": "user", "content": text}]
+            with self.context.background_llm() as cancel, \
+                    self.scheduler.job("llm", Priority.LOW, "prefill"):
+                if not cancel.is_set():
+                    self._prefilled += self.backend.prefill(messages, cancel)
+
+    def format_ttft(self)->str:
+        '''mean time to first token with speculative prefill on and off, and to first TTS text'''
+        items = {**{f"speculative {key}": v for key, v in self.ttft.items()}, "first TTS text": self.first_text}
+        return ", ".join(
+            f"{key} {sum(v)/len(v)*1000:.0f}ms x{len(v)}" if v else f"{key} -" for key, v in items.items()
+        )
 
     def interrupt(self)->None:
         '''stop generating answer and flush output queue'''
         self._interrupt = True
+        if self.processing_event.is_set():
+            self.backend.cancel() # don't wait for the next token, e.g. while a server prefills
         self._flush_queue()
         self.processing_event.clear()  
 
+    def retract(self)->None:
+        '''stop the answer and drop the turn from history, the next text continues it'''
+        self._retract = True
+        self.interrupt()
+
     def _flush_queue(self):
         with self.lock:
             while True:
@@ -169,31 +331,7 @@ class LanguageProcessor:
         self.is_running = False
         self.output_q.put(None)
         self.input_watch_thread.join()
-        del self.llm
-
-    @staticmethod
-    def _remove_emoji(text):
-            text = text[:]
-            emoji_pattern = re.compile(
-                "["
-                "\U0001F600-\U0001F64F"  # emoticons
-                "\U0001F300-\U0001F5FF"  # symbols & pictographs
-                "\U0001F680-\U0001F6FF"  # transport & map symbols
-                "\U0001F1E0-\U0001F1FF"  # flags (iOS)
-                "\U00002700-\U000027BF"  # Dingbats
-                "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
-                "\U00002600-\U000026FF"  # Misc symbols
-                "\U00002B50-\U00002B55"
-                "\U0000231A-\U0000231B"
-                "\U00002500-\U00002BEF"
-                "\U0001F700-\U0001F77F"
-                "\U0001F780-\U0001F7FF"
-                "\U0001F800-\U0001F8FF"
-                "\U0001FA70-\U0001FAFF"
-                "\U0001F018-\U0001F270"
-                "\U0001F650-\U0001F67F"
-                "]+",
-                flags=re.UNICODE
-            )
-            return emoji_pattern.sub(r'', text)
-
+        if self.provisional_q is not None:
+            self.provisional_q.put(None)
+            self.provisional_watch_thread.join()
+        self.backend.close()
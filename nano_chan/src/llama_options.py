@@ -0,0 +1,86 @@
+import json
+import logging
+import os
+from pathlib import Path
+
+import llama_cpp
+
+from nano_chan.libs.ort_utils.tuning import host_id
+
+log = logging.getLogger(__name__)
+
+# KV cache types by name, quantized types save memory (q8_0 halves f16)
+KV_CACHE_TYPES = {
+    "f32": llama_cpp.GGML_TYPE_F32,
+    "f16": llama_cpp.GGML_TYPE_F16,
+    "q8_0": llama_cpp.GGML_TYPE_Q8_0,
+    "q5_1": llama_cpp.GGML_TYPE_Q5_1,
+    "q5_0": llama_cpp.GGML_TYPE_Q5_0,
+    "q4_1": llama_cpp.GGML_TYPE_Q4_1,
+    "q4_0": llama_cpp.GGML_TYPE_Q4_0,
+}
+
+# runtime options of llama_cpp.Llama configurable and tunable
+OPTION_KEYS = ("n_batch", "n_ubatch", "n_threads", "n_threads_batch", "flash_attn",
+               "type_k", "type_v", "use_mlock", "offload_kqv")
+
+
+def tuning_file()->Path:
+    '''path to saved options, LLAMA_TUNING_FILE or weights/llama_tuning.json'''
+    return Path(os.getenv("LLAMA_TUNING_FILE", "weights/llama_tuning.json"))
+
+
+def tuning_key(model_path:str, n_ctx:int)->str:
+    '''memory and speed depend on the context length as well as the model'''
+    return f"{os.path.basename(model_path)}:{n_ctx}"
+
+
+def load_tuned(model_path:str, n_ctx:int)->dict:
+    '''options saved by tools.llama_tune for the model on this host'''
+    path = tuning_file()
+    if not path.exists():
+        return {}
+    with path.open(encoding="utf-8") as f:
+        options = json.load(f).get(host_id(), {}).get(tuning_key(model_path, n_ctx), {})
+    return {k: v for k, v in options.items() if k in OPTION_KEYS}
+
+
+def save_tuned(model_path:str, n_ctx:int, options:dict)->None:
+    '''save options (and measurements) for the model on this host'''
+    path = tuning_file()
+    data:dict = {}
+    if path.exists():
+        with path.open(encoding="utf-8") as f:
+            data = json.load(f)
+    data.setdefault(host_id(), {})[tuning_key(model_path, n_ctx)] = options
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2), encoding="utf-8")
+
+
+def llama_options(model_path:str, n_ctx:int, options:dict|None=None, budget_kwargs:dict|None=None,
+                  tuned:bool=True)->dict:
+    '''
+    kwargs of llama_cpp.Llama: tuned options, overridden by thread budget then by the config
+    Args:
+        model_path(str): gguf model
+        n_ctx(int): context length
+        options(dict): options of the config, e.g. {"flash_attn": True, "type_k": "q8_0", "type_v": "q8_0"}
+        budget_kwargs(dict): threads of StageBudget
+        tuned(bool): start from saved options, False while tuning
+    '''
+    saved = load_tuned(model_path, n_ctx) if tuned else {}
+    if saved:
+        log.debug(f"Tuned llama options for {tuning_key(model_path, n_ctx)}: {saved}")
+    merged = {**saved, **(budget_kwargs or {}), **(options or {})}
+    unknown = set(merged) - set(OPTION_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown llama options {sorted(unknown)}, expected some of {OPTION_KEYS}")
+    for key in ("type_k", "type_v"):
+        if isinstance(merged.get(key), str):
+            if merged[key] not in KV_CACHE_TYPES:
+                raise ValueError(f"Unknown KV cache type {key}={merged[key]}, expected one of {list(KV_CACHE_TYPES)}")
+            merged[key] = KV_CACHE_TYPES[merged[key]]
+    if merged.get("type_v", llama_cpp.GGML_TYPE_F16) not in (llama_cpp.GGML_TYPE_F16, llama_cpp.GGML_TYPE_F32) \
+            and not merged.get("flash_attn"):
+        raise ValueError("Quantized V cache (type_v) needs flash_attn: true")
+    return merged
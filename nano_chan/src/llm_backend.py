@@ -0,0 +1,279 @@
+import json
+import logging
+import socket
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from http.client import HTTPConnection, HTTPException, HTTPResponse, HTTPSConnection
+from threading import Event, Lock
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+from .thread_budget import StageBudget
+
+if TYPE_CHECKING:
+    from .speculative import MeasuredDraft
+
+log = logging.getLogger(__name__)
+
+
+class LlmBackendError(RuntimeError):
+    '''generation failed or was cancelled, the response is incomplete'''
+    def __init__(self, message:str, status:int|None=None):
+        super().__init__(message)
+        self.status = status # HTTP status if the server responded
+
+
+class LlmBackend(ABC):
+    '''
+    Chat model used by LanguageProcessor and ContextManager.
+    Generation is streamed as OpenAI style chat completion chunks,
+    e.g. {"choices": [{"delta": {"content": "Hi"}}]}.
+    '''
+    draft:'MeasuredDraft|None' = None # speculative decoding metrics if available
+
+    @abstractmethod
+    def count_tokens(self, text:str)->int:
+        '''number of tokens of text'''
+
+    @abstractmethod
+    def stream(self, messages:list[dict], **kwargs)->Iterator[dict]:
+        '''
+        stream chat completion chunks for messages
+        Args:
+            messages(list[dict]): chat messages
+            kwargs: sampling arguments, e.g. max_tokens, temperature, stop
+        '''
+
+    def prefill(self, messages:list[dict], cancel:Event)->int:
+        '''evaluate the prompt of a provisional turn ahead, return evaluated tokens'''
+        return 0
+
+    def cancel(self)->None:
+        '''stop generations in progress, their streams raise LlmBackendError'''
+
+    def close(self)->None:
+        pass
+
+
+class LocalLlamaBackend(LlmBackend):
+    '''
+    llama_cpp.Llama in this process, with the prompt KV cache managed by PromptState.
+
+    Args:
+        system_prompt (str): system prompt whose KV cache is snapshotted
+        model_path (str): path to gguf model file
+        n_context (int): length of context
+        use_mmap (bool): map gguf weights shared between processes (layers offloaded to GPU are copied)
+        budget (StageBudget): cores and threads for generation and prompt processing
+        prompt_state_dir (str): directory to save KV cache of system prompt, None to prefill it on every start
+        speculative (dict): kwargs for create_draft_model to enable speculative decoding
+        llama (dict): runtime options of llama_cpp.Llama (see llama_options), e.g. KV cache types
+    '''
+    def __init__(self, system_prompt:str,
+                 model_path:str="weights/Qwen3-4B-Q3_K_M.gguf",
+                 n_context:int=3200,
+                 use_mmap:bool=True,
+                 budget:StageBudget|None=None,
+                 prompt_state_dir:str|None="weights/prompt_state",
+                 speculative:dict|None=None,
+                 llama:dict|None=None):
+        # llama_cpp is imported here, HttpLlmBackend runs without llama-cpp-python
+        from llama_cpp import Llama
+
+        from .llama_options import llama_options
+        from .prompt_state import PromptState
+        from .speculative import create_draft_model
+
+        budget = budget or StageBudget("llm")
+        options = llama_options(model_path, n_context, llama, budget.llama_kwargs())
+        # llama_cpp keeps logits of all tokens to verify drafts (n_context x vocab floats)
+        self.draft = create_draft_model(**{**budget.llama_kwargs(), "n_gpu_layers": -1, "n_ctx": n_context,
+                                           **speculative}) if speculative else None
+        self.llm = Llama(
+            **options,
+            model_path=model_path,
+            n_gpu_layers=-1,
+            verbose=False,
+            n_ctx=n_context,
+            use_mmap=use_mmap,
+            draft_model=self.draft,
+        )
+        if self.draft is not None:
+            scores_mb = n_context * self.llm.n_vocab() * 4 / 2**20
+            log.warning(f"Speculative decoding keeps logits of all tokens: {n_context} x {self.llm.n_vocab()} "
+                        f"float32 scores = {scores_mb:.0f}MB more memory")
+        self.prompt = PromptState(self.llm, system_prompt, prompt_state_dir)
+
+    def count_tokens(self, text:str)->int:
+        return len(self.llm.tokenize(text.encode("utf-8"), special=True))
+
+    def stream(self, messages:list[dict], **kwargs)->Iterator[dict]:
+        return self.prompt.stream(messages, **kwargs)
+
+    def prefill(self, messages:list[dict], cancel:Event)->int:
+        return self.prompt.prefill(messages, cancel)
+
+    def close(self)->None:
+        self.llm.close()
+
+
+class HttpLlmBackend(LlmBackend):
+    '''
+    Client of an OpenAI compatible chat completion server, e.g. a llama.cpp server
+    `llama-server -m weights/Qwen3-4B-Q3_K_M.gguf -c 3000 --port 8080` shared by several NanoChan processes.
+
+    Responses are streamed as server-sent events over keep-alive connections, which are
+    pooled and reused by later requests. cancel() shuts down the connections of running
+    streams, the server stops generating when the client disconnects.
+    Token counts use the llama.cpp /tokenize endpoint, or a rough estimate if the server has none.
+
+    Args:
+        url (str): base url of the server
+        model (str): model name sent in requests
+        timeout (float): seconds to wait for a connection and each read
+        max_idle (int): idle connections kept for reuse
+        api_key (str): bearer token if the server requires one
+    '''
+    def __init__(self, url:str="http://127.0.0.1:8080",
+                 model:str="default",
+                 timeout:float=30.0,
+                 max_idle:int=4,
+                 api_key:str|None=None):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported LLM server url {url}, expected http:// or https://")
+        self._connection_class = HTTPSConnection if parts.scheme == "https" else HTTPConnection
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+
+        self._lock = Lock()
+        self._idle:list[HTTPConnection] = []        # keep-alive connections ready for reuse
+        self._streaming:set[HTTPConnection] = set() # connections of running streams
+        self._cancelled:set[HTTPConnection] = set()
+        self._tokenize = True # server has /tokenize
+
+    def _acquire(self)->tuple[HTTPConnection, bool]:
+        '''connection and whether it was reused'''
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connection_class(self.host, self.port, timeout=self.timeout), False
+
+    def _release(self, conn:HTTPConnection, reusable:bool)->None:
+        with self._lock:
+            self._streaming.discard(conn)
+            self._cancelled.discard(conn)
+            if reusable and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _request(self, path:str, body:dict)->tuple[HTTPConnection, HTTPResponse]:
+        '''POST body as json, retry once on a fresh connection if a kept-alive one was closed by the server'''
+        data = json.dumps(body).encode("utf-8")
+        while True:
+            conn, reused = self._acquire()
+            try:
+                conn.request("POST", self.base_path + path, body=data, headers=self.headers)
+                response = conn.getresponse()
+                break
+            except (OSError, HTTPException) as e:
+                conn.close()
+                if not reused:
+                    raise LlmBackendError(f"LLM server {self.host}:{self.port} unavailable: {e}") from e
+        if response.status != 200:
+            detail = response.read().decode("utf-8", "replace")[:200]
+            self._release(conn, not response.will_close)
+            raise LlmBackendError(f"LLM server returned {response.status} for {path}: {detail}", response.status)
+        return conn, response
+
+    def count_tokens(self, text:str)->int:
+        if self._tokenize:
+            try:
+                conn, response = self._request("/tokenize", {"content": text, "add_special": False})
+                try:
+                    tokens = json.loads(response.read())["tokens"]
+                except (json.JSONDecodeError, KeyError, OSError, HTTPException) as e:
+                    self._release(conn, False)
+                    raise LlmBackendError(f"Invalid /tokenize response: {e!r}") from e
+                self._release(conn, not response.will_close)
+                return len(tokens)
+            except LlmBackendError as e:
+                log.warning(f"Token count is estimated, /tokenize failed: {e}")
+                if e.status == 404:
+                    self._tokenize = False
+        return len(text.encode("utf-8")) // 4 + 1
+
+    def stream(self, messages:list[dict], **kwargs)->Iterator[dict]:
+        conn, response = self._request("/v1/chat/completions",
+                                       {"model": self.model, "messages": messages, "stream": True, **kwargs})
+        with self._lock:
+            self._streaming.add(conn)
+        done = False
+        try:
+            while True:
+                line = response.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if not line.startswith(b"data:"): # blank separator, comment or other field
+                    continue
+                data = line[5:].strip()
+                if data == b"[DONE]":
+                    response.read() # end of chunked body, keeps the connection reusable
+                    done = True
+                    break
+                chunk = json.loads(data)
+                for choice in chunk.get("choices") or []:
+                    delta = choice.get("delta")
+                    if delta is not None and delta.get("content") is None:
+                        delta["content"] = "" # llama.cpp server sends null content with the role
+                yield chunk
+        except (OSError, HTTPException, ValueError) as e:
+            if conn not in self._cancelled:
+                raise LlmBackendError(f"LLM stream failed: {e}") from e
+        finally:
+            cancelled = conn in self._cancelled
+            self._release(conn, done and not response.will_close)
+        if cancelled:
+            raise LlmBackendError("LLM stream cancelled")
+        if not done:
+            raise LlmBackendError("LLM stream ended without [DONE]")
+
+    def cancel(self)->None:
+        with self._lock:
+            running = list(self._streaming)
+            self._cancelled.update(running)
+        for conn in running:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR) # wakes up the blocked read in the streaming thread
+            except (AttributeError, OSError):
+                pass
+
+    def close(self)->None:
+        self.cancel()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def create_backend(system_prompt:str, type:str="local", **kwargs)->LlmBackend:
+    '''
+    Args:
+        system_prompt(str): system prompt
+        type(str): "local" for llama_cpp in this process, "http" for an OpenAI compatible server
+        kwargs: kwargs for LocalLlamaBackend or HttpLlmBackend
+    '''
+    if type == "local":
+        return LocalLlamaBackend(system_prompt, **kwargs)
+    if type == "http":
+        return HttpLlmBackend(**kwargs)
+    raise ValueError(f"Unknown LLM backend {type}, expected 'local' or 'http'")
@@ -0,0 +1,435 @@
+import codecs
+import ctypes
+import hashlib
+import logging
+import multiprocessing
+from collections import defaultdict
+from collections.abc import Iterator
+from pathlib import Path
+from queue import Empty, Queue
+from threading import Event, Lock, Thread
+from time import perf_counter
+
+import llama_cpp
+from llama_cpp._internals import LlamaBatch, LlamaContext, LlamaModel, LlamaSampler
+
+from .llama_options import llama_options
+from .llm_backend import LlmBackend, LlmBackendError
+from .prompt_format import _common_prefix, system_prefix
+from .prompt_state import chat_formatter
+from .thread_budget import StageBudget
+
+log = logging.getLogger(__name__)
+
+
+class _Session:
+    '''conversation state of a session id'''
+    def __init__(self, session_id:str):
+        self.id = session_id
+        self.slot:int|None = None      # KV cache sequence id
+        self.tokens:list[int] = []     # tokens in the slot, or in the saved state while evicted
+        self.saved:Path|None = None    # sequence state saved on eviction
+        self.request:_Request|None = None
+        self.last_used = perf_counter()
+        self.ttft:list[float] = []          # time to first token per turn
+        self.token_latency:list[float] = [] # mean time between tokens per turn
+
+
+class _Request:
+    '''a turn being prefilled or generated'''
+    def __init__(self, session:_Session, tokens:list[int], sampler:LlamaSampler,
+                 max_tokens:int, stop_ids:set[int]):
+        self.session = session
+        self.tokens = tokens
+        self.sampler = sampler
+        self.max_tokens = max_tokens
+        self.stop_ids = stop_ids
+        self.out:Queue = Queue() # chunks, then None or LlmBackendError
+        self.cancelled = Event()
+        self.pending:list[int] = []  # prompt tokens not evaluated yet
+        self.n_past = 0              # next position in the slot
+        self.last:int|None = None    # sampled token to evaluate next
+        self.generated = 0
+        self.submitted = perf_counter()
+        self.first:float|None = None
+        self.decoder = codecs.getincrementaldecoder("utf-8")("replace")
+
+
+class MultiSessionEngine:
+    '''
+    Serve conversations of several sessions (e.g. rooms) with one resident model.
+
+    The context is shared by n_slots KV cache sequences. A session with a recent turn owns
+    a sequence (slot), and each turn prefills only the prompt tokens after those already in
+    its slot. The system prompt is evaluated once into its own sequence and copied into new
+    slots. One loop puts the next token of every generating session and prefill chunks of
+    new turns into the same batch, so all sessions share each forward pass.
+    When every slot is taken, or a session is idle for idle_sec, its sequence is saved to
+    state_dir and removed from the KV cache. The next turn of the session restores it, or
+    prefills the prompt again if state_dir is None.
+
+    Args:
+        system_prompt (str): system prompt shared by the sessions
+        model_path (str): path to gguf model file
+        n_context (int): length of context per session, longer prompts are rejected and generation stops at it
+        n_slots (int): sessions kept in the KV cache at once
+        n_batch (int): tokens evaluated per forward pass
+        use_mmap (bool): map gguf weights shared between processes
+        budget (StageBudget): cores and threads for the decode loop
+        state_dir (str): directory for sequences of evicted sessions, None to drop them
+        idle_sec (float): evict sessions idle longer than this
+        llama (dict): runtime options (see llama_options), e.g. quantized KV cache for more sessions
+    '''
+    def __init__(self, system_prompt:str,
+                 model_path:str="weights/Qwen3-4B-Q3_K_M.gguf",
+                 n_context:int=3200,
+                 n_slots:int=4,
+                 n_batch:int=512,
+                 use_mmap:bool=True,
+                 budget:StageBudget|None=None,
+                 state_dir:str|None="weights/session_state",
+                 idle_sec:float=120.0,
+                 llama:dict|None=None):
+        self.budget = budget or StageBudget("llm")
+        options = llama_options(model_path, n_context * n_slots, llama, self.budget.llama_kwargs())
+        n_batch = options.get("n_batch", n_batch)
+        if n_batch < n_slots:
+            raise ValueError(f"n_batch ({n_batch}) must be at least n_slots ({n_slots})")
+        self.n_context = n_context
+        self.n_slots = n_slots
+        self.n_batch = n_batch
+        self.state_dir = Path(state_dir) if state_dir else None
+        self.idle_sec = idle_sec
+
+        model_params = llama_cpp.llama_model_default_params()
+        model_params.n_gpu_layers = 0x7FFFFFFF # all layers
+        model_params.use_mmap = use_mmap
+        model_params.use_mlock = options.get("use_mlock", False)
+        self.model = LlamaModel(path_model=model_path, params=model_params, verbose=False)
+        ctx_params = llama_cpp.llama_context_default_params()
+        ctx_params.n_ctx = n_context * n_slots
+        ctx_params.n_batch = n_batch
+        ctx_params.n_ubatch = min(n_batch, options.get("n_ubatch", n_batch))
+        ctx_params.n_seq_max = n_slots + 1 # and the system prompt sequence
+        ctx_params.n_threads = options.get("n_threads", max(multiprocessing.cpu_count() // 2, 1))
+        ctx_params.n_threads_batch = options.get("n_threads_batch", multiprocessing.cpu_count())
+        for key in ("flash_attn", "type_k", "type_v", "offload_kqv"):
+            if key in options:
+                setattr(ctx_params, key, options[key])
+        self.ctx = LlamaContext(model=self.model, params=ctx_params, verbose=False)
+        self.batch = LlamaBatch(n_tokens=n_batch, embd=0, n_seq_max=1, verbose=False)
+
+        self.formatter = chat_formatter(self.model)
+        self.system_seq = n_slots
+        self.prefix = system_prefix(self.render, system_prompt)
+        self._evaluate_prefix()
+
+        self.lock = Lock() # guards sessions and slots
+        self.sessions:dict[str, _Session] = {}
+        self.free_slots = list(range(n_slots))
+        self.inbox:Queue = Queue()
+        self._waiting:list[_Request] = [] # requests without a slot
+        self._active:list[_Request] = []
+        # generated tokens and time of decode-only passes by number of generating sessions
+        self.throughput:dict[int, list[float]] = defaultdict(lambda: [0, 0.0])
+        self.prefill_stats = [0, 0.0] # prompt tokens and time of passes with prefill chunks
+
+        self.is_running = True
+        self.thread = Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def render(self, messages:list[dict])->list[int]:
+        '''prompt tokens of messages followed by the assistant generation prompt'''
+        prompt = self.formatter(messages=messages).prompt
+        return self.model.tokenize(prompt.encode("utf-8"), add_bos=False, special=True)
+
+    def _evaluate_prefix(self)->None:
+        start = perf_counter()
+        for i in range(0, len(self.prefix), self.n_batch):
+            self.batch.reset()
+            for j, token in enumerate(self.prefix[i:i + self.n_batch]):
+                self._add(token, i + j, self.system_seq, False)
+            self.ctx.decode(self.batch)
+        log.info(f"System prompt prefilled: {len(self.prefix)} tokens in {(perf_counter() - start)*1000:.0f}ms")
+
+    def session(self, session_id:str)->"SessionBackend":
+        '''backend of a session for LanguageProcessor and ContextManager'''
+        return SessionBackend(self, session_id)
+
+    def submit(self, session_id:str, messages:list[dict], max_tokens:int=256, temperature:float=0.7,
+               top_p:float=0.95, top_k:int=40, min_p:float=0.05, stop:list[str]|None=None)->_Request:
+        '''queue a turn of a session, chunks are put in the out queue of the returned request'''
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = self.sessions[session_id] = _Session(session_id)
+        sampler = LlamaSampler()
+        if temperature <= 0:
+            sampler.add_greedy()
+        else:
+            sampler.add_top_k(top_k)
+            sampler.add_top_p(top_p, 1)
+            sampler.add_min_p(min_p, 1)
+            sampler.add_temp(temperature)
+            sampler.add_dist(llama_cpp.LLAMA_DEFAULT_SEED)
+        # single token stop strings like <|im_end|>, others are end of generation tokens anyway
+        stop_ids = set()
+        for text in stop or []:
+            ids = self.model.tokenize(text.encode("utf-8"), add_bos=False, special=True)
+            if len(ids) == 1:
+                stop_ids.add(ids[0])
+        tokens = self.render(messages)
+        if len(tokens) >= self.n_context:
+            sampler.close()
+            # the slot of the session holds n_context tokens, more would take cells of other slots
+            raise LlmBackendError(f"Prompt of {len(tokens)} tokens exceeds the session context ({self.n_context})")
+        request = _Request(session, tokens, sampler, max_tokens, stop_ids)
+        self.inbox.put(request)
+        return request
+
+    def _add(self, token:int, pos:int, seq:int, logits:bool)->int:
+        '''append a token to the batch, return its index'''
+        batch = self.batch.batch
+        i = batch.n_tokens
+        batch.token[i] = token
+        batch.pos[i] = pos
+        batch.seq_id[i][0] = seq
+        batch.n_seq_id[i] = 1
+        batch.logits[i] = logits
+        batch.n_tokens += 1
+        return i
+
+    def _loop(self)->None:
+        # llama.cpp worker threads are created by this thread and inherit its affinity
+        self.budget.pin_current_thread()
+        while self.is_running:
+            try:
+                while True: # wait for a request only when there is nothing to decode
+                    if self._active or self._waiting:
+                        request = self.inbox.get_nowait()
+                    else:
+                        request = self.inbox.get(timeout=1.0)
+                    if request is None:
+                        return
+                    self._waiting.append(request)
+            except Empty:
+                pass
+            self._evict_idle()
+            self._assign_slots()
+            if self._active:
+                self._step()
+
+    def _assign_slots(self)->None:
+        for request in list(self._waiting):
+            if request.cancelled.is_set():
+                self._waiting.remove(request)
+                request.sampler.close()
+                request.out.put(LlmBackendError("LLM stream cancelled"))
+                continue
+            session = request.session
+            if session.request is not None: # previous turn not finished yet
+                continue
+            if session.slot is None:
+                with self.lock:
+                    if not self.free_slots:
+                        idle = [s for s in self.sessions.values() if s.slot is not None and s.request is None]
+                        if not idle:
+                            continue # all slots are generating, wait
+                        self._evict(min(idle, key=lambda s: s.last_used))
+                    session.slot = self.free_slots.pop(0)
+                self._restore(session)
+            # reuse the matching prefix, the last prompt token is always evaluated for its logits
+            reused = min(_common_prefix(session.tokens, request.tokens), len(request.tokens) - 1)
+            self.ctx.kv_cache_seq_rm(session.slot, reused, -1)
+            session.tokens = request.tokens[:reused]
+            request.n_past = reused
+            request.pending = request.tokens[reused:]
+            session.request = request
+            self._waiting.remove(request)
+            self._active.append(request)
+            log.debug(f"Session {session.id}: prefill {len(request.pending)} of {len(request.tokens)} prompt tokens")
+
+    def _step(self)->None:
+        '''one forward pass for the next token of generating sessions and prefill chunks'''
+        self.batch.reset()
+        entries:list[tuple[_Request, int]] = []
+        for request in list(self._active):
+            if request.cancelled.is_set():
+                self._finish(request, LlmBackendError("LLM stream cancelled"))
+            elif request.last is not None:
+                entries.append((request, self._add(request.last, request.n_past, request.session.slot, True)))
+                request.session.tokens.append(request.last)
+                request.n_past += 1
+        generating = len(entries)
+        room = self.n_batch - generating
+        prefill = 0
+        for request in self._active:
+            if not request.pending or room <= 0:
+                continue
+            chunk, request.pending = request.pending[:room], request.pending[room:]
+            for j, token in enumerate(chunk):
+                index = self._add(token, request.n_past + j, request.session.slot,
+                                  not request.pending and j == len(chunk) - 1)
+            request.session.tokens.extend(chunk)
+            request.n_past += len(chunk)
+            room -= len(chunk)
+            prefill += len(chunk)
+            if not request.pending:
+                entries.append((request, index))
+        if self.batch.n_tokens() == 0:
+            return
+
+        start = perf_counter()
+        try:
+            self.ctx.decode(self.batch)
+        except RuntimeError as e: # e.g. KV cache full
+            log.error(f"Multi-session decode failed: {e}")
+            for request in list(self._active):
+                self.ctx.kv_cache_seq_rm(request.session.slot, len(self.prefix), -1)
+                request.session.tokens = self.prefix[:]
+                self._finish(request, LlmBackendError(f"LLM decode failed: {e}"))
+            return
+        # passes with prefill chunks would slow down decode throughput, their generated tokens are not counted
+        stats = self.prefill_stats if prefill else self.throughput[generating]
+        stats[0] += prefill or generating
+        stats[1] += perf_counter() - start
+        for request, index in entries:
+            self._emit(request, request.sampler.sample(self.ctx, index))
+
+    def _emit(self, request:_Request, token:int)->None:
+        now = perf_counter()
+        if request.first is None:
+            request.first = now
+            request.session.ttft.append(now - request.submitted)
+        if llama_cpp.llama_vocab_is_eog(self.model.vocab, token) or token in request.stop_ids:
+            self._finish(request)
+            return
+        text = request.decoder.decode(self.model.token_to_piece(token))
+        if text:
+            request.out.put({"choices": [{"delta": {"content": text}}]})
+        request.last = token
+        request.generated += 1
+        # the next position would be past the n_context cells of the session
+        if request.generated >= request.max_tokens or request.n_past >= self.n_context:
+            self._finish(request)
+
+    def _finish(self, request:_Request, error:LlmBackendError|None=None)->None:
+        session = request.session
+        if request.first is not None and request.generated > 1:
+            session.token_latency.append((perf_counter() - request.first) / (request.generated - 1))
+        request.sampler.close()
+        self._active.remove(request)
+        with self.lock:
+            session.request = None
+            session.last_used = perf_counter()
+        request.out.put(error)
+
+    def _state_path(self, session:_Session)->Path:
+        return self.state_dir / f"{hashlib.sha1(session.id.encode()).hexdigest()[:16]}.bin"
+
+    def _evict(self, session:_Session)->None:
+        '''save the sequence of a session and free its slot (called with lock held)'''
+        start = perf_counter()
+        if self.state_dir is not None:
+            path = self._state_path(session)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tokens = (llama_cpp.llama_token * len(session.tokens))(*session.tokens)
+            if llama_cpp.llama_state_seq_save_file(self.ctx.ctx, str(path).encode(), session.slot,
+                                                   tokens, len(session.tokens)):
+                session.saved = path
+        if session.saved is None:
+            session.tokens = []
+        self.ctx.kv_cache_seq_rm(session.slot, -1, -1)
+        self.free_slots.append(session.slot)
+        log.info(f"Session {session.id} evicted: {len(session.tokens)} tokens "
+                 f"{'saved' if session.saved else 'dropped'} in {(perf_counter() - start)*1000:.0f}ms")
+        session.slot = None
+
+    def _restore(self, session:_Session)->None:
+        '''fill the new slot of a session with its saved sequence or the system prompt'''
+        start = perf_counter()
+        path, session.saved = session.saved, None
+        if path is not None and path.exists():
+            tokens = (llama_cpp.llama_token * self.n_context)()
+            n_tokens = ctypes.c_size_t(0)
+            loaded = llama_cpp.llama_state_seq_load_file(self.ctx.ctx, str(path).encode(), session.slot,
+                                                         tokens, self.n_context, ctypes.byref(n_tokens))
+            path.unlink()
+            if loaded:
+                session.tokens = list(tokens[:n_tokens.value])
+                log.info(f"Session {session.id} restored: {n_tokens.value} tokens "
+                         f"in {(perf_counter() - start)*1000:.0f}ms")
+                return
+            log.warning(f"Failed to restore session {session.id}, prefilling again")
+        self.ctx.kv_cache_seq_cp(self.system_seq, session.slot, 0, len(self.prefix))
+        session.tokens = self.prefix[:]
+
+    def _evict_idle(self)->None:
+        now = perf_counter()
+        with self.lock:
+            for session in self.sessions.values():
+                if session.slot is not None and session.request is None and now - session.last_used > self.idle_sec:
+                    self._evict(session)
+
+    def format_stats(self)->str:
+        '''aggregate decode tokens/s by number of generating sessions, prefill tokens/s, latency per session'''
+        lines = []
+        for n, (tokens, elapsed) in sorted(self.throughput.items()):
+            if elapsed:
+                lines.append(f"{n} sessions: {tokens/elapsed:.1f} tokens/s aggregate ({tokens:.0f} tokens)")
+        tokens, elapsed = self.prefill_stats
+        if elapsed:
+            lines.append(f"prefill: {tokens/elapsed:.1f} tokens/s ({tokens:.0f} tokens, with decode of other sessions)")
+        with self.lock:
+            sessions = list(self.sessions.values())
+        for s in sessions:
+            ttft = f"{sum(s.ttft)/len(s.ttft)*1000:.0f}ms" if s.ttft else "-"
+            latency = f"{sum(s.token_latency)/len(s.token_latency)*1000:.0f}ms" if s.token_latency else "-"
+            state = "in KV cache" if s.slot is not None else "evicted"
+            lines.append(f"session {s.id}: TTFT {ttft}, {latency}/token x{len(s.ttft)} turns, {state}")
+        return "\n".join(lines) or "no turns yet"
+
+    def close(self)->None:
+        self.is_running = False
+        self.inbox.put(None)
+        self.thread.join()
+        for request in self._waiting + self._active:
+            request.out.put(LlmBackendError("LLM engine closed"))
+        self.batch.close()
+        self.ctx.close()
+        self.model.close()
+
+
+class SessionBackend(LlmBackend):
+    '''
+    Backend of one session of a MultiSessionEngine, so that a LanguageProcessor per room
+    shares the model, e.g. `LanguageProcessor(q, system_prompt, backend=engine.session("room1"))`.
+
+    Args:
+        engine (MultiSessionEngine): shared engine
+        session_id (str): conversation key
+    '''
+    def __init__(self, engine:MultiSessionEngine, session_id:str):
+        self.engine = engine
+        self.session_id = session_id
+        self._request:_Request|None = None
+
+    def count_tokens(self, text:str)->int:
+        return len(self.engine.model.tokenize(text.encode("utf-8"), add_bos=False, special=True))
+
+    def stream(self, messages:list[dict], **kwargs)->Iterator[dict]:
+        request = self._request = self.engine.submit(self.session_id, messages, **kwargs)
+        try:
+            while True:
+                chunk = request.out.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, LlmBackendError):
+                    raise chunk
+                yield chunk
+        finally:
+            request.cancelled.set() # no-op if finished, stops generation if the consumer stopped reading
+
+    def cancel(self)->None:
+        if self._request is not None:
+            self._request.cancelled.set()
@@ -1,14 +1,25 @@
+import logging
+import os
 import subprocess
 from threading import Thread
-from time import sleep
+from time import sleep, time
 
 import yaml
 
+from nano_chan.libs.ort_utils import profiler
+
 from .voice_capture import VoiceCapture
 from .transcriber import Transcriber
 from .language_processor import LanguageProcessor
 from .voice_generator import VoiceGenerator
 from .voice_player import VoicePlayer
+from .utils import format_memory_usage
+from .thread_budget import ThreadBudget
+from .scheduler import StageScheduler
+from .intent_router import Intent, IntentRouter
+from .turn_aggregator import TurnAggregator
+
+log = logging.getLogger(__name__)
 
 class NanoChan:
     '''
@@ -19,17 +30,44 @@ class NanoChan:
 
     '''
     def __init__(self,config_path:str='configs/config.yaml'):
+        self.config_path = config_path
+        self._config_mtime = os.path.getmtime(config_path)
+        self._config_error = "" # last error reading the edited config, logged once
         conf = self._load_config(config_path)
+        self._apply_profiling(conf.get("Profiling"))
         # self._turn_on_jetson_clock()
-        self.voice_cap = VoiceCapture(**conf["VoiceCapture"])
+        self.thread_budget = ThreadBudget(**(conf.get("ThreadBudget") or {}))
+        self.scheduler = StageScheduler(**(conf.get("Scheduler") or {}))
+        self.intent_router = IntentRouter(**(conf.get("IntentRouter") or {"enabled": False}))
+        self.voice_cap = VoiceCapture(**conf["VoiceCapture"],
+                                      budget=self.thread_budget.stage("audio"))
         self.transcriber = Transcriber(self.voice_cap.output_q,
-                                       **conf["Transcriber"])
-        self.lang_processor = LanguageProcessor(self.transcriber.output_q,
-                                               **conf["LanguageProcessor"])
+                                       **conf["Transcriber"],
+                                       budget=self.thread_budget.stage("asr"),
+                                       scheduler=self.scheduler,
+                                       partial_q=self.voice_cap.partial_q,
+                                       router=self.intent_router)
+        self.aggregator = TurnAggregator(self.transcriber.output_q,
+                                         **(conf.get("TurnAggregator") or {"enabled": False}),
+                                         answer_pending=self._answer_pending,
+                                         cancel_turn=self._cancel_turn)
+        self.transcriber.followup = self.aggregator.accepts_followup
+        self.lang_processor = LanguageProcessor(self.aggregator.output_q,
+                                               **conf["LanguageProcessor"],
+                                               budget=self.thread_budget.stage("llm"),
+                                               scheduler=self.scheduler,
+                                               provisional_q=self.transcriber.provisional_q,
+                                               router=self.intent_router,
+                                               intent_handler=self._handle_intent)
         self.voice_gen = VoiceGenerator(self.lang_processor.output_q,
-                                        **conf["VoiceGenerator"])
+                                        **conf["VoiceGenerator"],
+                                        budget=self.thread_budget.stage("tts"),
+                                        scheduler=self.scheduler,
+                                        sample_rate=conf["VoicePlayer"].get("sample_rate", 48000))
         self.player = VoicePlayer(self.voice_gen.output_q,
-                                  **conf["VoicePlayer"])
+                                  **conf["VoicePlayer"],
+                                  budget=self.thread_budget.stage("audio"))
+        print(f"Models loaded: {format_memory_usage()}")
     
     def _load_config(self,path:str):
         '''load config from yaml file
@@ -40,6 +78,71 @@ class NanoChan:
             conf = yaml.safe_load(f)
         return conf
     
+    def _apply_profiling(self, conf:dict|None):
+        '''switch ONNX Runtime profiling by "Profiling" section of config
+        Args:
+            conf(dict): {"enabled": bool, "output_dir": str}
+        '''
+        conf = conf or {}
+        report = profiler.set_enabled(bool(conf.get("enabled", False)),
+                                      conf.get("output_dir", "profiles"))
+        if report:
+            print(f"Profile report: {report}")
+
+    def _watch_config(self):
+        '''apply runtime switchable keys when config file is edited
+        a file missing during an atomic save or an invalid edit keeps the current settings until the next poll
+        '''
+        try:
+            mtime = os.path.getmtime(self.config_path)
+            if mtime == self._config_mtime:
+                return
+            conf = self._load_config(self.config_path)
+            profiling = conf.get("Profiling")
+            scheduler = bool((conf.get("Scheduler") or {}).get("enabled", True))
+            speculative_prefill = bool(conf["LanguageProcessor"].get("speculative_prefill", False))
+            router = bool((conf.get("IntentRouter") or {}).get("enabled", False))
+            aggregator = bool((conf.get("TurnAggregator") or {}).get("enabled", False))
+        except (OSError, yaml.YAMLError, KeyError, AttributeError, TypeError) as e:
+            if repr(e) != self._config_error:
+                self._config_error = repr(e)
+                log.warning(f"Config {self.config_path} not applied, keeping current settings: {e!r}")
+            return
+        self._config_mtime, self._config_error = mtime, ""
+        self._apply_profiling(profiling)
+        self.scheduler.enabled = scheduler
+        self.lang_processor.speculative_prefill = speculative_prefill
+        self.intent_router.enabled = router
+        self.aggregator.enabled = aggregator
+
+    def _handle_intent(self, intent:Intent)->str|None:
+        '''apply a control intent of the user, return the reply to speak'''
+        if intent is Intent.REPEAT:
+            return None if self.player.replay() else "I haven't said anything yet."
+        if intent in (Intent.SLOWER, Intent.FASTER):
+            factor = 0.85 if intent is Intent.SLOWER else 1.15
+            self.voice_gen.speed = round(min(max(self.voice_gen.speed * factor, 0.5), 2.0), 2)
+            return f"Okay, I will speak {intent.value}."
+        if intent is Intent.VOICE:
+            # Kokoro voice names start with the language, e.g. af_heart is American English
+            voices = self.intent_router.voices or [
+                v for v in self.voice_gen.kokoro.get_voices() if v[0] == self.voice_gen.voice[0]]
+            index = voices.index(self.voice_gen.voice) + 1 if self.voice_gen.voice in voices else 0
+            self.voice_gen.voice = voices[index % len(voices)]
+            return "Okay, this is my new voice."
+        return None # stop, the answer is interrupted by Transcriber while speaking
+
+    def _answer_pending(self)->bool:
+        '''an answer is being prepared and nothing is played yet'''
+        return (self.lang_processor.processing_event.is_set() or self.voice_gen.generate_event.is_set()) \
+            and self.voice_gen.output_q.empty() and not self.player.playing_event.is_set()
+
+    def _cancel_turn(self)->None:
+        '''the user continued talking after a pause, drop the answer to the first part'''
+        self.lang_processor.retract()
+        self.voice_gen.interrupt()
+        self.player.interrupt()
+
     def _turn_on_jetson_clock(self):
         '''turn on jetson_clocks to unlimit CPU and GPU'''
         try:
@@ -58,6 +161,7 @@ class NanoChan:
 
         self.voice_cap.start()
         self.transcriber.start()
+        self.aggregator.start()
         self.lang_processor.start()
         self.voice_gen.start()
         self.player.start()
@@ -68,11 +172,19 @@ class NanoChan:
                 self._quit = True
             if text == 's':
                 self._show_state()
+            if text == 'p':
+                self._apply_profiling({"enabled": not profiler.enabled,
+                                       "output_dir": profiler.output_dir})
+                print(f"Profiling {'started' if profiler.enabled else 'stopped'}")
         self.close()
 
     def _switch_flag(self):
         '''toggle voice input availability by audio playing state'''
+        config_checked = time()
         while not self._quit:
+            if time() - config_checked > 1.0:
+                config_checked = time()
+                self._watch_config()
             
             # while processing or playing
             if (self.player.playing_event.is_set() \
@@ -127,13 +239,27 @@ class NanoChan:
         print(f"{self.lang_processor.processing_event.is_set()=}")
         print(f"{self.lang_processor.output_q.qsize()=}")
         print(f"{self.lang_processor.input_watch_thread.is_alive()=}")
+        print(f"{self.lang_processor.speculative_prefill=}")
+        print(f"TTFT: {self.lang_processor.format_ttft()}")
+        print(f"Decode: {self.lang_processor.format_decode()}")
+        print(f"Turns: {self.aggregator.format_stats()}")
+        print(f"Intents: {self.intent_router.format_stats(self.lang_processor.first_text)}")
         print("VoiceGenerator")
         print(f"{self.voice_gen._interrupt=}")
         print(f"{self.voice_gen.generate_event.is_set()=}")
         print(f"{self.voice_gen.output_q.qsize()=}")
         print(f"{self.voice_gen.input_watch_thread.is_alive()=}")
+        print(f"{self.voice_gen.batched=}")
+        print(f"Resample: {self.voice_gen.format_resample()}")
+        print(f"Lexicon: {self.voice_gen.format_lexicon()}")
         print("- VoicePlayer")
         print(f"{self.player.playing_event.is_set()=}")
+        print("- Memory")
+        print(format_memory_usage())
+        print("- CPU contention since last check")
+        print(self.thread_budget.format_contention())
+        print("- Stage scheduler")
+        print(self.scheduler.format_stats())
 
     def close(self):
         '''Stop all modules and close app'''
@@ -144,8 +270,12 @@ class NanoChan:
         self.voice_cap.close()
         print(".",end="")
         self.transcriber.close()
+        self.aggregator.close()
         print(".",end="")
         self.lang_processor.close()
         print(".",end="")
+        self.voice_gen.close() # learned lexicon words are saved
+        print(".",end="")
         self.player.close()
+        self._apply_profiling(None)
         print("Closed")
@@ -0,0 +1,21 @@
+from collections.abc import Callable
+
+SUMMARY_HEADER = "\n\nSummary of the earlier conversation: " # appended to system prompt by ContextManager
+
+
+def _common_prefix(a:list[int], b:list[int])->int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def system_prefix(render:Callable[[list[dict]], list[int]], system_prompt:str)->list[int]:
+    '''tokens shared by every prompt whatever the history or summary is'''
+    plain = render([{"role": "system", "content": system_prompt},
+                    {"role": "user", "content": "a"}])
+    summarized = render([{"role": "system", "content": system_prompt + SUMMARY_HEADER + "b"},
+                         {"role": "user", "content": "c"}])
+    return plain[:_common_prefix(plain, summarized)]
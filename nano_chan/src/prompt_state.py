@@ -0,0 +1,172 @@
+import hashlib
+import logging
+import os
+from collections.abc import Iterator
+from pathlib import Path
+from threading import Event
+from time import perf_counter
+
+import numpy as np
+from llama_cpp import Llama, LlamaState
+from llama_cpp._internals import LlamaModel
+from llama_cpp.llama_chat_format import Jinja2ChatFormatter
+
+from .prompt_format import _common_prefix, system_prefix
+
+log = logging.getLogger(__name__)
+
+
+def chat_formatter(model:LlamaModel)->Jinja2ChatFormatter:
+    '''formatter of the chat template in GGUF metadata'''
+    template = model.metadata().get("tokenizer.chat_template")
+    if template is None:
+        raise ValueError("GGUF model has no chat template (tokenizer.chat_template)")
+    eos_id, bos_id = model.token_eos(), model.token_bos()
+    return Jinja2ChatFormatter(
+        template,
+        eos_token=model.token_get_text(eos_id) if eos_id != -1 else "",
+        bos_token=model.token_get_text(bos_id) if bos_id != -1 else "",
+        stop_token_ids=[eos_id],
+    )
+
+
+class PromptState:
+    '''
+    Render chat prompts with the GGUF chat template and manage the KV cache explicitly.
+
+    The system prompt prefix is evaluated once and its state is snapshotted with
+    save_state. Whenever the KV cache no longer starts with it (history cleared,
+    old turns summarized, summary generated with the same model), the snapshot
+    is restored with load_state, so only the rest of the prompt is prefilled.
+    The snapshot is saved to state_dir, keyed by model, context size and
+    system prompt, so a restart skips system prompt prefill too.
+
+    Args:
+        llm (Llama): model
+        system_prompt (str): system prompt
+        state_dir (str): directory to persist the snapshot, None to keep it in memory only
+    '''
+    def __init__(self, llm:Llama, system_prompt:str, state_dir:str|None="weights/prompt_state"):
+        self.llm = llm
+        self.system_prompt = system_prompt
+        self.formatter = chat_formatter(llm._model)
+        self.prefix = system_prefix(self.render, system_prompt)
+        self.state_path = Path(state_dir, f"{self._key()}.npz") if state_dir else None
+        self.state = self._load() or self._evaluate_prefix()
+
+    def render(self, messages:list[dict])->list[int]:
+        '''prompt tokens of messages followed by the assistant generation prompt'''
+        prompt = self.formatter(messages=messages).prompt
+        return self.llm.tokenize(prompt.encode("utf-8"), add_bos=False, special=True)
+
+    def _key(self)->str:
+        model_path = self.llm.model_path
+        stat = os.stat(model_path)
+        key = f"{os.path.abspath(model_path)}:{stat.st_size}:{stat.st_mtime_ns}:{self.llm.n_ctx()}:{self.prefix}"
+        return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+    def _load(self)->LlamaState|None:
+        if self.state_path is None or not self.state_path.exists():
+            return None
+        try:
+            data = np.load(self.state_path)
+            n_tokens = int(data["n_tokens"])
+            # load_state replaces llm.input_ids, which eval writes up to n_ctx
+            input_ids = np.zeros(self.llm.n_ctx(), np.intc)
+            input_ids[:n_tokens] = data["input_ids"][:n_tokens]
+            state = LlamaState(
+                input_ids=input_ids,
+                scores=self._no_scores(),
+                n_tokens=n_tokens,
+                llama_state=data["llama_state"].tobytes(),
+                llama_state_size=len(data["llama_state"]),
+                seed=int(data["seed"]),
+            )
+            if list(state.input_ids[:state.n_tokens]) != self.prefix:
+                return None
+            start = perf_counter()
+            self.llm.load_state(state)
+        except Exception as e: # corrupted or from another llama.cpp version
+            log.warning(f"Failed to load prompt state {self.state_path}: {e}")
+            return None
+        log.info(f"System prompt state loaded: {len(self.prefix)} tokens in {(perf_counter() - start)*1000:.0f}ms")
+        return state
+
+    def _no_scores(self)->np.ndarray:
+        '''
+        logits of the prefix are not used, the last prompt token is always evaluated,
+        one zero row broadcasts over them in load_state instead of prefix x vocab floats
+        '''
+        return np.zeros((1, self.llm.n_vocab()), np.single)
+
+    def _evaluate_prefix(self)->LlamaState:
+        start = perf_counter()
+        self.llm.reset()
+        self.llm.eval(self.prefix)
+        state = self.llm.save_state()
+        state.scores = self._no_scores() # drop the copy of prefix logits kept for restores
+        log.info(f"System prompt prefilled: {len(self.prefix)} tokens in {(perf_counter() - start)*1000:.0f}ms")
+        if self.state_path is not None:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            np.savez(self.state_path,
+                     input_ids=state.input_ids[:state.n_tokens], n_tokens=state.n_tokens,
+                     llama_state=np.frombuffer(state.llama_state, np.uint8), seed=state.seed)
+        return state
+
+    def prefill(self, messages:list[dict], cancel:Event, chunk_tokens:int=32)->int:
+        '''
+        Speculatively evaluate the prompt of a turn whose last user message is provisional.
+        Tokens after the provisional text and its last token (a word may still grow) are
+        not evaluated. The final prompt reuses the matching prefix in stream(), tokens
+        after the divergence point are dropped from the KV cache (rollback).
+
+        Args:
+            messages(list[dict]): chat messages, the last one is the provisional user text
+            cancel(Event): stop between chunks when set
+            chunk_tokens(int): tokens evaluated at once
+        Returns:
+            number of tokens evaluated
+        '''
+        history, text = messages[:-1], messages[-1]["content"]
+        a = self.render(history + [{"role": "user", "content": text + " a"}])
+        b = self.render(history + [{"role": "user", "content": text + " b"}])
+        tokens = a[:_common_prefix(a, b) - 1]
+        reused = self._prepare(tokens + [-1])
+        self.llm.n_tokens = reused # roll back tokens after the divergence point
+        evaluated = 0
+        for i in range(reused, len(tokens), chunk_tokens):
+            if cancel.is_set():
+                break
+            self.llm.eval(tokens[i:i + chunk_tokens])
+            evaluated += len(tokens[i:i + chunk_tokens])
+        log.debug(f"Speculative prefill {evaluated} tokens (reused {reused})")
+        return evaluated
+
+    def _prepare(self, tokens:list[int])->int:
+        '''restore system prompt state if the KV cache diverged before its end, return reused tokens'''
+        # llama.generate always evaluates the last prompt token
+        reused = _common_prefix(self.llm._input_ids.tolist(), tokens[:-1])
+        if reused < len(self.prefix) and tokens[:len(self.prefix)] == self.prefix:
+            self.llm.load_state(self.state)
+            reused = len(self.prefix)
+        return reused
+
+    def stream(self, messages:list[dict], **kwargs)->Iterator[dict]:
+        '''
+        stream chat completion chunks for messages, evaluating only the tokens not in KV cache
+        Args:
+            messages(list[dict]): chat messages
+            kwargs: arguments of Llama.create_completion, e.g. max_tokens, temperature, stop
+        '''
+        result = self.formatter(messages=messages)
+        tokens = self.llm.tokenize(result.prompt.encode("utf-8"), add_bos=False, special=True)
+        reused = self._prepare(tokens)
+        start = perf_counter()
+        first = True
+        for chunk in self.llm.create_completion(prompt=tokens, stream=True,
+                                                stopping_criteria=result.stopping_criteria, **kwargs):
+            if first:
+                first = False
+                log.info(f"Prefill {len(tokens) - reused} of {len(tokens)} prompt tokens "
+                         f"(reused {reused}), first token in {(perf_counter() - start)*1000:.0f}ms")
+            yield {"choices": [{"delta": {"content": chunk["choices"][0]["text"]}}]}
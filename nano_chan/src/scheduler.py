@@ -0,0 +1,159 @@
+import logging
+from collections import defaultdict
+from collections.abc import Iterator
+from contextlib import contextmanager
+from enum import IntEnum
+from threading import Condition
+from time import perf_counter
+
+log = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    '''rank of work by its effect on perceived latency'''
+    LOW = 0      # e.g. LLM tokens beyond the next sentence
+    NORMAL = 1   # e.g. LLM tokens of the next sentence, TTS while audio is still playing
+    CRITICAL = 2 # e.g. first TTS chunk of a turn, interrupt detection
+
+
+class Job:
+    '''work of a stage registered in StageScheduler, change priority by StageScheduler.set_priority'''
+    def __init__(self, stage:str, priority:Priority, label:str):
+        self.stage = stage
+        self.priority = priority
+        self.label = label
+        self.start = perf_counter()
+        self.paused = 0.0                         # sec this job waited for higher priority jobs
+        self.yielded:defaultdict[str, float] = defaultdict(float) # sec other stages waited for this job
+        self.overlapped:set[str] = set()          # lower priority stages running at the same time
+        self.waiting_for:dict[Job, float] = {}    # blocking jobs and when they started to block, while paused
+
+
+class StageScheduler:
+    '''
+    Rank concurrent work of pipeline stages and throttle lower priority stages.
+
+    Stages register their work with `job()`. Lower priority stages call
+    `wait_turn()` at safe points (e.g. LanguageProcessor between tokens) and are
+    paused while a job of higher priority is running, at most max_pause_ms.
+    ORT intra-op thread pools are fixed when a session is created, so ORT stages
+    are throttled only at their boundaries.
+
+    Latency of each higher priority job is recorded by how it ran:
+        alone     : no lower priority stage was running
+        throttled : lower priority stages were paused for it
+        contended : lower priority stages ran concurrently (scheduler disabled)
+    Comparing throttled and contended shows what the priority decisions changed.
+
+    Args:
+        enabled (bool): pause lower priority stages, if False only measure
+        max_pause_ms (int): longest pause of a stage at one wait_turn, avoids starvation
+    '''
+    def __init__(self, enabled:bool=True, max_pause_ms:int=1000):
+        self.enabled = enabled
+        self.max_pause = max_pause_ms / 1000
+        self._cond = Condition()
+        self._jobs:list[Job] = []
+        # (stage, label) -> case -> [count, total latency sec, total paused sec of others]
+        self._stats:defaultdict[tuple[str, str], defaultdict[str, list[float]]] = \
+            defaultdict(lambda: defaultdict(lambda: [0, 0.0, 0.0]))
+
+    @contextmanager
+    def job(self, stage:str, priority:Priority=Priority.NORMAL, label:str|None=None)->Iterator[Job]:
+        '''
+        register running work of a stage
+        Args:
+            stage(str): stage name, e.g. "tts"
+            priority(Priority): initial priority
+            label(str): name of the work in stats, default: priority name
+        '''
+        job = Job(stage, priority, label or priority.name.lower())
+        with self._cond:
+            for other in self._jobs:
+                self._mark_overlap(job, other)
+            self._jobs.append(job)
+        try:
+            yield job
+        finally:
+            latency = perf_counter() - job.start
+            with self._cond:
+                # charge pauses of waiting stages here, they wake up after this job is recorded
+                for other in self._jobs:
+                    if job in other.waiting_for:
+                        job.yielded[other.stage] += perf_counter() - other.waiting_for.pop(job)
+                self._jobs.remove(job)
+                self._cond.notify_all()
+            self._record(job, latency)
+
+    @staticmethod
+    def _mark_overlap(a:Job, b:Job)->None:
+        if a.stage == b.stage:
+            return
+        if a.priority > b.priority:
+            a.overlapped.add(b.stage)
+        elif b.priority > a.priority:
+            b.overlapped.add(a.stage)
+
+    def set_priority(self, job:Job, priority:Priority)->None:
+        with self._cond:
+            if job.priority == priority:
+                return
+            job.priority = priority
+            for other in self._jobs:
+                if other is not job:
+                    self._mark_overlap(job, other)
+            self._cond.notify_all()
+
+    def _blockers(self, job:Job)->list[Job]:
+        return [j for j in self._jobs if j.stage != job.stage and j.priority > job.priority]
+
+    def wait_turn(self, job:Job)->float:
+        '''
+        pause while a higher priority job of another stage is running
+        Returns:
+            paused time in sec
+        '''
+        if not self.enabled:
+            return 0.0
+        with self._cond:
+            if not self._blockers(job):
+                return 0.0
+            start = perf_counter()
+            deadline = start + self.max_pause
+            while (blockers := self._blockers(job)) and (remaining := deadline - perf_counter()) > 0:
+                for blocker in blockers:
+                    job.waiting_for.setdefault(blocker, perf_counter())
+                self._cond.wait(remaining)
+            end = perf_counter()
+            for blocker, since in job.waiting_for.items(): # still running after max pause
+                blocker.yielded[job.stage] += end - since
+            job.waiting_for.clear()
+            paused = end - start
+            job.paused += paused
+        return paused
+
+    def _record(self, job:Job, latency:float)->None:
+        yielded = sum(job.yielded.values())
+        case = "throttled" if yielded > 0 else "contended" if job.overlapped else "alone"
+        with self._cond:
+            stats = self._stats[(job.stage, job.label)]
+            stats[case][0] += 1
+            stats[case][1] += latency
+            stats[case][2] += yielded
+            means = {c: s[1] / s[0] for c, s in stats.items()}
+        if yielded > 0:
+            paused = ", ".join(f"{s} {t*1000:.0f}ms" for s, t in job.yielded.items())
+            baseline = ", ".join(f"{c} {m*1000:.0f}ms" for c, m in means.items() if c != "throttled")
+            log.debug(f"Scheduler: {job.stage} {job.label} took {latency*1000:.0f}ms, paused {paused}"
+                      f" (mean {baseline or 'no baseline yet'})")
+
+    def format_stats(self)->str:
+        '''mean latency of each work by case'''
+        lines = []
+        with self._cond:
+            for (stage, label), cases in sorted(self._stats.items()):
+                parts = [f"{case} {s[1]/s[0]*1000:.0f}ms x{s[0]:.0f}" + (f" (paused others {s[2]/s[0]*1000:.0f}ms)" if s[2] else "")
+                         for case, s in sorted(cases.items())]
+                lines.append(f"{stage} {label}: " + ", ".join(parts))
+        state = "enabled" if self.enabled else "disabled (measuring only)"
+        return f"scheduler {state}\n" + ("\n".join(lines) or "no jobs yet")
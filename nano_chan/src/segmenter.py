@@ -0,0 +1,100 @@
+import re
+
+EMOJI_PATTERN = re.compile(
+    "["
+    "\U0001F600-\U0001F64F"  # emoticons
+    "\U0001F300-\U0001F5FF"  # symbols & pictographs
+    "\U0001F680-\U0001F6FF"  # transport & map symbols
+    "\U0001F1E0-\U0001F1FF"  # flags (iOS)
+    "\U00002700-\U000027BF"  # Dingbats
+    "\U0001F900-\U0001F9FF"  # Supplemental Symbols and Pictographs
+    "\U00002600-\U000026FF"  # Misc symbols
+    "\U00002B50-\U00002B55"
+    "\U0000231A-\U0000231B"
+    "\U00002500-\U00002BEF"
+    "\U0001F700-\U0001F77F"
+    "\U0001F780-\U0001F7FF"
+    "\U0001F800-\U0001F8FF"
+    "\U0001FA70-\U0001FAFF"
+    "\U0001F018-\U0001F270"
+    "\U0001F650-\U0001F67F"
+    "]+",
+    flags=re.UNICODE
+)
+
+SENTENCE_END = ".!?\n"
+CLAUSE_END = ",;:"
+
+
+def remove_emoji(text:str)->str:
+    return EMOJI_PATTERN.sub("", text)
+
+
+class SentenceSegmenter:
+    '''
+    Split streamed LLM text into sections for TTS incrementally.
+
+    Each pushed token is filtered once (emoji, markdown "*") and scanned from a
+    cursor, so a turn costs linear time in the response length.
+    The first section of a turn is emitted at any clause or sentence end as soon
+    as it has first_min_letters letters (rough count of phonemes), so TTS starts
+    early. Later sections are emitted at sentence ends, or at clause ends once
+    they have min_letters letters, and at a space after max_letters letters.
+
+    Args:
+        first_min_letters (int): letters of the first section to be worth synthesizing
+        min_letters (int): letters of later sections to split at a clause end
+        max_letters (int): letters to split a section without punctuation at a space
+    '''
+    def __init__(self, first_min_letters:int=12, min_letters:int=40, max_letters:int=200):
+        self.first_min_letters = first_min_letters
+        self.min_letters = min_letters
+        self.max_letters = max_letters
+        self.reset()
+
+    def reset(self)->None:
+        self._text = ""     # filtered text not emitted yet
+        self._cursor = 0    # position in _text scanned so far
+        self._letters = 0   # letters in _text[:_cursor]
+        self.emitted = 0    # sections emitted in this turn
+
+    def _split_at(self, end:int)->str:
+        section = self._text[:end]
+        self._text = self._text[end:]
+        self._cursor = 0
+        self._letters = 0
+        self.emitted += 1
+        return section
+
+    def push(self, token:str)->list[str]:
+        '''add streamed text, return sections ready for TTS'''
+        self._text += remove_emoji(token).replace("*", "")
+        sections = []
+        while self._cursor < len(self._text):
+            i = self._cursor
+            char = self._text[i]
+            self._cursor += 1
+            if char.isalnum():
+                self._letters += 1
+                continue
+            if char in SENTENCE_END + CLAUSE_END and char != "\n":
+                if i + 1 == len(self._text) and i > 0 and self._text[i - 1].isdigit():
+                    self._cursor = i # may be a decimal point or thousands separator, wait for the next token
+                    break
+                if i + 1 < len(self._text) and not self._text[i + 1].isspace():
+                    continue # e.g. "3.5", "e.g."
+            if char in SENTENCE_END:
+                ready = self._letters > 0 and (self.emitted > 0 or self._letters >= self.first_min_letters)
+            elif char in CLAUSE_END:
+                ready = self._letters >= (self.min_letters if self.emitted else self.first_min_letters)
+            else:
+                ready = char.isspace() and self._letters >= self.max_letters
+            if ready:
+                sections.append(self._split_at(self._cursor))
+        return sections
+
+    def flush(self)->str:
+        '''rest of the response at the end of a turn'''
+        section = self._text
+        self.reset()
+        return section
@@ -0,0 +1,95 @@
+import logging
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+log = logging.getLogger(__name__)
+
+
+class GgufDraftModel(LlamaDraftModel):
+    '''
+    Draft tokens greedily with a small GGUF model sharing the vocabulary of the main model,
+    e.g. Qwen3-0.6B for Qwen3-4B. The KV cache of the draft model is reused by prefix matching.
+
+    Args:
+        model_path (str): path to draft gguf model
+        num_pred_tokens (int): tokens drafted per main model forward pass
+        n_ctx (int): context length, same as the main model
+        llama_kwargs: other kwargs for llama_cpp.Llama, e.g. n_gpu_layers, n_threads
+    '''
+    def __init__(self, model_path:str, num_pred_tokens:int=4, n_ctx:int=3200, **llama_kwargs):
+        self.num_pred_tokens = num_pred_tokens
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, verbose=False, **llama_kwargs)
+
+    def __call__(self, input_ids:npt.NDArray[np.intc], /, **kwargs:Any)->npt.NDArray[np.intc]:
+        draft = []
+        for token in self.llm.generate(input_ids.tolist(), temp=0.0, reset=True):
+            if token == self.llm.token_eos():
+                break
+            draft.append(token)
+            if len(draft) >= self.num_pred_tokens:
+                break
+        return np.array(draft, dtype=np.intc)
+
+
+class MeasuredDraft(LlamaDraftModel):
+    '''
+    Count drafted and accepted tokens of a draft model.
+
+    Llama.generate calls the draft model after each verification with the accepted
+    tokens and one sampled token appended, so accepted drafts of the previous call
+    are the growth of input_ids minus one.
+    '''
+    def __init__(self, draft:LlamaDraftModel, name:str):
+        self.draft = draft
+        self.name = name
+        self.reset()
+
+    def reset(self)->None:
+        '''start counting a new generation'''
+        self.proposed = 0
+        self.accepted = 0
+        self._pending:tuple[int, int]|None = None # (input length, drafted tokens) of the last call
+
+    def __call__(self, input_ids:npt.NDArray[np.intc], /, **kwargs:Any)->npt.NDArray[np.intc]:
+        if self._pending is not None:
+            length, drafted = self._pending
+            if len(input_ids) > length: # same generation
+                self.proposed += drafted
+                self.accepted += min(len(input_ids) - length - 1, drafted)
+        draft = self.draft(input_ids, **kwargs)
+        self._pending = (len(input_ids), len(draft))
+        return draft
+
+    @property
+    def acceptance(self)->float:
+        return self.accepted / self.proposed if self.proposed else 0.0
+
+
+def create_draft_model(type:str="prompt_lookup",
+                       num_pred_tokens:int|None=None,
+                       max_ngram_size:int=2,
+                       draft_model_path:str|None=None,
+                       **llama_kwargs)->MeasuredDraft:
+    '''
+    Args:
+        type(str): "prompt_lookup" to copy n-grams of the context (answers echoing the user),
+            "draft" to run a small GGUF model
+        num_pred_tokens(int): tokens drafted per forward pass, default 10 for prompt lookup and 4 for draft model
+        max_ngram_size(int): n-gram length to look up in the context
+        draft_model_path(str): path to draft gguf model
+        llama_kwargs: kwargs for llama_cpp.Llama of the draft model
+    '''
+    if type == "prompt_lookup":
+        draft = LlamaPromptLookupDecoding(max_ngram_size=max_ngram_size, num_pred_tokens=num_pred_tokens or 10)
+    elif type == "draft":
+        if draft_model_path is None:
+            raise ValueError("draft_model_path is required for draft model speculative decoding")
+        draft = GgufDraftModel(draft_model_path, num_pred_tokens or 4, **llama_kwargs)
+    else:
+        raise ValueError(f"Unknown speculative decoding type {type}, expected 'prompt_lookup' or 'draft'")
+    log.info(f"Speculative decoding: {type}")
+    return MeasuredDraft(draft, type)
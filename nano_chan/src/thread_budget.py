@@ -0,0 +1,191 @@
+import logging
+import os
+import threading
+from pathlib import Path
+
+import onnxruntime as rt
+
+from nano_chan.libs.ort_utils.tuning import load_config, make_session_options
+
+log = logging.getLogger(__name__)
+
+STAGES = ("asr", "llm", "tts", "audio")
+
+
+def parse_cpu_list(cpus:str|int|list)->set[int]:
+    '''"0-3,6" / 2 / [0, 1, "4-5"] -> set of cpu ids'''
+    if isinstance(cpus, int):
+        return {cpus}
+    if isinstance(cpus, list):
+        return set().union(*(parse_cpu_list(c) for c in cpus))
+    ids = set()
+    for part in str(cpus).split(","):
+        if "-" in part:
+            low, high = part.split("-")
+            ids.update(range(int(low), int(high) + 1))
+        elif part.strip():
+            ids.add(int(part))
+    return ids
+
+
+class StageBudget:
+    '''
+    Core set and thread count of a pipeline stage.
+    A stage without budget keeps the default of each library (all cores).
+
+    Args:
+        name (str): stage name
+        cores (str|list): cpu ids for the stage, e.g. "0-3" or [4, 5]
+        threads (int): threads for ORT intra-op pool / llama generation, default: number of cores
+        threads_batch (int): llama threads for prompt processing, default: threads
+        spin (bool): let idle ORT threads spin, fast wake up but burns cores shared with other stages
+    '''
+    def __init__(self, name:str,
+                 cores:str|list|None=None,
+                 threads:int|None=None,
+                 threads_batch:int|None=None,
+                 spin:bool=False):
+        self.name = name
+        self.cores:set[int]|None = None
+        if cores is not None:
+            allowed = os.sched_getaffinity(0)
+            self.cores = parse_cpu_list(cores) & allowed
+            if self.cores != parse_cpu_list(cores):
+                log.warning(f"Thread budget {name}: cores {sorted(parse_cpu_list(cores) - allowed)} are not available")
+            self.cores = self.cores or None
+        self.threads = threads or (len(self.cores) if self.cores else None)
+        self.threads_batch = threads_batch or self.threads
+        self.spin = spin
+        self.pinned:set[int] = set() # native ids of threads pinned by pin_current_thread
+
+    def __bool__(self)->bool:
+        return self.cores is not None or self.threads is not None
+
+    def __repr__(self)->str:
+        cores = ",".join(map(str, sorted(self.cores))) if self.cores else "all"
+        return f"{self.name}: cores {cores}, threads {self.threads or 'default'}"
+
+    def session_options(self, model_key:str|None=None)->rt.SessionOptions|None:
+        '''
+        SessionOptions with the thread budget applied on top of autotuned options.
+        Each intra-op thread is pinned to the core set, the calling thread is
+        pinned by pin_current_thread.
+
+        Args:
+            model_key(str): key of autotuned options, e.g. "nemo-parakeet-tdt-0.6b-v2:int8"
+        '''
+        if not self:
+            return None
+        config = load_config(model_key) if model_key else None
+        sess_options = make_session_options(config) if config else rt.SessionOptions()
+        sess_options.inter_op_num_threads = 1
+        if self.threads:
+            sess_options.intra_op_num_threads = self.threads
+            if self.cores and self.threads > 1:
+                # ORT counts processors from 1, one entry per thread except the caller
+                cpus = ",".join(str(c + 1) for c in sorted(self.cores))
+                sess_options.add_session_config_entry(
+                    "session.intra_op_thread_affinities", ";".join([cpus] * (self.threads - 1))
+                )
+        if not self.spin:
+            sess_options.add_session_config_entry("session.intra_op.allow_spinning", "0")
+        return sess_options
+
+    def llama_kwargs(self)->dict:
+        '''kwargs of llama_cpp.Llama'''
+        if not self.threads:
+            return {}
+        return {"n_threads": self.threads, "n_threads_batch": self.threads_batch}
+
+    def pin_current_thread(self)->None:
+        '''
+        Pin calling thread to the core set (once per thread).
+        Threads created later by this thread (e.g. llama.cpp workers) inherit it.
+        '''
+        if not self.cores:
+            return
+        tid = threading.get_native_id()
+        if tid in self.pinned:
+            return
+        self.pinned.add(tid)
+        try:
+            os.sched_setaffinity(0, self.cores) # 0 = calling thread on Linux
+        except OSError as e:
+            log.warning(f"Thread budget {self.name}: failed to pin thread: {e}")
+
+
+class ThreadBudget:
+    '''
+    Global thread budget of ASR, LLM, TTS and audio callbacks, from "ThreadBudget" section of config.
+    Contention is measured from scheduler statistics of every thread of this process:
+    time spent waiting in run queue means the thread was runnable but no core was free.
+
+    Args:
+        stages: {"asr": {"cores": "0-1", "threads": 2}, "llm": {...}, ...}
+    '''
+    def __init__(self, **stages:dict):
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"Unknown thread budget stages {unknown}, expected {STAGES}")
+        self.stages = {name: StageBudget(name, **(stages.get(name) or {})) for name in STAGES}
+        self._last:dict[int, tuple[int, int]] = {}
+        for stage in self.stages.values():
+            if stage:
+                log.info(f"Thread budget {stage}")
+
+    def stage(self, name:str)->StageBudget:
+        return self.stages[name]
+
+    def _stage_of(self, tid:int, cpus:set[int])->str:
+        for stage in self.stages.values():
+            if tid in stage.pinned:
+                return stage.name
+        # ORT pool and llama.cpp worker threads are only known by their affinity,
+        # on a core set shared by stages they can't be told apart
+        return "+".join(stage.name for stage in self.stages.values() if stage.cores == cpus) or "other"
+
+    def contention(self)->dict[str, dict[str, float]]:
+        '''
+        CPU and run queue wait time per stage since the last call (Linux only).
+        Threads pinned by a stage are assigned to it, their workers to the stages of their
+        affinity, e.g. "asr+tts" for a core set shared by both. Other threads are "other".
+
+        Returns:
+            {stage: {"threads", "cpu_ms", "wait_ms", "wait_ratio"}}
+        '''
+        tasks = Path("/proc/self/task")
+        if not tasks.exists():
+            return {}
+        usage:dict[str, dict[str, float]] = {}
+        current = {}
+        for task in tasks.iterdir():
+            try:
+                run_ns, wait_ns, _ = map(int, (task / "schedstat").read_text().split())
+                status = (task / "status").read_text()
+            except (OSError, ValueError):
+                continue # thread exited
+            cpus = next(line.split(":")[1].strip() for line in status.splitlines()
+                        if line.startswith("Cpus_allowed_list"))
+            tid = int(task.name)
+            current[tid] = (run_ns, wait_ns)
+            last_run, last_wait = self._last.get(tid, (0, 0))
+            stats = usage.setdefault(self._stage_of(tid, parse_cpu_list(cpus)),
+                                     {"threads": 0, "cpu_ms": 0.0, "wait_ms": 0.0})
+            stats["threads"] += 1
+            stats["cpu_ms"] += (run_ns - last_run) / 1e6
+            stats["wait_ms"] += (wait_ns - last_wait) / 1e6
+        self._last = current
+        for stats in usage.values():
+            stats["wait_ratio"] = stats["wait_ms"] / max(stats["cpu_ms"] + stats["wait_ms"], 1e-9)
+        return usage
+
+    def format_contention(self)->str:
+        lines = [
+            f"{name:7s}: {s['threads']:3.0f} threads, cpu {s['cpu_ms']:8.0f}ms, "
+            f"run queue wait {s['wait_ms']:7.0f}ms ({s['wait_ratio']*100:4.1f}%)"
+            for name, s in sorted(self.contention().items())
+        ]
+        pressure = Path("/proc/pressure/cpu")
+        if pressure.exists():
+            lines.append(f"system cpu pressure: {pressure.read_text().splitlines()[0]}")
+        return "\n".join(lines) or "contention unavailable"
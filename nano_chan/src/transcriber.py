@@ -1,6 +1,11 @@
-from threading import Thread, Event
-from queue import Queue
-from nano_chan.libs import onnx_asr
+from threading import Thread, Event, Lock
+from queue import Queue, Empty
+from typing import Callable
+
+from .asr_router import AsrRouter
+from .thread_budget import StageBudget
+from .scheduler import Priority, StageScheduler
+from .intent_router import Intent, IntentRouter
 
 class Transcriber:
     '''
@@ -11,41 +16,84 @@ class Transcriber:
         model_name (str): Name of the ONNX model to use for transcription.
         quantization (str): Quantization type for the model.
         sample_rate (int): Sample rate of the audio clips.
+        models (list[dict]): Several models to route clips by latency, 
+            listed from the most accurate. Overrides model_name and quantization.
+        routing (dict): Kwargs for AsrRouter policy.
+        mmap_weights (bool): Share memory mapped weights between processes (CPU only).
+        budget (StageBudget): Cores and threads for ASR sessions.
+        scheduler (StageScheduler): Ranks clips which may interrupt the answer critical.
+        partial_q (Queue): Queue of partial clips while the user is talking, 
+            their transcripts are put to provisional_q.
+        router (IntentRouter): A stop command also interrupts the answer besides "wait, wait".
+        followup (Callable): Returns True while speech may continue the turn being answered,
+            such transcripts are output even while locked.
     '''
     def __init__(self, input_q:Queue, 
                  model_name="nemo-parakeet-tdt-0.6b-v2", 
                  quantization="int8",
-                 sample_rate=48000):
+                 sample_rate=48000,
+                 models:list[dict]|None=None,
+                 routing:dict|None=None,
+                 mmap_weights:bool=False,
+                 budget:StageBudget|None=None,
+                 scheduler:StageScheduler|None=None,
+                 partial_q:Queue|None=None,
+                 router:IntentRouter|None=None,
+                 followup:Callable[[], bool]|None=None):
 
         self.input_q = input_q
-        self.model = onnx_asr.load_model(model_name, quantization=quantization)
+        if not models:
+            models = [{"model_name": model_name, "quantization": quantization}]
+        models = [{"mmap_weights": mmap_weights} | spec for spec in models]
+        self.budget = budget or StageBudget("asr")
+        for spec in models:
+            key = f"{spec['model_name']}:{spec.get('quantization') or 'fp32'}"
+            spec.setdefault("sess_options", self.budget.session_options(key))
+        self.model = AsrRouter(models, sample_rate=sample_rate, **(routing or {}))
         self.sample_rate = sample_rate
+        self.scheduler = scheduler or StageScheduler(enabled=False)
         
         self.output_q = Queue() # Queue to hold transcribed text
+        self.partial_q = partial_q
+        self.provisional_q = Queue() # Queue to hold transcripts of partial clips
+        self._asr_lock = Lock() # final clips first, partial clips are skipped while busy
 
         self.locked = False
         self.interrupt_event = Event()
+        self.router = router
+        self.followup = followup
     
     def start(self):
         self.is_running = True
         self.input_watch_thread = Thread(target=self._watch_queue, daemon=True)
         self.input_watch_thread.start()
+        if self.partial_q is not None:
+            self.partial_watch_thread = Thread(target=self._watch_partial, daemon=True)
+            self.partial_watch_thread.start()
       
     def _watch_queue(self):
-        
+        self.budget.pin_current_thread()
         while self.is_running:
             sent_text = ""
             is_overlap,audio = self.input_q.get()
             # stop flag
             if audio is None:
                 break
-            text = self.model.recognize(audio,sample_rate=self.sample_rate)
+            if self.locked or is_overlap:
+                priority, label = Priority.CRITICAL, "interrupt detection"
+            else:
+                priority, label = Priority.NORMAL, "utterance"
+            with self._asr_lock, self.scheduler.job("asr", priority, label):
+                text = self.model.recognize(audio, queue_depth=self.input_q.qsize())
             if self.locked or is_overlap:
                 # detect interruption
-                if text and text.lower().count("wait") >= 2:
+                if text and (text.lower().count("wait") >= 2 or self._is_stop(text)):
                     self.interrupt_event.set()
                     self._flush_queue()
                     continue
+                # speech after a pause may continue the turn before its answer is heard
+                if text and text.strip() and self.followup is not None and self.followup():
+                    self.output_q.put(text.strip() + " ")
             elif not self.locked and not is_overlap:
                 if text is None or text.strip() == "":
                     pass
@@ -56,6 +104,34 @@ class Transcriber:
                 if sent_text.strip() != "":
                     self.output_q.put(sent_text)
 
+    def _is_stop(self, text:str)->bool:
+        return self.router is not None and self.router.classify(text) is Intent.STOP
+
+    def _watch_partial(self):
+        '''transcribe the latest partial clip when ASR is idle'''
+        self.budget.pin_current_thread()
+        while self.is_running:
+            is_overlap, audio = self.partial_q.get()
+            try:
+                while True: # skip stale clips
+                    is_overlap, audio = self.partial_q.get_nowait()
+            except Empty:
+                pass
+            if audio is None:
+                break
+            # barge-in clips are not user turns, final clips have priority
+            if self.locked or is_overlap or not self.input_q.empty():
+                continue
+            if not self._asr_lock.acquire(blocking=False):
+                continue
+            try:
+                with self.scheduler.job("asr", Priority.LOW, "partial"):
+                    text = self.model.recognize(audio)
+            finally:
+                self._asr_lock.release()
+            if text and text.strip():
+                self.provisional_q.put(text.strip())
+
     def _flush_queue(self):
         try:
             while not self.input_q.empty():
@@ -71,4 +147,7 @@ class Transcriber:
         self.is_running = False
         self.output_q.put(None)
         self.input_watch_thread.join()
+        if self.partial_q is not None:
+            self.partial_q.put((None, None))
+            self.partial_watch_thread.join()
         del self.model
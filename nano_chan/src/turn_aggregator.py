@@ -0,0 +1,154 @@
+import logging
+import re
+from queue import Queue, Empty
+from threading import Thread
+from time import perf_counter
+from typing import Callable
+
+log = logging.getLogger(__name__)
+
+# a transcript ending with these words is likely continued after a pause
+CONTINUATIONS = {
+    "and", "but", "or", "so", "because", "since", "then", "that", "which", "who", "if", "when", "while",
+    "to", "of", "for", "with", "about", "in", "on", "at", "from", "like", "the", "a", "an", "my", "your",
+    "is", "are", "was", "um", "uh", "er", "i", "we", "you",
+}
+
+
+class TurnAggregator:
+    '''
+    Merge transcripts split by a pause into one user turn before the LLM.
+
+    VoiceCapture closes a clip after sil_ms of silence, so a pause in the middle of a
+    sentence gives two transcripts. Each transcript is held for a window which is short
+    when it ends like a sentence and longer when it ends with a comma, a conjunction or
+    without final punctuation; clips arriving within it are merged into the turn.
+    A clip arriving after the turn was sent while its answer is still being prepared
+    cancels the answer and the merged turn is sent again.
+
+    Args:
+        input_q (Queue): transcripts from Transcriber
+        enabled (bool): pass transcripts through at once when False
+        complete_ms (int): window after a transcript ending with . ? or !
+        open_ms (int): window after a transcript without final punctuation
+        continued_ms (int): window after a comma, a conjunction or a filler
+        extend_sec (float): a clip within this time after sending a turn may continue it
+        answer_pending (Callable): True while the answer of the sent turn isn't heard yet
+        cancel_turn (Callable): cancels the answer of the sent turn
+    '''
+    def __init__(self, input_q:Queue,
+                 enabled:bool=True,
+                 complete_ms:int=150,
+                 open_ms:int=600,
+                 continued_ms:int=1200,
+                 extend_sec:float=3.0,
+                 answer_pending:Callable[[], bool]|None=None,
+                 cancel_turn:Callable[[], None]|None=None):
+        self.input_q = input_q
+        self.enabled = enabled
+        self.complete_ms = complete_ms
+        self.open_ms = open_ms
+        self.continued_ms = continued_ms
+        self.extend_sec = extend_sec
+        self.answer_pending = answer_pending
+        self.cancel_turn = cancel_turn
+        self.output_q = Queue() # queue to put user turns
+
+        self._sent = ""      # last turn sent
+        self._sent_at = 0.0
+        self.clips = 0       # transcripts received
+        self.turns = 0       # turns sent
+        self.merged = 0      # clips merged within the window, each an LLM turn avoided
+        self.extended = 0    # answers cancelled and sent again with the continuation
+
+    def start(self)->None:
+        self.input_watch_thread = Thread(target=self._watch_queue, daemon=True)
+        self.input_watch_thread.start()
+
+    def window_ms(self, text:str)->int:
+        '''time to wait for a continuation, by how the transcript ends'''
+        text = text.rstrip()
+        words = re.findall(r"[\w']+", text.lower())
+        if text.endswith((",", "...", "-")) or (words and words[-1] in CONTINUATIONS):
+            return self.continued_ms
+        if not text.endswith((".", "?", "!")):
+            return self.open_ms
+        return self.complete_ms
+
+    def accepts_followup(self)->bool:
+        '''True while a clip would continue the turn sent, Transcriber forwards it even while locked'''
+        return self.enabled and bool(self._sent) and perf_counter() - self._sent_at < self.extend_sec \
+            and self.answer_pending is not None and self.answer_pending()
+
+    def _watch_queue(self):
+        pending = "" # turn held within the window
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - perf_counter(), 0.0)
+            try:
+                text = self.input_q.get(timeout=timeout)
+            except Empty:
+                self._send(pending)
+                pending, deadline = "", None
+                continue
+            if text is None:
+                if pending:
+                    self._send(pending)
+                self.output_q.put(None)
+                break
+            text = text.strip()
+            if not text:
+                continue
+            self.clips += 1
+
+            if pending:
+                self.merged += 1
+                pending = self._join(pending, text)
+            elif self._take_back():
+                self.merged += 1 # LanguageProcessor hasn't started the turn yet
+                pending = self._join(self._sent, text)
+            elif self.accepts_followup() and self.cancel_turn is not None:
+                self.cancel_turn()
+                self.extended += 1
+                pending = self._join(self._sent, text)
+            else:
+                pending = text
+            if pending != text:
+                log.info(f"Merged a clip into the turn: {pending!r}")
+
+            if not self.enabled:
+                self._send(pending)
+                pending = ""
+            else:
+                deadline = perf_counter() + self.window_ms(pending) / 1000
+
+    def _join(self, first:str, text:str)->str:
+        '''a period put by ASR at a pause after "and" etc. is dropped'''
+        if first.endswith(".") and not first.endswith("...") and self.window_ms(first) == self.continued_ms:
+            first = first[:-1]
+        return f"{first} {text}"
+
+    def _take_back(self)->bool:
+        '''remove the last turn sent if it is still queued'''
+        if not self.enabled:
+            return False
+        try:
+            self.output_q.get_nowait()
+            self.turns -= 1
+            return True
+        except Empty:
+            return False
+
+    def _send(self, text:str)->None:
+        self._sent, self._sent_at = text, perf_counter()
+        self.turns += 1
+        self.output_q.put(text)
+
+    def format_stats(self)->str:
+        '''clips merged into turns and LLM turns avoided'''
+        return (f"{self.clips} clips -> {self.turns} turns, {self.merged} LLM turns avoided, "
+                f"{self.extended} answers restarted with the continuation")
+
+    def close(self)->None:
+        '''wait until None from Transcriber.close is passed on'''
+        self.input_watch_thread.join()
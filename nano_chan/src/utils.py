@@ -0,0 +1,33 @@
+from pathlib import Path
+
+
+def memory_usage()->dict[str, float]:
+    '''
+    Memory of this process in MB (Linux only, empty if unavailable).
+
+    unique : pages held only by this process (Private_Clean + Private_Dirty)
+    shared : pages shared with other processes, e.g. memory mapped weights
+    pss    : proportional share, sum of pss over processes is the real usage
+    '''
+    path = Path("/proc/self/smaps_rollup")
+    if not path.exists():
+        return {}
+    kb = {}
+    for line in path.read_text().splitlines():
+        fields = line.split()
+        if len(fields) == 3 and fields[2] == "kB":
+            kb[fields[0].rstrip(":")] = int(fields[1])
+    return {
+        "rss": kb.get("Rss", 0) / 1024,
+        "pss": kb.get("Pss", 0) / 1024,
+        "unique": (kb.get("Private_Clean", 0) + kb.get("Private_Dirty", 0)) / 1024,
+        "shared": (kb.get("Shared_Clean", 0) + kb.get("Shared_Dirty", 0)) / 1024,
+    }
+
+
+def format_memory_usage()->str:
+    mem = memory_usage()
+    if not mem:
+        return "memory usage unavailable"
+    return (f"RSS {mem['rss']:.0f}MB (unique {mem['unique']:.0f}MB, "
+            f"shared {mem['shared']:.0f}MB, PSS {mem['pss']:.0f}MB)")
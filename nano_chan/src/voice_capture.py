@@ -6,12 +6,15 @@ import time
 import sounddevice as sd 
 import numpy as np
 
+from .thread_budget import StageBudget
+
 class VoiceCapture:
     '''Capture voice, trim silence, queue clips for processing.
 
     Attribute:
         recording_event: Event to indicate recording is in progress.
         output_q: Queue to hold audio clips.
+        partial_q: Queue to hold audio recorded so far, every partial_ms while recording.
     
     Args:
         rec_device (str):   Recording device name.
@@ -22,6 +25,8 @@ class VoiceCapture:
         sil_ms (int):       Silence length in milliseconds to detect end of recording.
         pre_frames (int):   Number of frames to keep before recording starts.
         min_clip_len_sec (float): Minimum clip length in seconds to queue.
+        budget (StageBudget): Cores for the PortAudio callback thread.
+        partial_ms (int):   Interval to queue partial clips for speculative processing, 0 to disable.
     '''
     def __init__(self, 
                  rec_device='USB Audio Device',
@@ -31,7 +36,9 @@ class VoiceCapture:
                  tail_ms=70, 
                  sil_ms=400,
                  pre_frames=5,
-                 min_clip_len_sec=0.8):
+                 min_clip_len_sec=0.8,
+                 budget:StageBudget|None=None,
+                 partial_ms=0):
 
         self.FS = fs
         self.CHUNK_MS = chunk_ms
@@ -44,7 +51,10 @@ class VoiceCapture:
         self.sil_chunks = int(self.SIL_MS / self.CHUNK_MS)
         self.tail_chunks = int(self.TAIL_MS / self.CHUNK_MS)
         self.output_q = queue.Queue()
+        self.partial_q = queue.Queue()
+        self.partial_chunks = int(partial_ms / self.CHUNK_MS)
         self.in_dev = sd.query_devices(rec_device, 'input')['index']
+        self.budget = budget or StageBudget("audio")
 
         # flags
         self.recording_event = Event() # set active if recording
@@ -71,6 +81,7 @@ class VoiceCapture:
             indata(np.ndarray): wavedata with chunk length
             '''
             nonlocal buf, silent, tail_buf, tailing, pre_buf
+            self.budget.pin_current_thread()
             if status:
                 print(status, flush=True)
 
@@ -86,6 +97,8 @@ class VoiceCapture:
                     buf.extend(pre_buf)           # already contains current chunk
                 else:
                     buf.append(indata.copy())     # normal in‑recording append
+                    if self.partial_chunks and len(buf) % self.partial_chunks == 0:
+                        self.partial_q.put((self.is_overlap, np.concatenate(buf, axis=0).squeeze()))
                 silent = 0
                 tail_buf.clear()
                 tailing = False
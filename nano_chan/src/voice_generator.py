@@ -1,8 +1,15 @@
-from nano_chan.libs.kokoro_onnx import Kokoro
+import os
+from nano_chan.libs.kokoro_onnx import Kokoro, SAMPLE_RATE
 from threading import Thread,Event,Lock
 from queue import Queue,Empty
+from concurrent.futures import Future
+from time import perf_counter, thread_time
 import numpy as np
 
+from .thread_budget import StageBudget
+from .scheduler import Priority, StageScheduler
+from .resampler import PolyphaseResampler
+
 class VoiceGenerator:
     '''
     Module to generate the voice audio from text generated by LLM
@@ -14,13 +21,39 @@ class VoiceGenerator:
         voice (str): Voice to use for TTS.
         speed (float): Speed of the TTS.
         lang (str): Language for TTS.
+        mmap_weights (bool): Share memory mapped weights between processes (CPU only).
+        budget (StageBudget): Cores and threads for TTS session.
+        scheduler (StageScheduler): Ranks a chunk critical when no audio is left to play.
+        first_chunk_phonemes (int): Split the first chunk of an answer at this many phonemes 
+            so that playback starts early, 0 to disable.
+        sample_rate (int): Sample rate of output audio, same as VoicePlayer. 
+            Kokoro output (24000Hz) is resampled unless it is the same.
+        phonemize_workers (int): Processes running espeak, 0 runs it on a thread of this process.
+            Texts queued behind the current one are phonemized while it is synthesized.
+        lexicon_dir (str): Directory of word phoneme lexicons (e.g. en-us.lex), built by tools/build_lexicon.py.
+            Clauses of known words skip espeak and new words are added on close, None to disable.
+        batch_texts (int): Texts queued behind audio still playing are synthesized together, up to this many,
+            1 to disable. Models with a batch axis run them in one padded run, which has no attention mask
+            so check the audio of the export; other models run them concurrently on the intra-op threads
+            of the TTS budget.
+        warmup_lengths (tuple[int]): Token lengths synthesized once at startup, so that the first sentences
+            don't pay for kernel selection and memory arena growth. Empty to skip.
     '''
     def __init__(self, input_q:Queue[str],
                   model_path="weights/kokoro-v1.0.onnx", 
                  voice_path="weights/voices-v1.0.bin", 
                  voice="af_heart", 
                  speed=1.0, 
-                 lang="en-us"):
+                 lang="en-us",
+                 mmap_weights=False,
+                 budget:StageBudget|None=None,
+                 scheduler:StageScheduler|None=None,
+                 first_chunk_phonemes:int=32,
+                 sample_rate:int=48000,
+                 phonemize_workers:int=0,
+                 lexicon_dir:str|None=None,
+                 batch_texts:int=1,
+                 warmup_lengths:tuple[int, ...]=(16, 64, 160)):
 
         self.input_q = input_q
         self.voice = voice
@@ -31,9 +64,24 @@ class VoiceGenerator:
         self.output_q = Queue() # Queue to hold audio samples
         self.generate_event = Event() # Event to indicate playback is in progress
         self._interrupt = False
+        self.scheduler = scheduler or StageScheduler(enabled=False)
+        self._audio_until = 0.0 # perf_counter time when generated audio finishes playing
+        self.first_chunk_phonemes = first_chunk_phonemes
+        self.batched = 0 # texts synthesized in batches
+        self.sample_rate = sample_rate
+        self.resampler = PolyphaseResampler(SAMPLE_RATE, sample_rate) if sample_rate != SAMPLE_RATE else None
+        self.resample_cpu = 0.0 # CPU seconds spent resampling
+        self.audio_sec = 0.0    # seconds of speech generated
+        self._phonemes:dict[str, Future[str]] = {} # phonemes of queued texts being prepared
 
         # create and warm up the model
-        self.kokoro = Kokoro(model_path, voice_path)
+        self.budget = budget or StageBudget("tts")
+        sess_options = self.budget.session_options(f"kokoro:{os.path.basename(model_path)}")
+        self.kokoro = Kokoro(model_path, voice_path, sess_options=sess_options, mmap_weights=mmap_weights,
+                             phonemize_workers=phonemize_workers, lexicon_dir=lexicon_dir,
+                             warmup_lengths=list(warmup_lengths),
+                             batch_workers=max(batch_texts, 1))
+        self.batch_texts = max(batch_texts, 1)
         self.kokoro.create("Hello.", voice=self.voice, speed=self.speed, lang=self.lang)
 
     def start(self):
@@ -42,6 +90,7 @@ class VoiceGenerator:
         self.input_watch_thread.start()
 
     def _watch_queue(self):
+        self.budget.pin_current_thread()
         while self.is_running:
             self.generate_event.clear()
 
@@ -57,27 +106,109 @@ class VoiceGenerator:
             if text.strip() == "":
                 continue
             
-            # run TTS
+            # run TTS batch by batch, each chunk is played while the next one is synthesized
             try:
-                samples, sample_rate = self.kokoro.create(
-                    text,
-                    voice=self.voice, speed=self.speed, lang=self.lang
-                )
-                # Resample to 48000 Hz from 24000 Hz
-                new_sample_rate = 48000
-                samples = np.interp(
-                    np.linspace(0, len(samples), int(len(samples) * new_sample_rate / sample_rate), endpoint=False),
-                    np.arange(len(samples)),
-                    samples
+                first = perf_counter() >= self._audio_until
+                if first and self.resampler is not None:
+                    self.resampler.reset() # nothing is playing, don't continue the last utterance
+                queued = self._take_queued(self.batch_texts - 1) if not first else []
+                if queued:
+                    self._generate_batch([text, *queued])
+                    continue
+                phonemes = self._phonemes.pop(text, None) or self._phonemize(text)
+                chunks = self.kokoro.create_chunks(
+                    phonemes.result(), is_phonemes=True,
+                    voice=self.voice, speed=self.speed, lang=self.lang,
+                    first_max_length=self.first_chunk_phonemes if first else None
                 )
-                if samples is not None and not self._interrupt:
-                    self.output_q.put(samples)
-                    
+                while not self._interrupt:
+                    self._prefetch()
+                    # the listener is waiting if nothing is left to play (e.g. 1st chunk of a turn)
+                    if perf_counter() >= self._audio_until:
+                        priority, label = Priority.CRITICAL, "first chunk"
+                    else:
+                        priority, label = Priority.NORMAL, "chunk"
+                    with self.scheduler.job("tts", priority, label):
+                        chunk = next(chunks, None)
+                        if chunk is None:
+                            break
+                        samples = self._resample(chunk[0])
+                    if not self._interrupt:
+                        self.output_q.put(samples)
+                        self._audio_until = max(perf_counter(), self._audio_until) + len(samples) / self.sample_rate
+                chunks.close() # remaining batches of an interrupted text are not synthesized
+
             except Exception:
                 print("Error generating audio for text:", text)
 
+    def _take_queued(self, n:int)->list[str]:
+        '''remove up to n texts queued next, stopping at the stop flag'''
+        with self.input_q.mutex:
+            count = 0
+            for text in self.input_q.queue:
+                if count == n or not isinstance(text, str) or not text.strip():
+                    break
+                count += 1
+        return [self.input_q.get_nowait() for _ in range(count)] # the only consumer
+
+    def _generate_batch(self, texts:list[str])->None:
+        '''synthesize texts together while earlier audio plays, queue the audio of each in order once it is done'''
+        phonemes = [(self._phonemes.pop(t, None) or self._phonemize(t)).result() for t in texts]
+        audio = self.kokoro.create_batch(phonemes, is_phonemes=True,
+                                         voice=self.voice, speed=self.speed, lang=self.lang)
+        self.batched += len(texts)
+        while not self._interrupt:
+            priority = Priority.CRITICAL if perf_counter() >= self._audio_until else Priority.NORMAL
+            with self.scheduler.job("tts", priority, "batch"):
+                samples = next(audio, None)
+                if samples is None:
+                    break
+                samples = self._resample(samples)
+            if not self._interrupt:
+                self.output_q.put(samples)
+                self._audio_until = max(perf_counter(), self._audio_until) + len(samples) / self.sample_rate
+        audio.close() # texts of an interrupted batch not started yet are not synthesized
+
+    def _phonemize(self, text:str)->Future[str]:
+        return self.kokoro.tokenizer.phonemize_async(text, self.lang)
+
+    def _prefetch(self)->None:
+        '''start phonemizing texts queued behind the current one, they stay in the queue'''
+        with self.input_q.mutex:
+            queued = list(self.input_q.queue)
+        for text in queued:
+            if isinstance(text, str) and text.strip() and text not in self._phonemes:
+                self._phonemes[text] = self._phonemize(text)
+
+    def _resample(self, samples:np.ndarray)->np.ndarray:
+        '''float32 audio at sample_rate, continuing the previous chunk'''
+        samples = samples.astype(np.float32, copy=False)
+        self.audio_sec += len(samples) / SAMPLE_RATE
+        if self.resampler is None:
+            return samples
+        start = thread_time()
+        samples = self.resampler.process(samples)
+        self.resample_cpu += thread_time() - start
+        return samples
+
+    def format_lexicon(self)->str:
+        '''clauses phonemized from the lexicon without espeak'''
+        lexicon = self.kokoro.tokenizer.lexicons.get(self.lang)
+        return lexicon.format_stats() if lexicon is not None else "off"
+
+    def format_resample(self)->str:
+        '''CPU time of resampling per second of speech'''
+        if self.resampler is None:
+            return f"off, playing at {SAMPLE_RATE}Hz"
+        if not self.audio_sec:
+            return "-"
+        return (f"{self.resample_cpu / self.audio_sec * 1000:.2f}ms CPU per second of speech "
+                f"({self.audio_sec:.0f}s to {self.sample_rate}Hz)")
+
     def interrupt(self):
         self._interrupt = True
+        self._audio_until = 0.0
+        self._phonemes.clear()
         self._flush_queue()
         self.generate_event.clear() 
 
@@ -92,4 +223,5 @@ class VoiceGenerator:
     def close(self):
         self.is_running = False
         self.input_watch_thread.join()
+        self.kokoro.tokenizer.close()
         del self.kokoro
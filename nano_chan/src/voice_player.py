@@ -4,24 +4,33 @@ from queue import Queue,Empty
 import numpy as np
 import sounddevice as sd
 
+from .thread_budget import StageBudget
+
 class VoicePlayer:
     '''
     Module to play audio generated by TTS model
 
     Args:
-        input_q (Queue): Queue to hold audio from TTS. Sample rate must 48000Hz
+        input_q (Queue): Queue to hold float32 audio from TTS at sample_rate
         playback_device (str): Playback device name. 
         block_size (int): chunk size of audio processing
+        sample_rate (int): 48000Hz, or 24000Hz to play Kokoro output without resampling if the device supports it
+        budget (StageBudget): Cores for the PortAudio callback thread.
     '''
     def __init__(self, 
                  input_q:Queue[np.ndarray],
                  playback_device:str="USB Audio Device",
-                 block_size:int=500):
+                 block_size:int=500,
+                 sample_rate:int=48000,
+                 budget:StageBudget|None=None):
 
         self.input_q = input_q
         self.playback_device = playback_device
         self.block_size=block_size
+        self.sample_rate = sample_rate
+        self.budget = budget or StageBudget("audio")
         self._buf = np.empty(0, np.float32)  # buffer before playing
+        self._last:list[np.ndarray] = [] # chunks of the last utterance to replay
         self.playing_event = Event() # set if playing
         self._hold_time_q = Queue() # put time to hold playing state
         self.check_thread = Thread(target=self._control_event, daemon=True)
@@ -30,7 +39,7 @@ class VoicePlayer:
     def start(self):
         '''start waiting audio and playing output stream'''
         self.stream = sd.OutputStream(
-            samplerate=48000,
+            samplerate=self.sample_rate,
             channels=1,
             dtype="float32",
             blocksize=self.block_size,
@@ -44,6 +53,7 @@ class VoicePlayer:
 
     def _callback(self, outdata, frames, _, status):
         '''get audio and set to output'''
+        self.budget.pin_current_thread()
         if status:
             pass
             # print(f"Stream status: {status}", flush=True)
@@ -55,6 +65,9 @@ class VoicePlayer:
                     if data is None:
                         break
                     chunk = data.astype(np.float32, copy=False)
+                    if self._buf.size == 0 and not self.playing_event.is_set():
+                        self._last = [] # nothing playing, a new utterance starts
+                    self._last.append(chunk)
                     self._buf = np.concatenate((self._buf, chunk))
                 except Empty:
                     
@@ -88,6 +101,14 @@ class VoicePlayer:
             else:
                 sleep(0.01)
             
+    def replay(self)->bool:
+        '''play the last utterance again, False if there is none'''
+        with self._lock:
+            chunks = list(self._last)
+        for chunk in chunks:
+            self.input_q.put(chunk)
+        return bool(chunks)
+
     def interrupt(self):
         '''stop playing and flush queues'''
         with self._lock:
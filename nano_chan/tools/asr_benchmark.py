@@ -0,0 +1,171 @@
+'''
+Benchmark accuracy and speed of ASR models on your own audio.
+
+Every combination of model / quantization / provider is run in a fresh process
+over a manifest of wav files, then WER, RTF, latency percentiles per clip length
+and peak RSS are written as a Pareto table in JSON and Markdown.
+Models are loaded from weights/<model name> only, nothing is downloaded.
+
+Manifest is a JSON lines file, audio paths are relative to the manifest:
+    {"audio": "clips/0001.wav", "text": "what is the weather like today"}
+
+Usage:
+    python -m nano_chan.tools.asr_benchmark manifest.jsonl \
+        -m nemo-parakeet-tdt-0.6b-v2 nemo-parakeet-ctc-0.6b -q int8 fp32
+'''
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import re
+import resource
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+LENGTH_BUCKETS = [(0.0, 2.0), (2.0, 5.0), (5.0, 10.0), (10.0, float("inf"))]
+
+
+def normalize_text(text:str)->list[str]:
+    '''lowercase and strip punctuation, return words'''
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+
+def word_errors(ref:list[str], hyp:list[str])->int:
+    '''Levenshtein distance in words'''
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1]
+
+
+def load_manifest(path:Path)->list[dict]:
+    with open(path, encoding="utf-8") as f:
+        items = [json.loads(line) for line in f if line.strip()]
+    for item in items:
+        item["audio"] = str((path.parent / item["audio"]).resolve())
+    return items
+
+
+def _bucket_name(low:float, high:float)->str:
+    return f">={low:g}s" if high == float("inf") else f"{low:g}-{high:g}s"
+
+
+def _run_combination(model:str, quantization:str|None, provider:str,
+                     weights_dir:str, items:list[dict])->dict:
+    '''runs in a child process so that peak RSS belongs to this combination only'''
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    from nano_chan.libs import onnx_asr
+    from nano_chan.libs.onnx_asr.utils import read_wav_pcm
+
+    start = perf_counter()
+    asr = onnx_asr.load_model(model, Path(weights_dir, model), quantization=quantization,
+                              providers=[provider])
+    load_sec = perf_counter() - start
+
+    clips = []
+    for item in items:
+        waveform, sample_rate = read_wav_pcm(item["audio"])
+        clips.append((waveform[:, 0], sample_rate, item["text"]))
+    if clips:
+        asr.recognize(clips[0][0], sample_rate=clips[0][1]) # warm up
+
+    results = []
+    for waveform, sample_rate, ref in clips:
+        start = perf_counter()
+        hyp = asr.recognize(waveform, sample_rate=sample_rate)
+        latency = perf_counter() - start
+        results.append({"duration": len(waveform) / sample_rate, "latency": latency, "ref": ref, "hyp": hyp})
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"load_sec": load_sec, "peak_rss_mb": peak_rss_mb, "clips": results}
+
+
+def summarize(name:str, run:dict)->dict:
+    clips = run["clips"]
+    errors = sum(word_errors(normalize_text(c["ref"]), normalize_text(c["hyp"])) for c in clips)
+    words = sum(len(normalize_text(c["ref"])) for c in clips)
+    total_latency = sum(c["latency"] for c in clips)
+    total_duration = sum(c["duration"] for c in clips)
+    buckets = {}
+    for low, high in LENGTH_BUCKETS:
+        latency = [c["latency"] for c in clips if low <= c["duration"] < high]
+        if latency:
+            buckets[_bucket_name(low, high)] = {
+                "clips": len(latency),
+                "p50_ms": float(np.percentile(latency, 50) * 1000),
+                "p95_ms": float(np.percentile(latency, 95) * 1000),
+            }
+    return {
+        "name": name,
+        "wer": errors / max(words, 1),
+        "rtf": total_latency / max(total_duration, 1e-9),
+        "latency": buckets,
+        "peak_rss_mb": run["peak_rss_mb"],
+        "load_sec": run["load_sec"],
+        "clips": len(clips),
+    }
+
+
+def mark_pareto(rows:list[dict])->None:
+    '''a row is Pareto optimal if no other row has both lower (or equal) WER and RTF'''
+    for row in rows:
+        row["pareto"] = not any(
+            other is not row
+            and other["wer"] <= row["wer"] and other["rtf"] <= row["rtf"]
+            and (other["wer"] < row["wer"] or other["rtf"] < row["rtf"])
+            for other in rows
+        )
+
+
+def to_markdown(rows:list[dict])->str:
+    buckets = [_bucket_name(low, high) for low, high in LENGTH_BUCKETS]
+    header = ["model", "WER", "RTF", *(f"p50/p95 {b} [ms]" for b in buckets), "peak RSS [MB]", "Pareto"]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    for row in sorted(rows, key=lambda r: (r["wer"], r["rtf"])):
+        latency = [
+            f"{row['latency'][b]['p50_ms']:.0f}/{row['latency'][b]['p95_ms']:.0f}" if b in row["latency"] else "-"
+            for b in buckets
+        ]
+        cells = [row["name"], f"{row['wer']*100:.2f}%", f"{row['rtf']:.3f}", *latency,
+                 f"{row['peak_rss_mb']:.0f}", "*" if row["pareto"] else ""]
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines) + "\n"
+
+
+def run()->None:
+    parser = argparse.ArgumentParser(prog="asr_benchmark", description="ASR accuracy vs speed benchmark.")
+    parser.add_argument("manifest", type=Path, help="JSON lines with 'audio' and 'text'")
+    parser.add_argument("-m", "--models", nargs="+", default=["nemo-parakeet-tdt-0.6b-v2"])
+    parser.add_argument("-q", "--quantizations", nargs="+", default=["int8"], help="'fp32' for no quantization")
+    parser.add_argument("-p", "--providers", nargs="+", default=["CPUExecutionProvider"])
+    parser.add_argument("-w", "--weights_dir", type=Path, default=Path("weights"))
+    parser.add_argument("-o", "--output", type=Path, default=Path("asr_benchmark"), help="output path without suffix")
+    args = parser.parse_args()
+
+    items = load_manifest(args.manifest)
+    ctx = multiprocessing.get_context("spawn")
+    rows = []
+    for model, quantization, provider in itertools.product(args.models, args.quantizations, args.providers):
+        name = f"{model}:{quantization}:{provider.removesuffix('ExecutionProvider')}"
+        print(f"Running {name} on {len(items)} clips...", flush=True)
+        with ctx.Pool(1) as pool:
+            result = pool.apply(_run_combination, (
+                model, None if quantization == "fp32" else quantization, provider, str(args.weights_dir), items
+            ))
+        rows.append(summarize(name, result))
+        print(f"  WER {rows[-1]['wer']*100:.2f}%  RTF {rows[-1]['rtf']:.3f}  peak RSS {rows[-1]['peak_rss_mb']:.0f}MB")
+    mark_pareto(rows)
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.with_suffix(".json").write_text(json.dumps(rows, indent=2), encoding="utf-8")
+    args.output.with_suffix(".md").write_text(to_markdown(rows), encoding="utf-8")
+    print(to_markdown(rows))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,160 @@
+'''
+Find the fastest ONNX Runtime provider, thread count and execution mode of each model.
+
+Each model of the config (Transcriber ASR models and VoiceGenerator Kokoro, plus
+Silero VAD with --vad) is benchmarked on a representative input over available
+providers, intra-op thread counts, execution modes and graph optimization levels.
+The best configuration is saved per model and host to weights/ort_tuning.json
+(or ORT_TUNING_FILE), and the loaders apply it automatically.
+
+Usage:
+    python -m nano_chan.tools.autotune [-c configs/config.yaml] [--audio clip.wav] [--vad]
+'''
+import argparse
+import os
+import statistics
+from collections.abc import Callable
+from time import perf_counter
+
+import numpy as np
+import onnxruntime as rt
+import yaml
+
+from nano_chan.libs.ort_utils.tuning import (
+    EXECUTION_MODES,
+    OPTIMIZATION_LEVELS,
+    SessionConfig,
+    host_id,
+    make_session_options,
+    save_config,
+    tuning_file,
+)
+
+# build a runner from session options and providers, the runner does one inference
+RunnerFactory = Callable[[rt.SessionOptions, list[str]], Callable[[], object]]
+
+
+def thread_candidates()->list[int]:
+    '''0 is the ORT default (one thread per physical core)'''
+    cpus = os.cpu_count() or 1
+    return sorted({0, 1, *(n for n in (2, 4, 8) if n < cpus), cpus})
+
+
+def measure(factory:RunnerFactory, config:SessionConfig, repeats:int)->float:
+    '''median latency in ms, inf if the configuration fails'''
+    try:
+        run = factory(make_session_options(config), config["providers"])
+        run() # warm up
+        latency = []
+        for _ in range(repeats):
+            start = perf_counter()
+            run()
+            latency.append(perf_counter() - start)
+    except Exception as e:
+        print(f"    {config} failed: {e}")
+        return float("inf")
+    return statistics.median(latency) * 1000
+
+
+def autotune(name:str, factory:RunnerFactory, repeats:int=5)->SessionConfig:
+    '''coordinate search: threads, then execution mode, then optimization level per provider'''
+    best:SessionConfig = {"latency_ms": float("inf")}
+    for provider in rt.get_available_providers():
+        if provider not in ("CUDAExecutionProvider", "CPUExecutionProvider"):
+            continue
+        current:SessionConfig = {"providers": [provider], "execution_mode": "sequential",
+                                 "graph_optimization_level": "all"}
+        for key, values in (("intra_op_num_threads", thread_candidates()),
+                            ("execution_mode", list(EXECUTION_MODES)),
+                            ("graph_optimization_level", list(OPTIMIZATION_LEVELS))):
+            results = {}
+            for value in values:
+                candidate:SessionConfig = {**current, key: value}
+                results[value] = measure(factory, candidate, repeats)
+                print(f"  {name} {provider} {key}={value}: {results[value]:.1f}ms", flush=True)
+            current[key] = min(results, key=results.get)
+            current["latency_ms"] = results[current[key]]
+            if current["latency_ms"] == float("inf"):
+                break # provider does not work for this model
+        if current["latency_ms"] < best["latency_ms"]:
+            best = current
+    return best
+
+
+def asr_factory(model_name:str, quantization:str|None, audio:np.ndarray, sample_rate:int)->RunnerFactory:
+    from nano_chan.libs import onnx_asr
+
+    def factory(sess_options, providers):
+        model = onnx_asr.load_model(model_name, quantization=quantization,
+                                    sess_options=sess_options, providers=providers)
+        return lambda: model.recognize(audio, sample_rate=sample_rate)
+    return factory
+
+
+def vad_factory(audio:np.ndarray)->RunnerFactory:
+    from nano_chan.libs import onnx_asr
+
+    def factory(sess_options, providers):
+        vad = onnx_asr.load_vad("silero", sess_options=sess_options, providers=providers)
+        return lambda: [list(s) for s in vad.segment_batch(audio[None], np.array([len(audio)]))]
+    return factory
+
+
+def kokoro_factory(model_path:str, voice_path:str, voice:str, text:str)->RunnerFactory:
+    from nano_chan.libs.kokoro_onnx import Kokoro
+
+    def factory(sess_options, providers):
+        kokoro = Kokoro(model_path, voice_path, sess_options=sess_options, providers=providers)
+        return lambda: kokoro.create(text, voice=voice)
+    return factory
+
+
+def run()->None:
+    parser = argparse.ArgumentParser(prog="autotune", description="Autotune ONNX Runtime sessions of each model.")
+    parser.add_argument("-c", "--config", default="configs/config.yaml")
+    parser.add_argument("--audio", help="representative wav clip for ASR, 4s of noise by default")
+    parser.add_argument("--text", default="Hello! I am Nano-chan. What did you learn today?",
+                        help="representative sentence for TTS")
+    parser.add_argument("--vad", action="store_true", help="also tune Silero VAD")
+    parser.add_argument("-r", "--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as f:
+        conf = yaml.safe_load(f)
+
+    if args.audio:
+        from nano_chan.libs.onnx_asr.utils import read_wav_pcm
+        audio, sample_rate = read_wav_pcm(args.audio)
+        audio = audio[:, 0]
+    else:
+        sample_rate = 16_000
+        audio = (np.random.default_rng(0).standard_normal(4 * sample_rate) * 0.1).astype(np.float32)
+
+    targets:dict[str, RunnerFactory] = {}
+    transcriber = conf.get("Transcriber", {})
+    for spec in transcriber.get("models") or [transcriber]:
+        model_name = spec.get("model_name", "nemo-parakeet-tdt-0.6b-v2")
+        quantization = spec.get("quantization", "int8")
+        targets[f"{model_name}:{quantization or 'fp32'}"] = asr_factory(model_name, quantization, audio, sample_rate)
+    if args.vad:
+        vad_audio = audio if sample_rate == 16_000 else np.zeros(10 * 16_000, dtype=np.float32)
+        targets["silero:fp32"] = vad_factory(vad_audio.astype(np.float32))
+    generator = conf.get("VoiceGenerator", {})
+    model_path = generator.get("model_path", "weights/kokoro-v1.0.onnx")
+    targets[f"kokoro:{os.path.basename(model_path)}"] = kokoro_factory(
+        model_path, generator.get("voice_path", "weights/voices-v1.0.bin"), generator.get("voice", "af_heart"), args.text
+    )
+
+    print(f"Autotuning on {host_id()}, providers {rt.get_available_providers()}")
+    for key, factory in targets.items():
+        best = autotune(key, factory, args.repeats)
+        if best["latency_ms"] == float("inf"):
+            print(f"{key}: no working configuration")
+            continue
+        save_config(key, best)
+        print(f"{key}: {best}")
+    print(f"Saved to {tuning_file()}")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,77 @@
+'''
+Build the word phoneme lexicon used by Kokoro in front of espeak.
+
+Words of the list (or of any text, one or more words per line) are phonemized by espeak
+in carrier phrases and stored with their phonemes, or as context-dependent when espeak
+pronounces them differently by their neighbours. Words already in the lexicon are kept.
+With --check, sentences are phonemized with and without the lexicon and the clauses
+served from it, mismatches and time per sentence are printed.
+
+Usage:
+    python -m nano_chan.tools.build_lexicon -w words.txt -o weights/lexicon --check sentences.txt
+'''
+import argparse
+import os
+import re
+from time import perf_counter
+
+from ..libs.kokoro_onnx.lexicon import HETERONYMS, PhonemeLexicon, carrier_lines, normalize_word, word_forms
+from ..libs.kokoro_onnx.tokenizer import Tokenizer, _espeak_phonemize
+
+
+def build(lexicon:PhonemeLexicon, words:list[str], lang:str, batch:int=500)->int:
+    '''phonemize new words in carrier phrases, return the number of words added'''
+    new = sorted({w for w in words if lexicon.get(normalize_word(w)) is None})
+    for i in range(0, len(new), batch):
+        chunk = new[i:i + batch]
+        forms = word_forms(chunk, _espeak_phonemize(carrier_lines(chunk), lang))
+        for word, phonemes in forms.items():
+            lexicon.learn(word, "" if word.lower() in HETERONYMS else phonemes)
+    return len(new)
+
+
+def check(sentences:list[str], lang:str, lexicon_dir:str)->None:
+    '''compare phonemes with the lexicon to espeak'''
+    plain = Tokenizer()
+    cached = Tokenizer(lexicon_dir=lexicon_dir)
+    start = perf_counter()
+    reference = [plain.phonemize(s, lang) for s in sentences]
+    espeak_ms = (perf_counter() - start) / len(sentences) * 1000
+    start = perf_counter()
+    phonemes = [cached.phonemize(s, lang) for s in sentences]
+    lexicon_ms = (perf_counter() - start) / len(sentences) * 1000
+    for sentence, ref, out in zip(sentences, reference, phonemes):
+        if ref != out:
+            print(f"Mismatch: {sentence}\n  espeak : {ref}\n  lexicon: {out}")
+    mismatches = sum(ref != out for ref, out in zip(reference, phonemes))
+    lexicon = cached.lexicons[lang]
+    print(f"{lexicon.format_stats()}, {mismatches} mismatches in {len(sentences)} sentences, "
+          f"{espeak_ms:.2f}ms -> {lexicon_ms:.2f}ms per sentence")
+
+
+def run():
+    parser = argparse.ArgumentParser(prog="build_lexicon", description="Word phoneme lexicon for Kokoro.")
+    parser.add_argument("-w", "--words", help="word list or text, words are extracted from each line")
+    parser.add_argument("-o", "--output", default="weights/lexicon", help="lexicon directory, <lang>.lex is written")
+    parser.add_argument("-l", "--lang", default="en-us")
+    parser.add_argument("--check", help="sentences, one per line, to compare with espeak")
+    args = parser.parse_args()
+
+    Tokenizer() # loads the espeak library
+    path = os.path.join(args.output, f"{args.lang}.lex")
+    if args.words:
+        lexicon = PhonemeLexicon(path, max_new=1 << 30)
+        with open(args.words, encoding="utf-8") as f:
+            words = re.findall(r"[A-Za-z]+(?:'[A-Za-z]+)?", f.read())
+        start = perf_counter()
+        added = build(lexicon, words, args.lang)
+        lexicon.save()
+        print(f"{added} words added in {perf_counter() - start:.1f}s, {len(lexicon)} words in {path}")
+    if args.check:
+        with open(args.check, encoding="utf-8") as f:
+            sentences = [line.strip() for line in f if line.strip()]
+        check(sentences, args.lang, args.output)
+
+
+if __name__ == "__main__":
+    run()
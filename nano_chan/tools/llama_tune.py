@@ -0,0 +1,170 @@
+'''
+Find the fastest llama.cpp runtime options of the LanguageProcessor model within a memory budget.
+
+Each candidate is loaded in a fresh process with the configured GGUF and context length.
+Prompt evaluation and generation throughput and memory (peak RSS and system memory in use,
+which includes GPU allocations on Jetson unified memory) are measured. The options are
+searched one at a time: threads, threads for prompt processing, batch size, flash attention,
+KV cache type and KV offload. A turn latency (prompt tokens at prompt speed plus answer tokens
+at generation speed) is the score. Among values within --tolerance of the fastest, the one using
+the least memory wins, so a quantized KV cache is chosen unless it is clearly slower.
+The best options are saved per model, context length and host to weights/llama_tuning.json
+(or LLAMA_TUNING_FILE). LanguageProcessor applies them automatically, options in the config win.
+
+Usage:
+    python -m nano_chan.tools.llama_tune [-c configs/config.yaml] [--n_context 6000] [--max_memory_mb 5000]
+'''
+import argparse
+import multiprocessing
+import os
+import resource
+from time import perf_counter
+
+import yaml
+
+from nano_chan.libs.ort_utils.tuning import host_id
+from nano_chan.src.llama_options import KV_CACHE_TYPES, save_tuned, tuning_file
+
+TEXT = ("User: Hi Nano-chan, I visited Kyoto last weekend and saw many old temples. "
+        "Nano-chan: That sounds wonderful! Which temple did you like the most, and why? ")
+
+
+def _used_memory_mb()->float:
+    '''MemTotal - MemAvailable'''
+    info = {}
+    with open("/proc/meminfo") as f:
+        for line in f:
+            key, value = line.split(":")
+            info[key] = int(value.split()[0])
+    return (info["MemTotal"] - info["MemAvailable"]) / 1024
+
+
+def _measure(model_path:str, n_ctx:int, options:dict, prompt_tokens:int, gen_tokens:int)->dict:
+    '''runs in a child process so that memory belongs to this candidate only'''
+    from llama_cpp import Llama
+    from nano_chan.src.llama_options import llama_options
+
+    before = _used_memory_mb()
+    llm = Llama(model_path=model_path, n_ctx=n_ctx, n_gpu_layers=-1, verbose=False,
+                **llama_options(model_path, n_ctx, options, tuned=False))
+    text_tokens = llm.tokenize(TEXT.encode("utf-8"), add_bos=False)
+    prompt = (text_tokens * (prompt_tokens // len(text_tokens) + 1))[:prompt_tokens]
+    llm.eval(prompt[:16]) # warm up
+    llm.reset()
+
+    start = perf_counter()
+    llm.eval(prompt)
+    prompt_sec = perf_counter() - start
+    start = perf_counter()
+    for _ in range(gen_tokens):
+        llm.eval([llm.sample(temp=0)])
+    gen_sec = perf_counter() - start
+    return {
+        "prompt_tokens_per_sec": prompt_tokens / prompt_sec,
+        "gen_tokens_per_sec": gen_tokens / gen_sec,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "memory_mb": _used_memory_mb() - before,
+    }
+
+
+def measure(model_path:str, n_ctx:int, options:dict, args:argparse.Namespace)->dict|None:
+    '''measurements and turn latency in ms, None if the options fail or exceed the memory budget'''
+    ctx = multiprocessing.get_context("spawn")
+    try:
+        with ctx.Pool(1) as pool:
+            result = pool.apply(_measure, (model_path, n_ctx, options, args.prompt_tokens, args.gen_tokens))
+    except Exception as e:
+        print(f"    {options} failed: {e}")
+        return None
+    result["turn_ms"] = (args.turn_prompt / result["prompt_tokens_per_sec"]
+                         + args.turn_tokens / result["gen_tokens_per_sec"]) * 1000
+    if args.max_memory_mb and result["memory_mb"] > args.max_memory_mb:
+        print(f"    {options} uses {result['memory_mb']:.0f}MB > {args.max_memory_mb}MB")
+        return None
+    return result
+
+
+def candidates(args:argparse.Namespace)->list[tuple[str, list]]:
+    '''values per option, searched in this order'''
+    cpus = os.cpu_count() or 1
+    threads = sorted({n for n in (1, 2, 4, 6, 8) if n < cpus} | {max(cpus // 2, 1), cpus})
+    return [
+        ("n_threads", threads),
+        ("n_threads_batch", threads),
+        ("n_batch", [128, 256, 512]),
+        ("flash_attn", [False, True]),
+        ("kv_cache", args.kv_types),
+        ("offload_kqv", [True, False]),
+    ]
+
+
+def _expand(options:dict)->dict:
+    '''kv_cache is a shortcut for the same type_k and type_v'''
+    options = dict(options)
+    kv = options.pop("kv_cache", "f16")
+    if kv != "f16":
+        options.update(type_k=kv, type_v=kv)
+    if "n_batch" in options:
+        options["n_ubatch"] = options["n_batch"]
+    return options
+
+
+def tune(model_path:str, n_ctx:int, args:argparse.Namespace)->dict:
+    '''coordinate search from the library defaults'''
+    current:dict = {}
+    best_result = None
+    for key, values in candidates(args):
+        results = {}
+        for value in values:
+            options = {**current, key: value}
+            if key == "kv_cache" and value not in ("f16", "f32") and not options.get("flash_attn"):
+                continue # quantized V cache needs flash attention
+            result = measure(model_path, n_ctx, _expand(options), args)
+            if result is None:
+                continue
+            results[value] = result
+            print(f"  {key}={value}: turn {result['turn_ms']:.0f}ms, prompt {result['prompt_tokens_per_sec']:.0f} "
+                  f"tokens/s, generation {result['gen_tokens_per_sec']:.1f} tokens/s, "
+                  f"memory {result['memory_mb']:.0f}MB", flush=True)
+        if not results:
+            continue
+        fastest = min(r["turn_ms"] for r in results.values())
+        near = {v: r for v, r in results.items() if r["turn_ms"] <= fastest * (1 + args.tolerance)}
+        choice = min(near, key=lambda v: (near[v]["memory_mb"], near[v]["turn_ms"]))
+        current[key] = choice
+        best_result = results[choice]
+    if best_result is None:
+        raise RuntimeError("No llama options worked, check the model path and memory budget")
+    return {**_expand(current), **{k: round(v, 1) for k, v in best_result.items()}}
+
+
+def run()->None:
+    parser = argparse.ArgumentParser(prog="llama_tune", description="Tune llama.cpp runtime options of the LLM.")
+    parser.add_argument("-c", "--config", default="configs/config.yaml")
+    parser.add_argument("--n_context", type=int, help="context length to tune for, n_context of the config by default")
+    parser.add_argument("--max_memory_mb", type=float, help="skip options using more memory")
+    parser.add_argument("--kv_types", nargs="+", default=["f16", "q8_0"], choices=list(KV_CACHE_TYPES),
+                        help="KV cache types to try, q4_0 saves more memory at some quality cost")
+    parser.add_argument("--tolerance", type=float, default=0.05,
+                        help="prefer less memory among options this much slower than the fastest")
+    parser.add_argument("--prompt_tokens", type=int, default=512, help="prompt length to measure prompt speed")
+    parser.add_argument("--gen_tokens", type=int, default=64, help="tokens to measure generation speed")
+    parser.add_argument("--turn_prompt", type=int, default=150, help="new prompt tokens of a typical turn")
+    parser.add_argument("--turn_tokens", type=int, default=60, help="answer tokens of a typical turn")
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as f:
+        conf = yaml.safe_load(f)["LanguageProcessor"]
+    model_path = conf.get("model_path", "weights/Qwen3-4B-Q3_K_M.gguf")
+    n_ctx = args.n_context or conf.get("n_context", 3200)
+
+    print(f"Tuning {model_path} with n_ctx={n_ctx} on {host_id()}")
+    best = tune(model_path, n_ctx, args)
+    save_tuned(model_path, n_ctx, best)
+    print(f"Best: {best}\nSaved to {tuning_file()}")
+    if n_ctx != conf.get("n_context", 3200):
+        print(f"Set n_context : {n_ctx} in the config to use them")
+
+
+if __name__ == "__main__":
+    run()
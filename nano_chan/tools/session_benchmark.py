@@ -0,0 +1,97 @@
+'''
+Benchmark the multi-session LLM engine as the number of concurrent sessions grows.
+
+For each session count, that many sessions run the same conversation turns at once
+through one MultiSessionEngine. Aggregate tokens/s over the round, and TTFT and time
+per token of each session, are printed as a Markdown table.
+
+Usage:
+    python -m nano_chan.tools.session_benchmark -s 1 2 4 -t 3
+'''
+import argparse
+from threading import Thread
+from time import perf_counter
+
+import yaml
+
+from ..src.multi_session import MultiSessionEngine
+
+PROMPTS = [
+    "Hi, I started learning English last month. /no_think",
+    "What is the difference between 'affect' and 'effect'? /no_think",
+    "Can you give me an example sentence with both words? /no_think",
+    "How can I practice speaking every day? /no_think",
+]
+
+
+def _run_session(engine:MultiSessionEngine, session_id:str, system_prompt:str, turns:int,
+                 max_tokens:int, result:dict)->None:
+    messages = [{"role": "system", "content": system_prompt}]
+    ttft, per_token, tokens = [], [], 0
+    for i in range(turns):
+        messages.append({"role": "user", "content": PROMPTS[i % len(PROMPTS)]})
+        start = perf_counter()
+        first = None
+        n = 0
+        text = ""
+        for chunk in engine.session(session_id).stream(messages, max_tokens=max_tokens,
+                                                       stop=["<|endoftext|>", "<|im_end|>"]):
+            if first is None:
+                first = perf_counter()
+            n += 1
+            text += chunk["choices"][0]["delta"].get("content", "")
+        if first is not None:
+            ttft.append(first - start)
+            if n > 1:
+                per_token.append((perf_counter() - first) / (n - 1))
+        tokens += n
+        messages.append({"role": "assistant", "content": text})
+    result.update(ttft=ttft, per_token=per_token, tokens=tokens)
+
+
+def benchmark(engine:MultiSessionEngine, system_prompt:str, sessions:int, turns:int, max_tokens:int)->dict:
+    '''run sessions concurrently, return aggregate tokens/s and mean latencies'''
+    results = [{} for _ in range(sessions)]
+    threads = [Thread(target=_run_session,
+                      args=(engine, f"bench{sessions}-{i}", system_prompt, turns, max_tokens, results[i]))
+               for i in range(sessions)]
+    start = perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = perf_counter() - start
+    ttft = [x for r in results for x in r["ttft"]]
+    per_token = [x for r in results for x in r["per_token"]]
+    return {
+        "sessions": sessions,
+        "tokens_per_sec": sum(r["tokens"] for r in results) / elapsed,
+        "ttft_ms": sum(ttft) / len(ttft) * 1000 if ttft else float("nan"),
+        "max_ttft_ms": max(ttft) * 1000 if ttft else float("nan"),
+        "ms_per_token": sum(per_token) / len(per_token) * 1000 if per_token else float("nan"),
+    }
+
+
+def run():
+    parser = argparse.ArgumentParser(prog="session_benchmark", description="Multi-session LLM throughput vs latency.")
+    parser.add_argument("-c", "--config", default="configs/config.yaml", help="model and system prompt are read from it")
+    parser.add_argument("-s", "--sessions", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("-t", "--turns", type=int, default=3, help="turns per session")
+    parser.add_argument("-m", "--max_tokens", type=int, default=128)
+    args = parser.parse_args()
+
+    with open(args.config, encoding="utf-8") as f:
+        conf = yaml.safe_load(f)["LanguageProcessor"]
+    engine = MultiSessionEngine(conf["system_prompt"], model_path=conf["model_path"],
+                                n_context=conf.get("n_context", 3200), n_slots=max(args.sessions), state_dir=None)
+    rows = [benchmark(engine, conf["system_prompt"], n, args.turns, args.max_tokens) for n in args.sessions]
+    print("| sessions | tokens/s (aggregate) | TTFT mean ms | TTFT max ms | ms/token |")
+    print("|---|---|---|---|---|")
+    for r in rows:
+        print(f"| {r['sessions']} | {r['tokens_per_sec']:.1f} | {r['ttft_ms']:.0f} | "
+              f"{r['max_ttft_ms']:.0f} | {r['ms_per_token']:.1f} |")
+    engine.close()
+
+
+if __name__ == "__main__":
+    run()
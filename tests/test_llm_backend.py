@@ -0,0 +1,93 @@
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from nano_chan.src.llm_backend import HttpLlmBackend, LlmBackendError
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    '''llama.cpp server like endpoints: streamed chat completions and /tokenize'''
+    protocol_version = "HTTP/1.1" # keep-alive
+
+    def log_message(self, *args):
+        pass
+
+    def _chunk(self, data:bytes)->None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        server = self.server
+        server.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if self.path == "/tokenize":
+            data = b"not json" if server.bad_tokenize else json.dumps({"tokens": body["content"].split()}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # role chunk first with null content, as llama.cpp server sends it
+        deltas = [{"role": "assistant", "content": None}, {"content": "Hi"}, {"content": " there"}]
+        for delta in deltas:
+            self._chunk(b": comment\n\ndata: " + json.dumps({"choices": [{"delta": delta}]}).encode() + b"\n\n")
+            if server.hold.is_set():
+                server.streaming.set()
+                server.release.wait(5)
+                return
+        self._chunk(b"data: [DONE]\n\n")
+        self._chunk(b"")
+
+
+class HttpLlmBackendTest(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        self.server.daemon_threads = True
+        self.server.connections = set()
+        self.server.bad_tokenize = False
+        self.server.hold = threading.Event()      # stop streaming after the first chunk
+        self.server.streaming = threading.Event() # a held stream is waiting
+        self.server.release = threading.Event()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.backend = HttpLlmBackend(f"http://127.0.0.1:{self.server.server_port}", timeout=5)
+
+    def tearDown(self):
+        self.server.release.set()
+        self.backend.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _text(self)->list:
+        return [c["choices"][0]["delta"]["content"] for c in self.backend.stream([{"role": "user", "content": "hi"}])]
+
+    def test_stream_parses_events_and_null_content(self):
+        self.assertEqual(self._text(), ["", "Hi", " there"])
+
+    def test_connection_is_reused(self):
+        self._text()
+        self._text()
+        self.assertEqual(self.backend.count_tokens("a b c"), 3)
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_cancel_stops_stream(self):
+        self.server.hold.set()
+        stream = self.backend.stream([{"role": "user", "content": "hi"}])
+        self.assertEqual(next(stream)["choices"][0]["delta"]["content"], "")
+        self.assertTrue(self.server.streaming.wait(5))
+        self.backend.cancel()
+        with self.assertRaisesRegex(LlmBackendError, "cancelled"):
+            list(stream)
+
+    def test_invalid_tokenize_response_is_estimated(self):
+        self.server.bad_tokenize = True
+        self.assertEqual(self.backend.count_tokens("abcdefgh"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
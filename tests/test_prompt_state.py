@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+
+# a small chat GGUF, e.g. weights/qwen2.5-0.5b-instruct-q4_k_m.gguf
+MODEL_PATH = os.environ.get("NANO_CHAN_TEST_GGUF", "")
+
+
+@unittest.skipUnless(importlib.util.find_spec("llama_cpp") and os.path.isfile(MODEL_PATH),
+                     "needs llama-cpp-python and a GGUF model in NANO_CHAN_TEST_GGUF")
+class PromptStateRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def _llm(self):
+        from llama_cpp import Llama
+        return Llama(model_path=MODEL_PATH, n_ctx=512, verbose=False)
+
+    def _text(self, prompt, content:str)->str:
+        messages = [{"role": "system", "content": "You are terse."}, {"role": "user", "content": content}]
+        return "".join(c["choices"][0]["delta"]["content"] for c in prompt.stream(messages, max_tokens=4, temperature=0))
+
+    def test_saved_state_is_loaded_by_new_model(self):
+        from nano_chan.src.prompt_state import PromptState
+        saved = PromptState(self._llm(), "You are terse.", self.dir.name)
+        expected = self._text(saved, "Say hi.")
+
+        llm = self._llm()
+        with self.assertLogs("nano_chan.src.prompt_state", "INFO") as logs:
+            loaded = PromptState(llm, "You are terse.", self.dir.name)
+        self.assertIn("state loaded", logs.output[0])
+        self.assertEqual(len(llm.input_ids), llm.n_ctx())
+        self.assertEqual(list(llm.input_ids[:llm.n_tokens]), loaded.prefix)
+        # first turn after the restart, then a turn diverging before the end of the prefix restores the state
+        self.assertEqual(self._text(loaded, "Say hi."), expected)
+        llm.reset()
+        self.assertEqual(self._text(loaded, "Say hi."), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()